@@ -4,8 +4,15 @@ from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from .models import (
     User,
     City,
+    CityAlias,
+    LatestObservation,
     WeatherData,
+    WeatherDataDaily,
+    WeatherDataHourly,
     WeatherForecast,
+    ForecastRun,
+    ForecastStep,
+    RefreshCycle,
     SearchHistory,
     UserFavoriteLocation,
 )
@@ -65,13 +72,21 @@ class WeatherForecastInline(admin.TabularInline):
 
 @admin.register(City)
 class CityAdmin(admin.ModelAdmin):
-    list_display = ("name", "country_code", "latitude", "longitude", "timezone_name")
+    list_display = ("name", "country_code", "latitude", "longitude", "timezone_name", "openweather_id")
     list_filter = ("country_code",)
-    search_fields = ("name", "country_code")
+    search_fields = ("name", "country_code", "=openweather_id")
     ordering = ("name", "country_code")
     inlines = [WeatherDataInline, WeatherForecastInline]
 
 
+@admin.register(CityAlias)
+class CityAliasAdmin(admin.ModelAdmin):
+    list_display = ("alias", "city", "created_at")
+    search_fields = ("alias", "city__name", "city__country_code")
+    ordering = ("alias",)
+    autocomplete_fields = ("city",)
+
+
 @admin.register(WeatherData)
 class WeatherDataAdmin(admin.ModelAdmin):
     list_display = (
@@ -90,6 +105,27 @@ class WeatherDataAdmin(admin.ModelAdmin):
     autocomplete_fields = ("city",)
 
 
+@admin.register(LatestObservation)
+class LatestObservationAdmin(admin.ModelAdmin):
+    list_display = ("city", "observed_at", "temperature_c", "humidity_pct", "source", "updated_at")
+    list_filter = ("source",)
+    search_fields = ("city__name", "city__country_code")
+    ordering = ("-observed_at",)
+    # Được ghi cùng WeatherData, không sửa tay
+    readonly_fields = (
+        "city", "observed_at", "temperature_c", "humidity_pct", "pressure_hpa", "wind_speed_ms",
+        "description", "icon_code", "source", "updated_at",
+    )
+
+
+@admin.register(WeatherDataHourly, WeatherDataDaily)
+class WeatherRollupAdmin(admin.ModelAdmin):
+    list_display = ("city", "bucket_start", "sample_count", "temp_min_c", "temp_avg_c", "temp_max_c", "humidity_avg_pct")
+    search_fields = ("city__name", "city__country_code")
+    ordering = ("-bucket_start",)
+    autocomplete_fields = ("city",)
+
+
 @admin.register(WeatherForecast)
 class WeatherForecastAdmin(admin.ModelAdmin):
     list_display = ("city", "forecast_time", "temp_min_c", "temp_max_c", "source")
@@ -100,6 +136,24 @@ class WeatherForecastAdmin(admin.ModelAdmin):
     autocomplete_fields = ("city",)
 
 
+@admin.register(ForecastRun)
+class ForecastRunAdmin(admin.ModelAdmin):
+    list_display = ("city", "fetched_at", "next_step_at", "source")
+    search_fields = ("city__name", "city__country_code")
+    ordering = ("-fetched_at",)
+    readonly_fields = ("city", "fetched_at", "next_step_at", "source")
+
+
+@admin.register(ForecastStep)
+class ForecastStepAdmin(admin.ModelAdmin):
+    list_display = ("city", "forecast_time", "temperature_c", "precipitation_probability_pct", "source")
+    list_filter = ("source",)
+    search_fields = ("city__name", "city__country_code", "description")
+    ordering = ("-forecast_time",)
+    date_hierarchy = "forecast_time"
+    autocomplete_fields = ("city",)
+
+
 @admin.register(SearchHistory)
 class SearchHistoryAdmin(admin.ModelAdmin):
     list_display = ("user", "query", "matched_city", "searched_at")
@@ -117,3 +171,19 @@ class UserFavoriteLocationAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "user__email", "city__name", "city__country_code")
     ordering = ("-added_at",)
     autocomplete_fields = ("user", "city")
+
+
+@admin.register(RefreshCycle)
+class RefreshCycleAdmin(admin.ModelAdmin):
+    list_display = (
+        "started_at",
+        "ranked",
+        "current_refreshed",
+        "forecast_refreshed",
+        "upstream_calls",
+        "deferred",
+        "failed",
+        "total_seconds",
+    )
+    ordering = ("-started_at",)
+    date_hierarchy = "started_at"
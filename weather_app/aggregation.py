@@ -0,0 +1,144 @@
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone, tzinfo
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+MAX_FORECAST_DAYS = 5
+
+
+def resolve_timezone(timezone_name: Optional[str], utc_offset_seconds: Optional[int] = None) -> tzinfo:
+    """Múi giờ để chia ngày: `City.timezone_name` nếu hợp lệ, nếu không thì độ lệch UTC OpenWeather trả về."""
+    if timezone_name:
+        try:
+            return ZoneInfo(timezone_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    if utc_offset_seconds is not None:
+        return dt_timezone(timedelta(seconds=int(utc_offset_seconds)))
+    return dt_timezone.utc
+
+
+def _utc_offsets(epochs: np.ndarray, tz: tzinfo) -> np.ndarray:
+    """Độ lệch UTC (giây) tại từng mốc; chỉ tính từng mốc khi chuỗi vắt qua chuyển giờ (DST)."""
+    first = datetime.fromtimestamp(int(epochs[0]), tz=dt_timezone.utc).astimezone(tz).utcoffset()
+    last = datetime.fromtimestamp(int(epochs[-1]), tz=dt_timezone.utc).astimezone(tz).utcoffset()
+    if first == last:
+        return np.full(len(epochs), int(first.total_seconds()), dtype=np.int64)
+    return np.array(
+        [int(datetime.fromtimestamp(int(e), tz=dt_timezone.utc).astimezone(tz).utcoffset().total_seconds()) for e in epochs],
+        dtype=np.int64,
+    )
+
+
+def _group_mode(group_ids: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """Giá trị xuất hiện nhiều nhất trong mỗi nhóm; hòa thì lấy giá trị xuất hiện sớm nhất."""
+    n_codes = int(codes.max()) + 1
+    pair_keys = group_ids * n_codes + codes
+    pairs, first_index, counts = np.unique(pair_keys, return_index=True, return_counts=True)
+    pair_groups = pairs // n_codes
+    order = np.lexsort((first_index, -counts, pair_groups))
+    ordered_groups = pair_groups[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = ordered_groups[1:] != ordered_groups[:-1]
+    modes = np.empty(n_groups, dtype=np.int64)
+    modes[ordered_groups[is_first]] = (pairs[order] % n_codes)[is_first]
+    return modes
+
+
+def daily_forecast_rows(series: Iterable[Tuple[Hashable, List[dict], tzinfo]]) -> Dict[Hashable, List[dict]]:
+    """Tổng hợp chuỗi dự báo 3h thô (`list` của `/forecast`) của nhiều City một lượt thành dự báo theo ngày địa phương.
+
+    `series`: các bộ (khóa, danh sách mốc thô của OpenWeather, múi giờ). Trả về {khóa: danh sách field WeatherForecast}
+    với nhiệt độ min/max, xác suất mưa trung bình và mô tả/icon phổ biến nhất của mỗi ngày (tối đa 5 ngày),
+    `forecast_time` là 12:00 UTC của ngày địa phương đó, giữ nguyên khóa (city, forecast_time) của dòng đã lưu.
+    Toàn bộ phép gom nhóm chạy trên mảng NumPy.
+    """
+    keys, zones, spans = [], [], []
+    rows = []
+    for key, items, tz in series:
+        if not items:
+            continue
+        i = len(keys)
+        keys.append(key)
+        zones.append(tz)
+        spans.append((len(rows), len(rows) + len(items)))
+        rows.extend(
+            (i, item['dt'], item['main']['temp'], item.get('pop', np.nan),
+             item['weather'][0]['description'] or '', item['weather'][0]['icon'] or '')
+            for item in items
+        )
+    if not keys:
+        return {}
+
+    columns = list(zip(*rows))
+    city_idx = np.array(columns[0], dtype=np.int64)
+    epochs = np.array(columns[1], dtype=np.int64)
+    offsets = np.empty_like(epochs)
+    offset_cache = {}
+    for (start, end), tz in zip(spans, zones):
+        # Nhiều City cùng múi giờ và cùng mốc đầu/cuối không vắt qua chuyển giờ: dùng lại độ lệch đã tính
+        span_key = (tz, int(epochs[start]), int(epochs[end - 1]))
+        offset = offset_cache.get(span_key)
+        if offset is not None:
+            offsets[start:end] = offset
+            continue
+        span_offsets = _utc_offsets(epochs[start:end], tz)
+        offsets[start:end] = span_offsets
+        if span_offsets[0] == span_offsets[-1]:
+            offset_cache[span_key] = span_offsets[0]
+    local_days = (epochs + offsets) // SECONDS_PER_DAY
+    temps = np.array(columns[2], dtype=np.float64)
+    pops = np.array([np.nan if p is None else p for p in columns[3]], dtype=np.float64)
+    description_values, description_codes = np.unique(np.array(columns[4], dtype=str), return_inverse=True)
+    icon_values, icon_codes = np.unique(np.array(columns[5], dtype=str), return_inverse=True)
+
+    # Sắp theo (City, thời điểm) để mỗi nhóm (City, ngày địa phương) liền nhau
+    order = np.lexsort((epochs, city_idx))
+    city_idx, local_days, temps, pops = city_idx[order], local_days[order], temps[order], pops[order]
+    description_codes, icon_codes = description_codes[order], icon_codes[order]
+
+    group_start = np.ones(len(order), dtype=bool)
+    group_start[1:] = (city_idx[1:] != city_idx[:-1]) | (local_days[1:] != local_days[:-1])
+    starts = np.flatnonzero(group_start)
+    group_ids = np.cumsum(group_start) - 1
+    n_groups = len(starts)
+
+    temp_min = np.minimum.reduceat(temps, starts)
+    temp_max = np.maximum.reduceat(temps, starts)
+    has_pop = ~np.isnan(pops)
+    pop_count = np.add.reduceat(has_pop.astype(np.int64), starts)
+    pop_sum = np.add.reduceat(np.where(has_pop, pops, 0.0), starts)
+    description_mode = _group_mode(group_ids, description_codes, n_groups)
+    icon_mode = _group_mode(group_ids, icon_codes, n_groups)
+
+    group_city = city_idx[starts]
+    group_day = local_days[starts]
+    city_start = np.ones(n_groups, dtype=bool)
+    city_start[1:] = group_city[1:] != group_city[:-1]
+    day_rank = np.arange(n_groups) - np.maximum.accumulate(np.where(city_start, np.arange(n_groups), 0))
+
+    # Chuyển về kiểu Python một lượt (tolist) thay vì ép từng phần tử NumPy trong vòng lặp
+    kept = np.flatnonzero(day_rank < MAX_FORECAST_DAYS)
+    pop_pct = np.where(pop_count > 0, np.round(100 * pop_sum / np.maximum(pop_count, 1)), -1).astype(np.int64)
+    descriptions = description_values[description_mode].tolist()
+    icons = icon_values[icon_mode].tolist()
+    result: Dict[Hashable, List[dict]] = {key: [] for key in keys}
+    epoch_date = date(1970, 1, 1)
+    noon = dt_time(hour=12, tzinfo=dt_timezone.utc)
+    for g, i, day, t_min, t_max, pop in zip(
+        kept.tolist(), group_city[kept].tolist(), group_day[kept].tolist(),
+        temp_min[kept].tolist(), temp_max[kept].tolist(), pop_pct[kept].tolist(),
+    ):
+        local_date = epoch_date + timedelta(days=day)
+        result[keys[i]].append({
+            'forecast_time': datetime.combine(local_date, noon),
+            'temp_min_c': t_min,
+            'temp_max_c': t_max,
+            'precipitation_probability_pct': pop if pop >= 0 else None,
+            'description': descriptions[g] or None,
+            'icon_code': icons[g] or None,
+            'source': 'openweather',
+        })
+    return result
@@ -0,0 +1,123 @@
+import logging
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .cache import MISSING, LRUCache
+from .models import City, CityAlias
+from .utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+ALIAS_MAX_LENGTH = CityAlias._meta.get_field('alias').max_length
+
+
+class CityAliasIndex:
+    """Chỉ mục trong bộ nhớ: chuỗi tìm kiếm đã chuẩn hóa -> `City`.
+
+    Bảng `CityAlias` là nơi lưu bền vững (chia sẻ giữa các worker); mỗi worker giữ một LRU có TTL
+    để phần lớn lượt tra cứu không chạm DB, và tự làm mới sau `ttl` giây.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize=maxsize)
+        self._warm_lock = threading.Lock()
+        self._warmed = False
+
+    def _keys_for(self, city: City, queries) -> set:
+        keys = {normalize_query(q) for q in queries}
+        keys.add(normalize_query(city.name))
+        keys.add(normalize_query(f"{city.name},{city.country_code}"))
+        return {k for k in keys if k and len(k) <= ALIAS_MAX_LENGTH}
+
+    def _warm_queryset(self):
+        return CityAlias.objects.select_related('city').order_by('-id')[:self.maxsize]
+
+    def _ensure_warm(self):
+        if self._warmed:
+            return
+        with self._warm_lock:
+            if not self._warmed:
+                for alias in self._warm_queryset():
+                    self._entries.set(alias.alias, alias.city, self.ttl)
+                self._warmed = True
+
+    def resolve(self, query: str) -> Optional[City]:
+        """Tìm `City` cho chuỗi tìm kiếm; `None` nếu chưa từng thấy chuỗi này."""
+        key = normalize_query(query)
+        if not key:
+            return None
+        self._ensure_warm()
+        city = self._entries.get(key)
+        if city is not MISSING:
+            return city
+
+        alias = CityAlias.objects.select_related('city').filter(alias=key).first()
+        if alias is None:
+            return None
+        self._entries.set(key, alias.city, self.ttl)
+        return alias.city
+
+    def learn(self, city: City, *queries: str):
+        """Ghi nhớ các chuỗi tìm kiếm (và tên của chính City) ánh xạ tới `city`."""
+        keys = self._keys_for(city, queries)
+        CityAlias.objects.bulk_create([CityAlias(alias=k, city=city) for k in keys], ignore_conflicts=True)
+        for key in keys:
+            self._entries.set(key, city, self.ttl)
+
+    def forget(self, city_id: int):
+        """Bỏ mọi alias trong bộ nhớ trỏ tới City đã bị xóa (dòng `CityAlias` bị xóa theo CASCADE)."""
+        self._entries.delete_values(lambda city: city is not None and city.pk == city_id)
+
+    async def aresolve(self, query: str) -> Optional[City]:
+        key = normalize_query(query)
+        if not key:
+            return None
+        if not self._warmed:
+            async for alias in self._warm_queryset():
+                self._entries.set(alias.alias, alias.city, self.ttl)
+            self._warmed = True
+        city = self._entries.get(key)
+        if city is not MISSING:
+            return city
+
+        alias = await CityAlias.objects.select_related('city').filter(alias=key).afirst()
+        if alias is None:
+            return None
+        self._entries.set(key, alias.city, self.ttl)
+        return alias.city
+
+    async def alearn(self, city: City, *queries: str):
+        keys = self._keys_for(city, queries)
+        await CityAlias.objects.abulk_create([CityAlias(alias=k, city=city) for k in keys], ignore_conflicts=True)
+        for key in keys:
+            self._entries.set(key, city, self.ttl)
+
+
+_alias_index: Optional[CityAliasIndex] = None
+_alias_index_lock = threading.Lock()
+
+
+def get_alias_index() -> CityAliasIndex:
+    """Trả về chỉ mục alias dùng chung của process."""
+    global _alias_index
+    if _alias_index is None:
+        with _alias_index_lock:
+            if _alias_index is None:
+                _alias_index = CityAliasIndex(
+                    maxsize=getattr(settings, 'WEATHER_ALIAS_INDEX_MAXSIZE', 10000),
+                    ttl=getattr(settings, 'WEATHER_ALIAS_INDEX_TTL', 3600),
+                )
+    return _alias_index
+
+
+@receiver(setting_changed)
+def _reset_alias_index_on_setting_change(sender, setting, **kwargs):
+    global _alias_index
+    if setting.startswith('WEATHER_ALIAS'):
+        _alias_index = None
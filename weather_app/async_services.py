@@ -0,0 +1,345 @@
+import asyncio
+import logging
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .aliases import get_alias_index
+from .cache import city_cache_key, get_weather_cache
+from .cities import get_city_cache
+from .history import get_history_buffer
+from .ingest import astore_forecasts, astore_observations
+from .models import City, ForecastStep, LatestObservation, WeatherData, WeatherForecast, SearchHistory
+from .services import WeatherService, WeatherTarget
+from .singleflight import get_async_single_flight
+from .upstream import UpstreamUnavailable, get_async_client
+from .utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWeatherService:
+    """Phiên bản async của `WeatherService` cho view chạy dưới ASGI.
+
+    Gọi API bằng client không chặn và ORM async, dùng chung phần parse/tổng hợp với `WeatherService`.
+    """
+
+    @staticmethod
+    async def _get_or_create_city(
+        name: str,
+        country_code: str,
+        latitude: float,
+        longitude: float,
+        timezone_name: Optional[str] = None,
+        openweather_id: Optional[int] = None,
+    ) -> City:
+        return await get_city_cache().aresolve(name, country_code, latitude, longitude, timezone_name, openweather_id)
+
+    @staticmethod
+    async def resolve_target(query: str) -> WeatherTarget:
+        city_obj = await get_alias_index().aresolve(query)
+        if city_obj is not None:
+            target = WeatherService.city_target(city_obj)
+            target.query = query
+            return target
+        return WeatherTarget(normalize_query(query), {'q': query}, None, query)
+
+    @staticmethod
+    async def coord_target(latitude: float, longitude: float) -> WeatherTarget:
+        # Chỉ mục không gian có thể cần nạp từ DB lần đầu, nên chạy ở thread sync
+        return await sync_to_async(WeatherService.coord_target)(latitude, longitude)
+
+    @staticmethod
+    async def resolve_city(query: str) -> Optional[City]:
+        return await get_alias_index().aresolve(query)
+
+    @staticmethod
+    async def _remember_city(target: WeatherTarget, city_obj: City, kind: str, payload, ttl: int):
+        if target.city is not None:
+            return
+        try:
+            await get_alias_index().alearn(city_obj, target.query)
+        except Exception:
+            logger.exception("Error saving city alias")
+        await get_weather_cache().aset(kind, city_cache_key(city_obj.pk), payload, ttl)
+
+    @staticmethod
+    async def get_current_weather(city):
+        """Lấy thời tiết hiện tại (đọc qua cache, chỉ gọi API khi miss)."""
+        return await AsyncWeatherService.get_current_weather_for(await AsyncWeatherService.resolve_target(city))
+
+    @staticmethod
+    async def get_current_weather_for(target: WeatherTarget):
+        cache = get_weather_cache()
+        key = target.key
+        cached = await cache.aget('current', key)
+        if cached is not None:
+            return cached
+
+        async def refresh():
+            data, ttl = await AsyncWeatherService._fetch_current_weather(target)
+            if data is not None:
+                await cache.aset('current', key, data, ttl)
+            return data
+
+        return await get_async_single_flight().do(
+            f"current:{key}", refresh, recheck=lambda: cache.apeek('current', key)
+        )
+
+    @staticmethod
+    async def _fetch_current_weather(target: WeatherTarget):
+        if target.city is not None:
+            stored = await sync_to_async(WeatherService._stored_current)(target.city)
+            if stored is not None:
+                return stored
+        try:
+            data = await AsyncWeatherService._request_json('weather', target.params)
+
+            if data is not None:
+                city_obj = target.city or await AsyncWeatherService._get_or_create_city(
+                    **WeatherService._current_city_fields(data)
+                )
+                payload, ttl = await AsyncWeatherService._store_current_weather(data, city_obj=city_obj)
+                await AsyncWeatherService._remember_city(target, city_obj, 'current', payload, ttl)
+                return payload, ttl
+            else:
+                return None, 0
+        except UpstreamUnavailable:
+            stale = await AsyncWeatherService._last_known_current(target.city)
+            if stale is None:
+                raise
+            return stale, 0
+        except Exception:
+            logger.exception("Error fetching weather data")
+            return None, 0
+
+    @staticmethod
+    async def _last_known_current(city_obj: Optional[City]):
+        if city_obj is None:
+            return None
+        record = await LatestObservation.objects.filter(city=city_obj).afirst()
+        if record is None:
+            return None
+        return WeatherService._stale_current_payload(city_obj, record)
+
+    @staticmethod
+    async def _last_known_forecast(city_obj: Optional[City]) -> list:
+        if city_obj is None:
+            return []
+        records = [r async for r in WeatherService._last_known_forecasts_queryset(city_obj)]
+        return WeatherService._stale_forecast_payload(city_obj, records)
+
+    @staticmethod
+    async def _store_current_weather(data: dict, city_obj: Optional[City] = None):
+        city_fields, weather_record_fields = WeatherService._parse_current_weather(data)
+        if city_obj is None:
+            city_obj = await AsyncWeatherService._get_or_create_city(**city_fields)
+        await astore_observations([WeatherData(city=city_obj, **weather_record_fields)])
+        return WeatherService._current_weather_payload(city_obj, weather_record_fields)
+
+    @staticmethod
+    async def get_weather_forecast(city: str):
+        """Lấy dự báo thời tiết theo ngày (đọc qua cache, chỉ gọi API khi miss)."""
+        return await AsyncWeatherService.get_weather_forecast_for(await AsyncWeatherService.resolve_target(city))
+
+    @staticmethod
+    async def get_weather_forecast_for(target: WeatherTarget):
+        cache = get_weather_cache()
+        key = target.key
+        cached = await cache.aget('forecast', key)
+        if cached is not None:
+            return cached
+
+        async def refresh():
+            items, ttl = await AsyncWeatherService._fetch_weather_forecast(target)
+            if items:
+                await cache.aset('forecast', key, items, ttl)
+            return items
+
+        return await get_async_single_flight().do(
+            f"forecast:{key}", refresh, recheck=lambda: cache.apeek('forecast', key)
+        )
+
+    @staticmethod
+    async def _fetch_weather_forecast(target: WeatherTarget):
+        if target.city is not None:
+            stored = await sync_to_async(WeatherService._stored_forecast)(target.city)
+            if stored is not None:
+                return stored
+        try:
+            data = await AsyncWeatherService._request_json('forecast', target.params)
+
+            if data is not None:
+                city_obj = target.city or await AsyncWeatherService._get_or_create_city(
+                    **WeatherService._forecast_city_fields(data)
+                )
+                items, ttl = await AsyncWeatherService._store_weather_forecast(data, city_obj=city_obj)
+                await AsyncWeatherService._remember_city(target, city_obj, 'forecast', items, ttl)
+                return items, ttl
+            else:
+                return [], 0
+        except UpstreamUnavailable:
+            stale = await AsyncWeatherService._last_known_forecast(target.city)
+            if not stale:
+                raise
+            return stale, 0
+        except Exception:
+            logger.exception("Error fetching forecast data")
+            return [], 0
+
+    @staticmethod
+    async def _store_weather_forecast(data: dict, city_obj: Optional[City] = None):
+        if city_obj is None:
+            city_obj = await AsyncWeatherService._get_or_create_city(**WeatherService._forecast_city_fields(data))
+        _, steps, forecast_rows, next_step_at = WeatherService._aggregate_forecast(data, city_obj)
+        await astore_forecasts(
+            [WeatherForecast(city=city_obj, **row) for row in forecast_rows],
+            steps=[ForecastStep(city=city_obj, **step) for step in steps],
+        )
+        hourly, ttl = WeatherService._hourly_payload(city_obj, steps)
+        await get_weather_cache().aset('hourly', city_cache_key(city_obj.pk), hourly, ttl)
+        return WeatherService._forecast_payload(city_obj, forecast_rows, next_step_at)
+
+    @staticmethod
+    async def get_hourly_forecast(city: str):
+        """Dự báo theo mốc 3h (5 ngày) cho chuỗi tìm kiếm."""
+        return await AsyncWeatherService.get_hourly_forecast_for(await AsyncWeatherService.resolve_target(city))
+
+    @staticmethod
+    async def _stored_hourly(city_obj: City):
+        steps = [WeatherService._step_fields(r) async for r in WeatherService._stored_steps_queryset(city_obj)]
+        return WeatherService._hourly_payload(city_obj, steps)
+
+    @staticmethod
+    async def get_hourly_forecast_for(target: WeatherTarget):
+        cache = get_weather_cache()
+        key = target.key
+        cached = await cache.aget('hourly', key)
+        if cached is not None:
+            return cached
+
+        if target.city is not None:
+            hourly, ttl = await AsyncWeatherService._stored_hourly(target.city)
+            if hourly:
+                await cache.aset('hourly', key, hourly, ttl)
+                return hourly
+
+        async def refresh():
+            await AsyncWeatherService.get_weather_forecast_for(target)
+            city_obj = target.city or (await AsyncWeatherService.resolve_city(target.query) if target.query else None)
+            if city_obj is None:
+                return []
+            hourly, ttl = await AsyncWeatherService._stored_hourly(city_obj)
+            if hourly:
+                await cache.aset('hourly', key, hourly, ttl)
+            return hourly
+
+        return await get_async_single_flight().do(
+            f"hourly:{key}", refresh, recheck=lambda: cache.apeek('hourly', key)
+        )
+
+    @staticmethod
+    async def get_weather_overview(city: str):
+        """Thời tiết hiện tại + dự báo; hai lời gọi API chạy đồng thời bằng `asyncio.gather`."""
+        target = await AsyncWeatherService.resolve_target(city)
+        cache = get_weather_cache()
+        current = await cache.aget('current', target.key)
+        forecasts = await cache.aget('forecast', target.key)
+        if current is not None and forecasts is not None:
+            return {'current': current, 'forecasts': forecasts}
+
+        overview = await get_async_single_flight().do(
+            f"overview:{target.key}",
+            lambda: AsyncWeatherService._refresh_overview(target, current, forecasts),
+        )
+        return {
+            'current': current if current is not None else overview['current'],
+            'forecasts': forecasts if forecasts is not None else overview['forecasts'],
+        }
+
+    @staticmethod
+    async def _request_json(endpoint: str, params: dict) -> Optional[dict]:
+        cache = get_weather_cache()
+        missing_key = WeatherService._missing_key(params)
+        if missing_key and await cache.apeek('notfound', missing_key):
+            return None
+        response = await get_async_client().get(endpoint, params)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404 and missing_key:
+            await cache.aset('notfound', missing_key, True, settings.WEATHER_NEGATIVE_CACHE_TTL)
+        return None
+
+    @staticmethod
+    async def _request_json_or_none(endpoint: str, params: dict) -> Optional[dict]:
+        try:
+            return await AsyncWeatherService._request_json(endpoint, params)
+        except UpstreamUnavailable:
+            return None
+        except Exception:
+            logger.exception("Error fetching %s data", endpoint)
+            return None
+
+    @staticmethod
+    async def _refresh_overview(target: WeatherTarget, current, forecasts):
+        cache = get_weather_cache()
+        # Phần đã có bản còn mới trong DB thì không gọi API
+        if target.city is not None:
+            if current is None:
+                stored = await sync_to_async(WeatherService._stored_current)(target.city)
+                if stored is not None:
+                    current, ttl = stored
+                    await cache.aset('current', target.key, current, ttl)
+            if forecasts is None:
+                stored = await sync_to_async(WeatherService._stored_forecast)(target.city)
+                if stored is not None:
+                    forecasts, ttl = stored
+                    await cache.aset('forecast', target.key, forecasts, ttl)
+
+        async def skip():
+            return None
+
+        current_data, forecast_data = await asyncio.gather(
+            AsyncWeatherService._request_json_or_none('weather', target.params) if current is None else skip(),
+            AsyncWeatherService._request_json_or_none('forecast', target.params) if forecasts is None else skip(),
+        )
+
+        try:
+            city_obj = target.city
+            if current_data:
+                if city_obj is None:
+                    city_obj = await AsyncWeatherService._get_or_create_city(
+                        **WeatherService._current_city_fields(current_data)
+                    )
+                current, ttl = await AsyncWeatherService._store_current_weather(current_data, city_obj=city_obj)
+                await cache.aset('current', target.key, current, ttl)
+                await AsyncWeatherService._remember_city(target, city_obj, 'current', current, ttl)
+            if forecast_data:
+                if city_obj is None:
+                    city_obj = await AsyncWeatherService._get_or_create_city(
+                        **WeatherService._forecast_city_fields(forecast_data)
+                    )
+                forecasts, ttl = await AsyncWeatherService._store_weather_forecast(forecast_data, city_obj=city_obj)
+                await cache.aset('forecast', target.key, forecasts, ttl)
+                await AsyncWeatherService._remember_city(target, city_obj, 'forecast', forecasts, ttl)
+        except Exception:
+            logger.exception("Error storing weather overview")
+
+        if current is None:
+            current = await AsyncWeatherService._last_known_current(target.city)
+        if forecasts is None:
+            forecasts = await AsyncWeatherService._last_known_forecast(target.city)
+        return {'current': current, 'forecasts': forecasts or []}
+
+    @staticmethod
+    async def save_search_history(user, query: str, matched_city: Optional[City] = None):
+        get_history_buffer().record(user, query, matched_city)
+
+    @staticmethod
+    async def get_user_search_history(user, limit=10):
+        """Lấy lịch sử tìm kiếm của user (kèm `matched_city` để không truy vấn lười trong context async)."""
+        if user.is_authenticated:
+            queryset = SearchHistory.objects.filter(user=user).select_related('matched_city')[:limit]
+            return get_history_buffer().merge_pending(user.pk, [h async for h in queryset], limit)
+        return []
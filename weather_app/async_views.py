@@ -0,0 +1,134 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from .async_services import AsyncWeatherService
+from .upstream import UpstreamUnavailable
+from .views import _parse_coordinates, _unavailable
+
+# View async tương đương `views.py`, bật bằng WEATHER_ASYNC_VIEWS khi chạy dưới ASGI.
+
+@require_GET
+async def current_weather(request):
+    try:
+        coords = _parse_coordinates(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+    if coords is not None:
+        target = await AsyncWeatherService.coord_target(*coords)
+        try:
+            data = await AsyncWeatherService.get_current_weather_for(target)
+        except UpstreamUnavailable:
+            return _unavailable()
+        if data is None:
+            return JsonResponse({'error': 'Weather not found'}, status=404)
+        user = await request.auser()
+        if user.is_authenticated:
+            await AsyncWeatherService.save_search_history(user, query='%s,%s' % coords, matched_city=target.city)
+        return JsonResponse(data)
+
+    city = request.GET.get('city', '').strip()
+    if not city:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+
+    try:
+        data = await AsyncWeatherService.get_current_weather(city)
+    except UpstreamUnavailable:
+        return _unavailable()
+    if data is None:
+        return JsonResponse({'error': 'Weather not found'}, status=404)
+    user = await request.auser()
+    if user.is_authenticated:
+        await AsyncWeatherService.save_search_history(
+            user, query=city, matched_city=await AsyncWeatherService.resolve_city(city)
+        )
+    return JsonResponse(data)
+
+@require_GET
+async def weather_forecast(request):
+    try:
+        coords = _parse_coordinates(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+    if coords is not None:
+        target = await AsyncWeatherService.coord_target(*coords)
+        try:
+            items = await AsyncWeatherService.get_weather_forecast_for(target)
+        except UpstreamUnavailable:
+            return _unavailable()
+        user = await request.auser()
+        if items and user.is_authenticated:
+            await AsyncWeatherService.save_search_history(user, query='%s,%s' % coords, matched_city=target.city)
+        return JsonResponse({'forecasts': items})
+
+    city = request.GET.get('city', '').strip()
+    if not city:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+
+    try:
+        items = await AsyncWeatherService.get_weather_forecast(city)
+    except UpstreamUnavailable:
+        return _unavailable()
+    user = await request.auser()
+    if items and user.is_authenticated:
+        await AsyncWeatherService.save_search_history(
+            user, query=city, matched_city=await AsyncWeatherService.resolve_city(city)
+        )
+    return JsonResponse({'forecasts': items})
+
+@require_GET
+async def weather_hourly(request):
+    try:
+        coords = _parse_coordinates(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+    city = request.GET.get('city', '').strip()
+    if coords is None and not city:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+
+    if coords is not None:
+        target = await AsyncWeatherService.coord_target(*coords)
+    else:
+        target = await AsyncWeatherService.resolve_target(city)
+    try:
+        steps = await AsyncWeatherService.get_hourly_forecast_for(target)
+    except UpstreamUnavailable:
+        return _unavailable()
+    return JsonResponse({'steps': steps})
+
+@require_GET
+async def weather_overview(request):
+    city = request.GET.get('city', '').strip()
+    if not city:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+
+    data = await AsyncWeatherService.get_weather_overview(city)
+    if data['current'] is None and not data['forecasts']:
+        return JsonResponse({'error': 'Weather not found'}, status=404)
+    user = await request.auser()
+    if user.is_authenticated:
+        await AsyncWeatherService.save_search_history(
+            user, query=city, matched_city=await AsyncWeatherService.resolve_city(city)
+        )
+    return JsonResponse(data)
+
+@require_GET
+async def search_history(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        limit = int(request.GET.get('limit', '10'))
+    except ValueError:
+        limit = 10
+    limit = max(1, min(limit, 50))
+
+    histories = await AsyncWeatherService.get_user_search_history(user, limit=limit)
+    payload = []
+    for h in histories:
+        matched = f"{h.matched_city.name}, {h.matched_city.country_code}" if h.matched_city else None
+        payload.append({
+            'query': h.query,
+            'matched_city': matched,
+            'searched_at': h.searched_at.isoformat(),
+        })
+    return JsonResponse({'history': payload})
@@ -0,0 +1,249 @@
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cities import CityLookup
+from .ingest import update_latest_observations
+from .models import WeatherData
+from .push import RowError, validate_observation
+
+logger = logging.getLogger(__name__)
+
+# Quan trắc nhập từ file được ghi với nguồn này nếu dòng không có `source`
+IMPORT_SOURCE = 'import'
+
+# Cột của file nhập (CSV có dòng tiêu đề, hoặc mỗi dòng một object JSON)
+# City: `city_id`, hoặc `openweather_id`, hoặc `city` + `country_code`
+# Quan trắc: `observed_at` (ISO 8601, không có múi giờ thì hiểu là UTC, hoặc Unix epoch),
+# `temperature_c`, `humidity_pct`, `pressure_hpa`, `wind_speed_ms`, và tùy chọn `description`, `icon_code`, `source`
+
+
+@dataclass
+class ImportStats:
+    """Kết quả nhập một file."""
+
+    path: str = ''
+    rows: int = 0
+    # Dòng hợp lệ / dòng thực sự được thêm (dòng trùng (city, observed_at) đã có không được ghi đè)
+    valid: int = 0
+    written: int = 0
+    unknown_city: int = 0
+    invalid: int = 0
+    seconds: float = 0.0
+    resumed_from: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _is_jsonl(path: str) -> bool:
+    return path.endswith(('.jsonl', '.ndjson'))
+
+
+def _read_lines(handle, offset: int, position: list) -> Iterator[str]:
+    """Các dòng (đã giải mã) từ byte `offset`; `position[0]` luôn là byte ngay sau dòng cuối đã trả ra."""
+    handle.seek(offset)
+    position[0] = offset
+    for line in handle:
+        position[0] += len(line)
+        yield line.decode('utf-8-sig')
+
+
+def iter_rows(path: str, offset: int = 0) -> Iterator[Tuple[dict, int]]:
+    """Các dòng của file nhập kèm byte ngay sau dòng đó (để ghi checkpoint), bắt đầu từ `offset`.
+
+    Dòng JSON không đọc được được trả về là `None`.
+    """
+    with open(path, 'rb') as handle:
+        position = [0]
+        if _is_jsonl(path):
+            for line in _read_lines(handle, offset, position):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    yield row, position[0]
+            return
+
+        header = next(csv.reader([handle.readline().decode('utf-8-sig')]), None)
+        if not header:
+            return
+        offset = max(offset, handle.tell())
+        # csv.reader chỉ đọc thêm dòng khi cần, nên sau mỗi bản ghi `position` đúng bằng cuối bản ghi đó
+        for values in csv.reader(_read_lines(handle, offset, position)):
+            if values:
+                yield dict(zip(header, values)), position[0]
+
+
+class Checkpoint:
+    """Tiến độ nhập của một file (byte đã ghi xong), lưu thành JSON trong `directory`.
+
+    Checkpoint bị bỏ qua nếu file đã đổi kích thước hoặc thời điểm sửa kể từ lần chạy trước.
+    """
+
+    def __init__(self, directory: Optional[str], path: str):
+        self.path = None
+        stat = os.stat(path)
+        self.fingerprint = {'file': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+        self.offset = 0
+        self.done = False
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            name = hashlib.sha1(self.fingerprint['file'].encode()).hexdigest()
+            self.path = os.path.join(directory, f'{name}.json')
+            try:
+                with open(self.path) as handle:
+                    saved = json.load(handle)
+            except (OSError, ValueError):
+                saved = None
+            if saved and all(saved.get(k) == v for k, v in self.fingerprint.items()):
+                self.offset = saved['offset']
+                self.done = saved['done']
+
+    def save(self, offset: int, done: bool = False):
+        self.offset = offset
+        self.done = done
+        if self.path is None:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as handle:
+            json.dump({**self.fingerprint, 'offset': offset, 'done': done}, handle)
+        os.replace(tmp_path, self.path)
+
+
+def _insert_new(batch: list, batch_size: int) -> int:
+    """Ghi các quan trắc chưa có (city, observed_at) trong DB cùng LatestObservation của chúng; trả về số dòng mới.
+
+    Dòng đã có được giữ nguyên và không được dùng để cập nhật LatestObservation, nên LatestObservation luôn
+    khớp với dòng WeatherData thực sự được lưu. `ignore_conflicts` vẫn giữ an toàn khi một lần ghi khác
+    chen vào giữa bước đọc và bước ghi.
+    """
+    keys = {(record.city_id, record.observed_at): record for record in batch}
+    moments = defaultdict(list)
+    for city_id, observed_at in keys:
+        moments[city_id].append(observed_at)
+    # Chỉ đọc đúng các khóa của lô (tra theo index (city, observed_at)), không quét cả lịch sử giữa hai mốc
+    condition = Q()
+    for city_id, observed in moments.items():
+        condition |= Q(city_id=city_id, observed_at__in=observed)
+    using = router.db_for_write(WeatherData)
+    with transaction.atomic(using=using):
+        existing = set(WeatherData.objects.using(using).filter(condition).values_list('city_id', 'observed_at'))
+        fresh = [record for key, record in keys.items() if key not in existing]
+        WeatherData.objects.bulk_create(fresh, batch_size=batch_size, ignore_conflicts=True)
+        update_latest_observations(fresh, using=using)
+    return len(fresh)
+
+
+def import_file(path: str, batch_size: int = 2000, checkpoint_dir: Optional[str] = None, lookup: Optional[CityLookup] = None) -> ImportStats:
+    """Nhập một file vào WeatherData theo lô, bỏ qua các quan trắc (city, observed_at) đã có.
+
+    Mỗi dòng được kiểm tra như dữ liệu đẩy lên từ trạm (`push.validate_observation`); dòng sai kiểu,
+    ngoài khoảng hoặc quá dài bị đếm là không hợp lệ thay vì được ghi. Sau mỗi lô đã ghi, vị trí trong
+    file được lưu vào checkpoint để lần chạy sau tiếp tục từ đó.
+    """
+    stats = ImportStats(path=path)
+    checkpoint = Checkpoint(checkpoint_dir, path)
+    stats.resumed_from = checkpoint.offset
+    if checkpoint.done:
+        return stats
+    lookup = lookup or CityLookup()
+    started = time.monotonic()
+    now = timezone.now()
+
+    batch = []
+    position = checkpoint.offset
+
+    def flush():
+        if batch:
+            stats.valid += len(batch)
+            stats.written += _insert_new(batch, batch_size)
+            batch.clear()
+        checkpoint.save(position)
+
+    for row, position in iter_rows(path, checkpoint.offset):
+        stats.rows += 1
+        if not isinstance(row, dict):
+            stats.invalid += 1
+            continue
+        try:
+            city_id = lookup.resolve(row)
+        except (AttributeError, TypeError, ValueError):
+            stats.invalid += 1
+            continue
+        if city_id is None:
+            stats.unknown_city += 1
+            continue
+        try:
+            batch.append(validate_observation(row, city_id, now, IMPORT_SOURCE))
+        except RowError:
+            stats.invalid += 1
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    checkpoint.save(position, done=True)
+    stats.seconds = time.monotonic() - started
+    return stats
+
+
+def _init_worker():
+    # Với start method "spawn", process con phải tự khởi tạo Django
+    import django
+
+    django.setup()
+
+
+def _import_in_worker(path: str, batch_size: int, checkpoint_dir: Optional[str]) -> dict:
+    try:
+        return asdict(import_file(path, batch_size, checkpoint_dir))
+    finally:
+        close_old_connections()
+
+
+def import_files(
+    paths: List[str],
+    batch_size: int = 2000,
+    checkpoint_dir: Optional[str] = None,
+    workers: int = 1,
+    on_file_done: Optional[Callable[[ImportStats], None]] = None,
+) -> List[ImportStats]:
+    """Nhập nhiều file; `workers > 1` thì mỗi file chạy trong một process riêng (tối đa `workers` process cùng lúc)."""
+    results = []
+
+    def done(stats: ImportStats):
+        results.append(stats)
+        if on_file_done is not None:
+            on_file_done(stats)
+
+    if workers <= 1 or len(paths) <= 1:
+        lookup = CityLookup()
+        for path in paths:
+            done(import_file(path, batch_size, checkpoint_dir, lookup=lookup))
+        return results
+
+    # Process con không được dùng chung kết nối DB đã mở của process cha
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(paths)),
+        mp_context=multiprocessing.get_context(),
+        initializer=_init_worker,
+    ) as pool:
+        futures = [pool.submit(_import_in_worker, path, batch_size, checkpoint_dir) for path in paths]
+        for future in as_completed(futures):
+            done(ImportStats(**future.result()))
+    return results
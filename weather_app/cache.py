@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LRUCache:
+    """Cache LRU trong process, có TTL theo từng entry và giới hạn số phần tử."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_values(self, predicate) -> int:
+        """Xóa mọi entry có giá trị thỏa `predicate` (duyệt toàn bộ cache); trả về số entry bị xóa."""
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class WeatherCache:
+    """Cache read-through 2 tầng cho payload thời tiết.
+
+    - Tầng 1: LRU trong process (nhanh nhất, riêng từng worker).
+    - Tầng 2 (tùy chọn): cache framework của Django (`WEATHER_CACHE_ALIAS`), chia sẻ giữa các worker.
+    """
+
+    def __init__(self, maxsize: int = 1024, alias: Optional[str] = None, key_prefix: str = 'weather'):
+        self.local = LRUCache(maxsize=maxsize)
+        self.alias = alias or None
+        self.key_prefix = key_prefix
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.sets = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def _shared_key(self, kind: str, key: str) -> str:
+        # Băm khóa để an toàn với memcached (không dấu cách / unicode)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return f"{self.key_prefix}:{kind}:{digest}"
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, kind: str, key: str) -> Any:
+        """Trả về giá trị đã cache hoặc `None` nếu miss."""
+        value, tier = self._lookup(kind, key)
+        self._count(f"{tier}_hits" if tier else 'misses')
+        return value
+
+    def peek(self, kind: str, key: str) -> Any:
+        """Như `get` nhưng không tính vào bộ đếm hit/miss (dùng khi đọc lại trong lúc chờ)."""
+        return self._lookup(kind, key)[0]
+
+    def _lookup(self, kind: str, key: str):
+        value = self.local.get((kind, key))
+        if value is not MISSING:
+            return value, 'local'
+
+        shared = self.shared
+        if shared is not None:
+            try:
+                entry = shared.get(self._shared_key(kind, key))
+            except Exception:
+                logger.exception("Shared weather cache get failed")
+                entry = None
+            value = self._promote(kind, key, entry)
+            if value is not None:
+                return value, 'shared'
+
+        return None, None
+
+    def _promote(self, kind: str, key: str, entry) -> Any:
+        """Đưa entry còn hạn từ tầng chia sẻ lên LRU local (giữ nguyên thời điểm hết hạn)."""
+        if entry is None:
+            return None
+        value, expires_at = entry
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return None
+        self.local.set((kind, key), value, remaining)
+        return value
+
+    def set(self, kind: str, key: str, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self.local.set((kind, key), value, ttl)
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.set(self._shared_key(kind, key), (value, time.time() + ttl), timeout=int(ttl) + 1)
+            except Exception:
+                logger.exception("Shared weather cache set failed")
+        self._count('sets')
+
+    async def aget(self, kind: str, key: str) -> Any:
+        """Phiên bản async của `get`: tầng chia sẻ đọc qua API async của Django cache."""
+        value, tier = await self._alookup(kind, key)
+        self._count(f"{tier}_hits" if tier else 'misses')
+        return value
+
+    async def apeek(self, kind: str, key: str) -> Any:
+        return (await self._alookup(kind, key))[0]
+
+    async def _alookup(self, kind: str, key: str):
+        value = self.local.get((kind, key))
+        if value is not MISSING:
+            return value, 'local'
+
+        shared = self.shared
+        if shared is not None:
+            try:
+                entry = await shared.aget(self._shared_key(kind, key))
+            except Exception:
+                logger.exception("Shared weather cache get failed")
+                entry = None
+            value = self._promote(kind, key, entry)
+            if value is not None:
+                return value, 'shared'
+
+        return None, None
+
+    async def aset(self, kind: str, key: str, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self.local.set((kind, key), value, ttl)
+        shared = self.shared
+        if shared is not None:
+            try:
+                await shared.aset(self._shared_key(kind, key), (value, time.time() + ttl), timeout=int(ttl) + 1)
+            except Exception:
+                logger.exception("Shared weather cache set failed")
+        self._count('sets')
+
+    def delete(self, kind: str, key: str):
+        self.local.delete((kind, key))
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.delete(self._shared_key(kind, key))
+            except Exception:
+                logger.exception("Shared weather cache delete failed")
+
+    def stats(self) -> dict:
+        hits = self.local_hits + self.shared_hits
+        lookups = hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'sets': self.sets,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'local_size': len(self.local),
+            'local_maxsize': self.local.maxsize,
+            'local_evictions': self.local.evictions,
+            'shared_alias': self.alias,
+        }
+
+
+def _clamp_ttl(seconds: float) -> int:
+    min_ttl = getattr(settings, 'WEATHER_CACHE_MIN_TTL', 60)
+    return int(max(min_ttl, seconds))
+
+
+def current_weather_ttl(observed_at: datetime) -> int:
+    """TTL cho thời tiết hiện tại: tới lúc OpenWeather có bản quan trắc mới (`observed_at` + chu kỳ cập nhật)."""
+    refresh = getattr(settings, 'WEATHER_CACHE_CURRENT_REFRESH', 600)
+    age = (datetime.now(tz=dt_timezone.utc) - observed_at).total_seconds()
+    return _clamp_ttl(min(refresh, refresh - age))
+
+
+def current_weather_is_fresh(observed_at: datetime) -> bool:
+    """Quan trắc chưa quá một chu kỳ cập nhật của OpenWeather (gọi lại API cũng chưa có bản mới hơn)."""
+    refresh = getattr(settings, 'WEATHER_CACHE_CURRENT_REFRESH', 600)
+    return (datetime.now(tz=dt_timezone.utc) - observed_at).total_seconds() < refresh
+
+
+def stored_forecast_ttl(fetched_at: datetime, next_step_at: Optional[datetime]) -> Optional[int]:
+    """TTL cho dự báo đọc lại từ DB: tới khi lần lấy quá `WEATHER_FORECAST_FRESHNESS_SECONDS` hoặc tới mốc 3h
+    kế tiếp (sớm hơn); None nếu dự báo đã cũ và phải lấy lại từ API."""
+    now = datetime.now(tz=dt_timezone.utc)
+    remaining = getattr(settings, 'WEATHER_FORECAST_FRESHNESS_SECONDS', 1800) - (now - fetched_at).total_seconds()
+    if next_step_at is not None:
+        remaining = min(remaining, (next_step_at - now).total_seconds())
+    if remaining <= 0:
+        return None
+    return max(1, int(remaining))
+
+
+def forecast_ttl(next_step_at: Optional[datetime]) -> int:
+    """TTL cho dự báo: tới mốc 3h kế tiếp trong chuỗi dự báo (khi đó API sẽ dịch chuỗi đi)."""
+    max_ttl = getattr(settings, 'WEATHER_CACHE_FORECAST_MAX_TTL', 3 * 3600)
+    if next_step_at is None:
+        return _clamp_ttl(0)
+    remaining = (next_step_at - datetime.now(tz=dt_timezone.utc)).total_seconds()
+    return _clamp_ttl(min(max_ttl, remaining))
+
+
+def city_cache_key(city_id) -> str:
+    """Khóa cache theo `City`: mọi chuỗi tìm kiếm trỏ tới cùng City dùng chung một entry."""
+    return f"city:{city_id}"
+
+
+_weather_cache: Optional[WeatherCache] = None
+_weather_cache_lock = threading.Lock()
+
+
+def get_weather_cache() -> WeatherCache:
+    """Trả về cache dùng chung của process."""
+    global _weather_cache
+    if _weather_cache is None:
+        with _weather_cache_lock:
+            if _weather_cache is None:
+                _weather_cache = WeatherCache(
+                    maxsize=getattr(settings, 'WEATHER_CACHE_MAXSIZE', 1024),
+                    alias=getattr(settings, 'WEATHER_CACHE_ALIAS', None),
+                )
+    return _weather_cache
+
+
+def reset_weather_cache():
+    global _weather_cache
+    with _weather_cache_lock:
+        _weather_cache = None
+
+
+@receiver(setting_changed)
+def _reset_cache_on_setting_change(sender, setting, **kwargs):
+    if setting.startswith('WEATHER_CACHE'):
+        reset_weather_cache()
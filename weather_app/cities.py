@@ -0,0 +1,247 @@
+import logging
+import threading
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError
+from django.db.models import Q
+from django.dispatch import receiver
+
+from .cache import MISSING, LRUCache
+from .models import City, CityAlias
+from .utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+_LATITUDE_FIELD = City._meta.get_field('latitude')
+_LONGITUDE_FIELD = City._meta.get_field('longitude')
+
+
+def _quantize(field, value) -> Decimal:
+    """Làm tròn tọa độ đúng như khi lưu vào cột Decimal để float của API và Decimal trong DB cho cùng một khóa."""
+    return field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def identity_key(name: str, country_code: str, latitude, longitude) -> tuple:
+    """Khóa nhận diện City theo ràng buộc `unique_city`."""
+    return (name, country_code, _quantize(_LATITUDE_FIELD, latitude), _quantize(_LONGITUDE_FIELD, longitude))
+
+
+class CityIdentityCache:
+    """Cache trong process: (name, country_code, lat, lon) và OpenWeather city id -> `City`.
+
+    Gần như mọi payload API đều thuộc một City đã có trong DB, nên phần lớn lần nhận diện City
+    không cần truy vấn. Nạp sẵn `maxsize` City mới nhất ở lần dùng đầu; City được lưu/xóa
+    trong worker này (kể cả từ admin) cập nhật cache qua signal, thay đổi từ worker khác
+    được thấy sau tối đa `ttl` giây.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize=maxsize * 2)
+        self._keys_by_pk: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._warmed = False
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_keys(self, city: City) -> tuple:
+        keys = (('key', identity_key(city.name, city.country_code, city.latitude, city.longitude)),)
+        if city.openweather_id is not None:
+            keys += (('owm', city.openweather_id),)
+        return keys
+
+    def remember(self, city: City):
+        keys = self._cache_keys(city)
+        with self._lock:
+            for old_key in self._keys_by_pk.pop(city.pk, ()):
+                if old_key not in keys:
+                    self._entries.delete(old_key)
+            for key in keys:
+                self._entries.set(key, city, self.ttl)
+            self._keys_by_pk[city.pk] = keys
+
+    def forget(self, city_id: int):
+        with self._lock:
+            for key in self._keys_by_pk.pop(city_id, ()):
+                self._entries.delete(key)
+
+    def _ensure_warm(self):
+        if self._warmed:
+            return
+        with self._warm_lock:
+            if not self._warmed:
+                for city in City.objects.order_by('-updated_at')[:self.maxsize]:
+                    self.remember(city)
+                self._warmed = True
+
+    def lookup(self, name: str, country_code: str, latitude, longitude, openweather_id: Optional[int] = None):
+        """Tra cache (không chạm DB); trả `MISSING` nếu chưa có, hoặc nếu City chưa được gắn `openweather_id`."""
+        city = MISSING
+        if openweather_id is not None:
+            city = self._entries.get(('owm', openweather_id))
+        if city is MISSING:
+            city = self._entries.get(('key', identity_key(name, country_code, latitude, longitude)))
+            if city is not MISSING and openweather_id is not None and city.openweather_id is None:
+                city = MISSING
+        if city is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return city
+
+    def _load_or_create(self, name, country_code, latitude, longitude, timezone_name=None, openweather_id=None) -> City:
+        if openweather_id is not None:
+            city = City.objects.filter(openweather_id=openweather_id).first()
+            if city is not None:
+                return city
+        try:
+            city, created = City.objects.get_or_create(
+                name=name,
+                country_code=country_code,
+                latitude=latitude,
+                longitude=longitude,
+                defaults={"timezone_name": timezone_name, "openweather_id": openweather_id},
+            )
+        except IntegrityError:
+            # Worker khác vừa tạo City cùng OpenWeather id (với tọa độ khác)
+            if openweather_id is None:
+                raise
+            return City.objects.get(openweather_id=openweather_id)
+        if not created and openweather_id is not None and city.openweather_id is None:
+            try:
+                City.objects.filter(pk=city.pk, openweather_id__isnull=True).update(openweather_id=openweather_id)
+                city.openweather_id = openweather_id
+            except IntegrityError:
+                logger.warning("OpenWeather id %s already belongs to another City", openweather_id)
+        return city
+
+    def resolve(
+        self,
+        name: str,
+        country_code: str,
+        latitude,
+        longitude,
+        timezone_name: Optional[str] = None,
+        openweather_id: Optional[int] = None,
+    ) -> City:
+        """Lấy hoặc tạo `City` từ dữ liệu API, ưu tiên cache rồi mới tới DB."""
+        self._ensure_warm()
+        city = self.lookup(name, country_code, latitude, longitude, openweather_id)
+        if city is MISSING:
+            city = self._load_or_create(name, country_code, latitude, longitude, timezone_name, openweather_id)
+            self.remember(city)
+        return city
+
+    async def aresolve(
+        self,
+        name: str,
+        country_code: str,
+        latitude,
+        longitude,
+        timezone_name: Optional[str] = None,
+        openweather_id: Optional[int] = None,
+    ) -> City:
+        if not self._warmed:
+            await sync_to_async(self._ensure_warm)()
+        city = self.lookup(name, country_code, latitude, longitude, openweather_id)
+        if city is MISSING:
+            city = await sync_to_async(self._load_or_create)(
+                name, country_code, latitude, longitude, timezone_name, openweather_id
+            )
+            self.remember(city)
+        return city
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class CityLookup:
+    """Chỉ mục City trong bộ nhớ (id, OpenWeather id, tên + quốc gia) để không truy vấn DB cho từng dòng.
+
+    Tên được so khớp theo khóa `normalize_query` (không phân biệt dấu, hoa thường), kể cả qua các
+    `CityAlias` đã học. Mặc định nạp mọi City; `for_rows` chỉ nạp các City mà một lô dòng tham chiếu tới.
+    """
+
+    def __init__(self, queryset=None, aliases=None):
+        self.ids = set()
+        self.by_openweather_id: Dict[int, int] = {}
+        self.by_name: Dict[Tuple[str, str], int] = {}
+        queryset = City.objects.all() if queryset is None else queryset
+        aliases = CityAlias.objects.all() if aliases is None else aliases
+        countries: Dict[int, str] = {}
+        for city_id, openweather_id, name, country_code in queryset.values_list(
+            'id', 'openweather_id', 'name', 'country_code'
+        ).iterator(chunk_size=5000):
+            self.ids.add(city_id)
+            countries[city_id] = country_code.upper()
+            if openweather_id is not None:
+                self.by_openweather_id[openweather_id] = city_id
+            self.by_name.setdefault((normalize_query(name), countries[city_id]), city_id)
+        # Alias chỉ bổ sung: tên chính thức của City luôn được ưu tiên
+        for alias, city_id in aliases.values_list('alias', 'city_id').iterator(chunk_size=5000):
+            if city_id in countries:
+                self.by_name.setdefault((alias, countries[city_id]), city_id)
+
+    @classmethod
+    def for_rows(cls, rows: Iterable) -> 'CityLookup':
+        """Chỉ mục chỉ gồm các City được `rows` tham chiếu, nạp bằng hai truy vấn."""
+        ids, openweather_ids, names = set(), set(), set()
+        for row in rows:
+            if not isinstance(row, dict):
+                continue
+            try:
+                if row.get('city_id') not in (None, ''):
+                    ids.add(int(row['city_id']))
+                elif row.get('openweather_id') not in (None, ''):
+                    openweather_ids.add(int(row['openweather_id']))
+                elif row.get('city'):
+                    names.add(str(row['city']).strip())
+            except (TypeError, ValueError):
+                continue
+        keys = {normalize_query(name) for name in names} - {''}
+        aliases = CityAlias.objects.filter(alias__in=keys)
+        condition = Q(pk__in=ids) | Q(openweather_id__in=openweather_ids) | Q(aliases__alias__in=keys)
+        # City chưa có alias nào (tạo từ admin hoặc từ file nhập) vẫn được tìm theo tên gốc
+        for name in names:
+            condition |= Q(name__iexact=name)
+        return cls(City.objects.filter(condition).distinct(), aliases)
+
+    def resolve(self, row: dict) -> Optional[int]:
+        if row.get('city_id') not in (None, ''):
+            city_id = int(row['city_id'])
+            return city_id if city_id in self.ids else None
+        if row.get('openweather_id') not in (None, ''):
+            return self.by_openweather_id.get(int(row['openweather_id']))
+        if row.get('city') and row.get('country_code'):
+            return self.by_name.get((normalize_query(row['city']), row['country_code'].strip().upper()))
+        return None
+
+
+_city_cache: Optional[CityIdentityCache] = None
+_city_cache_lock = threading.Lock()
+
+
+def get_city_cache() -> CityIdentityCache:
+    """Trả về cache nhận diện City dùng chung của process."""
+    global _city_cache
+    if _city_cache is None:
+        with _city_cache_lock:
+            if _city_cache is None:
+                _city_cache = CityIdentityCache(
+                    maxsize=getattr(settings, 'WEATHER_CITY_CACHE_MAXSIZE', 10000),
+                    ttl=getattr(settings, 'WEATHER_CITY_CACHE_TTL', 3600),
+                )
+    return _city_cache
+
+
+@receiver(setting_changed)
+def _reset_city_cache_on_setting_change(sender, setting, **kwargs):
+    global _city_cache
+    if setting.startswith('WEATHER_CITY_CACHE'):
+        _city_cache = None
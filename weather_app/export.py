@@ -0,0 +1,251 @@
+import csv
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterator, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.db import connections, models, router
+
+from .models import WeatherData, WeatherForecast
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+PARQUET = 'parquet'
+FORMATS = (CSV, NDJSON, PARQUET)
+
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson',
+    PARQUET: 'application/vnd.apache.parquet',
+}
+
+
+@dataclass(frozen=True)
+class ExportDataset:
+    model: type
+    time_field: str
+    columns: List[str]
+
+
+DATASETS = {
+    'observations': ExportDataset(
+        WeatherData,
+        'observed_at',
+        [
+            'id', 'city_id', 'city__name', 'city__country_code', 'observed_at', 'temperature_c', 'humidity_pct',
+            'pressure_hpa', 'wind_speed_ms', 'description', 'icon_code', 'source',
+        ],
+    ),
+    'forecasts': ExportDataset(
+        WeatherForecast,
+        'forecast_time',
+        [
+            'id', 'city_id', 'city__name', 'city__country_code', 'forecast_time', 'temp_min_c', 'temp_max_c',
+            'precipitation_probability_pct', 'description', 'icon_code', 'source', 'created_at',
+        ],
+    ),
+}
+
+
+class ExportUnavailable(Exception):
+    """Định dạng xuất cần thư viện chưa được cài (Parquet cần `pyarrow`)."""
+
+
+def _header(column: str) -> str:
+    return column.replace('__', '_')
+
+
+def export_queryset(
+    dataset: str,
+    city_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """Queryset của dataset, lọc theo City và khoảng thời gian [start, end)."""
+    spec = DATASETS[dataset]
+    queryset = spec.model.objects.all()
+    if city_id is not None:
+        queryset = queryset.filter(city_id=city_id)
+    if start is not None:
+        queryset = queryset.filter(**{f'{spec.time_field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{spec.time_field}__lt': end})
+    return queryset
+
+
+def iter_row_chunks(queryset, columns: List[str], chunk_size: int = 2000) -> Iterator[list]:
+    """Đọc `columns` của queryset thành từng lô tối đa `chunk_size` tuple, bộ nhớ không phụ thuộc số dòng.
+
+    PostgreSQL có server-side cursor thật nên dùng thẳng `.iterator(chunk_size=...)`. Driver MySQL/SQLite
+    nạp toàn bộ kết quả của một câu truy vấn vào bộ nhớ, nên ở đó mỗi lô là một câu truy vấn keyset
+    theo khóa chính (`pk > lô trước ORDER BY pk LIMIT chunk_size`).
+    """
+    queryset = queryset.order_by('pk')
+    connection = connections[router.db_for_read(queryset.model)]
+    if connection.vendor == 'postgresql':
+        chunk = []
+        for row in queryset.values_list(*columns).iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+
+    rows = queryset.values_list('pk', *columns)
+    last_pk = None
+    while True:
+        page = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1][0]
+        yield [row[1:] for row in chunk]
+        if len(chunk) < chunk_size:
+            return
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunks(chunks, columns) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([_header(c) for c in columns])
+    for chunk in chunks:
+        writer.writerows([_plain(v) for v in row] for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _ndjson_chunks(chunks, columns) -> Iterator[bytes]:
+    headers = [_header(c) for c in columns]
+    for chunk in chunks:
+        lines = (json.dumps(dict(zip(headers, map(_plain, row))), ensure_ascii=False) for row in chunk)
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """File chỉ-ghi giữ các byte Parquet vừa được ghi cho tới khi được lấy ra để stream."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_type(pa, field):
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp('us', tz='UTC')
+    if isinstance(field, (models.DecimalField, models.FloatField)):
+        return pa.float64()
+    if isinstance(field, (models.IntegerField, models.AutoField, models.ForeignKey)):
+        return pa.int64()
+    return pa.string()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ExportUnavailable("Parquet export requires pyarrow") from exc
+    return pyarrow, pyarrow.parquet
+
+
+def _parquet_chunks(chunks, columns, model, pa, pq) -> Iterator[bytes]:
+    headers = [_header(c) for c in columns]
+    fields = []
+    for column, header in zip(columns, headers):
+        *relations, name = column.split('__')
+        target = model
+        for relation in relations:
+            target = target._meta.get_field(relation).related_model
+        fields.append(pa.field(header, _arrow_type(pa, target._meta.get_field(name))))
+    schema = pa.schema(fields)
+
+    sink = _ChunkSink()
+    # Mỗi lô là một row group; phần footer được ghi khi đóng writer
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            arrays = [
+                pa.array([float(v) if isinstance(v, Decimal) else v for v in values], type=field.type)
+                for values, field in zip(zip(*chunk), schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def stream_export(
+    dataset: str,
+    fmt: str,
+    city_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chunk_size: int = 2000,
+) -> Iterator[bytes]:
+    """Các khối byte của bản xuất `dataset` ở định dạng `fmt` (csv, ndjson, parquet).
+
+    `ValueError` nếu dataset/định dạng không hợp lệ, `ExportUnavailable` nếu thiếu thư viện cho định dạng.
+    """
+    if dataset not in DATASETS:
+        raise ValueError('dataset')
+    if fmt not in FORMATS:
+        raise ValueError('format')
+    spec = DATASETS[dataset]
+    # Kiểm tra thư viện trước khi bắt đầu stream để lỗi được trả về thành response bình thường
+    arrow = _import_pyarrow() if fmt == PARQUET else None
+
+    chunks = iter_row_chunks(export_queryset(dataset, city_id, start, end), spec.columns, chunk_size)
+    if fmt == CSV:
+        return _csv_chunks(chunks, spec.columns)
+    if fmt == NDJSON:
+        return _ndjson_chunks(chunks, spec.columns)
+    return _parquet_chunks(chunks, spec.columns, spec.model, *arrow)
+
+
+async def aiter_chunks(chunks: Iterator[bytes]):
+    """Bọc iterator đồng bộ cho `StreamingHttpResponse` dưới ASGI.
+
+    Với iterator đồng bộ, Django dưới ASGI đọc hết nội dung vào bộ nhớ trước khi gửi; ở đây mỗi khối
+    được lấy trong thread đồng bộ (giữ nguyên kết nối DB) rồi gửi ngay.
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
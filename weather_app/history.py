@@ -0,0 +1,212 @@
+import atexit
+import logging
+import os
+import threading
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import MISSING, LRUCache
+from .models import City, SearchHistory
+from .utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHistoryBuffer:
+    """Ghi `SearchHistory` kiểu write-behind: request chỉ thêm sự kiện vào bộ nhớ, không chạm DB.
+
+    - Một thread nền ghi các sự kiện đang chờ bằng `bulk_create` khi đủ `flush_size` sự kiện
+      hoặc sau `flush_interval` giây, và ghi nốt khi process tắt (`atexit`).
+    - Cùng một user tìm lại đúng chuỗi vừa tìm (trong `coalesce_seconds`) thì gộp vào sự kiện trước.
+    - Sau mỗi lần ghi, mỗi user chỉ giữ `max_per_user` dòng mới nhất.
+    - Hàng đợi giữ tối đa `max_pending` sự kiện; khi DB chậm/lỗi, sự kiện cũ nhất bị bỏ.
+    """
+
+    def __init__(
+        self,
+        flush_size: int = 100,
+        flush_interval: float = 5,
+        coalesce_seconds: float = 300,
+        max_per_user: int = 200,
+        max_pending: int = 10000,
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.coalesce_seconds = coalesce_seconds
+        self.max_per_user = max_per_user
+        self.max_pending = max_pending
+        self._pending: List[SearchHistory] = []
+        self._inflight: List[SearchHistory] = []  # lô đang được `flush` ghi, vẫn hiển thị cho tới khi ghi xong
+        self._last = LRUCache(maxsize=max_pending)  # user_id -> ((khóa tìm kiếm, city_id), sự kiện)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self.recorded = 0
+        self.coalesced = 0
+        self.written = 0
+        self.trimmed = 0
+        self.dropped = 0
+
+    def record(self, user, query: str, matched_city: Optional[City] = None):
+        """Thêm một lượt tìm kiếm của user đã đăng nhập vào hàng đợi (không chặn, không truy vấn DB)."""
+        if not (user and getattr(user, "is_authenticated", False)):
+            return
+        key = (normalize_query(query), matched_city.pk if matched_city else None)
+        now = timezone.now()
+        with self._lock:
+            last = self._last.get(user.pk)
+            if last is not MISSING and last[0] == key:
+                # Tìm lại đúng chuỗi vừa tìm: cập nhật thời điểm nếu sự kiện chưa được ghi, ngược lại bỏ qua
+                if last[1]._state.adding:
+                    last[1].searched_at = now
+                self.coalesced += 1
+                return
+            event = SearchHistory(user_id=user.pk, query=query, matched_city=matched_city, searched_at=now)
+            self._pending.append(event)
+            self._last.set(user.pk, (key, event), self.coalesce_seconds)
+            self.recorded += 1
+            if len(self._pending) > self.max_pending:
+                overflow = len(self._pending) - self.max_pending
+                del self._pending[:overflow]
+                self.dropped += overflow
+            full = len(self._pending) >= self.flush_size
+        self._ensure_worker()
+        if full:
+            self._wakeup.set()
+
+    def pending_for(self, user_id: int) -> List[SearchHistory]:
+        """Các sự kiện chưa ghi của user (mới nhất trước) để trang lịch sử hiển thị ngay."""
+        with self._lock:
+            events = [event for event in (*self._inflight, *self._pending) if event.user_id == user_id]
+        return sorted(events, key=lambda event: event.searched_at, reverse=True)
+
+    def merge_pending(self, user_id: int, stored: list, limit: int) -> list:
+        """Ghép sự kiện chưa ghi với các dòng đã lưu, mới nhất trước, tối đa `limit` dòng."""
+        stored = list(stored)
+        # Lô đang ghi có thể đã commit trước khi `stored` được đọc: bỏ các sự kiện đã có trong `stored`
+        seen = {(row.query, row.matched_city_id, row.searched_at) for row in stored}
+        pending = [
+            event for event in self.pending_for(user_id)
+            if (event.query, event.matched_city_id, event.searched_at) not in seen
+        ]
+        if not pending:
+            return stored[:limit]
+        merged = sorted([*pending, *stored], key=lambda event: event.searched_at, reverse=True)
+        return merged[:limit]
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='weather-history-writer', daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self) -> int:
+        """Ghi toàn bộ sự kiện đang chờ; trả về số dòng đã ghi."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._inflight = batch
+            if not batch:
+                return 0
+            try:
+                SearchHistory.objects.bulk_create(batch, batch_size=500)
+            except Exception:
+                logger.exception("Failed to write %d search history rows", len(batch))
+                with self._lock:
+                    self._inflight = []
+                    self.dropped += len(batch)
+                return 0
+            with self._lock:
+                self._inflight = []
+            self.written += len(batch)
+            self._trim({event.user_id for event in batch})
+            return len(batch)
+
+    def _trim(self, user_ids):
+        """Xóa các dòng cũ vượt quá `max_per_user` của những user vừa được ghi thêm."""
+        if not self.max_per_user:
+            return
+        for user_id in user_ids:
+            try:
+                stale = list(
+                    SearchHistory.objects.filter(user_id=user_id)
+                    .order_by('-searched_at', '-id')
+                    .values_list('id', flat=True)[self.max_per_user:]
+                )
+                if stale:
+                    self.trimmed += SearchHistory.objects.filter(id__in=stale).delete()[0]
+            except Exception:
+                logger.exception("Failed to trim search history of user %s", user_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+            in_flight = len(self._inflight)
+        return {
+            'pending': pending,
+            'in_flight': in_flight,
+            'recorded': self.recorded,
+            'coalesced': self.coalesced,
+            'written': self.written,
+            'trimmed': self.trimmed,
+            'dropped': self.dropped,
+        }
+
+
+_history_buffer: Optional[SearchHistoryBuffer] = None
+_history_buffer_lock = threading.Lock()
+
+
+def get_history_buffer() -> SearchHistoryBuffer:
+    """Trả về bộ đệm lịch sử tìm kiếm dùng chung của process."""
+    global _history_buffer
+    if _history_buffer is None:
+        with _history_buffer_lock:
+            if _history_buffer is None:
+                _history_buffer = SearchHistoryBuffer(
+                    flush_size=getattr(settings, 'WEATHER_HISTORY_FLUSH_SIZE', 100),
+                    flush_interval=getattr(settings, 'WEATHER_HISTORY_FLUSH_INTERVAL', 5),
+                    coalesce_seconds=getattr(settings, 'WEATHER_HISTORY_COALESCE_SECONDS', 300),
+                    max_per_user=getattr(settings, 'WEATHER_HISTORY_MAX_PER_USER', 200),
+                    max_pending=getattr(settings, 'WEATHER_HISTORY_MAX_PENDING', 10000),
+                )
+    return _history_buffer
+
+
+@atexit.register
+def flush_history_buffer():
+    """Ghi nốt các sự kiện đang chờ khi process tắt."""
+    if _history_buffer is not None:
+        try:
+            _history_buffer.flush()
+        except Exception:
+            logger.exception("Failed to flush search history on shutdown")
+
+
+@receiver(setting_changed)
+def _reset_history_buffer_on_setting_change(sender, setting, **kwargs):
+    global _history_buffer
+    if setting.startswith('WEATHER_HISTORY'):
+        flush_history_buffer()
+        _history_buffer = None
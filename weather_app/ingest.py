@@ -0,0 +1,305 @@
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from asgiref.sync import sync_to_async
+from django.db import connections, router, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import MISSING, LRUCache
+from .models import ForecastRun, ForecastStep, LatestObservation, WeatherData, WeatherForecast
+
+logger = logging.getLogger(__name__)
+
+
+# Field của WeatherData được ghi đè khi cùng (city, observed_at) đã tồn tại
+WEATHER_DATA_UPDATE_FIELDS = [
+    'temperature_c', 'humidity_pct', 'pressure_hpa', 'wind_speed_ms', 'description', 'icon_code', 'source',
+]
+
+# Field của LatestObservation được ghi đè khi City có quan trắc mới hơn
+LATEST_OBSERVATION_UPDATE_FIELDS = ['observed_at', *WEATHER_DATA_UPDATE_FIELDS, 'updated_at']
+
+# Field của WeatherForecast được ghi đè khi cùng (city, forecast_time) đã tồn tại
+WEATHER_FORECAST_UPDATE_FIELDS = [
+    'temp_min_c', 'temp_max_c', 'precipitation_probability_pct', 'description', 'icon_code', 'source', 'fetched_at',
+]
+
+# Field của ForecastStep được ghi đè khi cùng (city, forecast_time) đã tồn tại
+FORECAST_STEP_UPDATE_FIELDS = [
+    'temperature_c', 'humidity_pct', 'precipitation_probability_pct', 'wind_speed_ms',
+    'description', 'icon_code', 'source', 'fetched_at',
+]
+
+# Field của ForecastRun được ghi đè ở mỗi lần lấy dự báo
+FORECAST_RUN_UPDATE_FIELDS = ['fetched_at', 'next_step_at', 'source']
+
+
+@dataclass
+class IngestResult:
+    """Số dòng được thêm mới / cập nhật bởi một lần ghi."""
+
+    inserted: int = 0
+    updated: int = 0
+
+    def __add__(self, other: 'IngestResult') -> 'IngestResult':
+        return IngestResult(self.inserted + other.inserted, self.updated + other.updated)
+
+
+def _upsert_args(model, objs: Iterable, unique_fields: List[str], update_fields: List[str]):
+    attnames = [model._meta.get_field(name).attname for name in unique_fields]
+    deduped = {}
+    for obj in objs:
+        deduped[tuple(getattr(obj, attname) for attname in attnames)] = obj
+
+    options = {'update_conflicts': True, 'update_fields': update_fields}
+    # MySQL (ON DUPLICATE KEY UPDATE) không nhận danh sách cột xung đột
+    if connections[router.db_for_write(model)].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = unique_fields
+    return list(deduped.values()), options
+
+
+def bulk_upsert(model, objs: Iterable, unique_fields: List[str], update_fields: List[str], batch_size=None):
+    """Ghi nhiều object bằng một câu INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE.
+
+    Các object trùng khóa `unique_fields` trong cùng lô được gộp lại (giữ bản sau cùng),
+    vì Postgres không cho một câu upsert cập nhật cùng một dòng hai lần.
+    """
+    objs, options = _upsert_args(model, objs, unique_fields, update_fields)
+    if not objs:
+        return []
+    return model.objects.bulk_create(objs, batch_size=batch_size, **options)
+
+
+async def abulk_upsert(model, objs: Iterable, unique_fields: List[str], update_fields: List[str], batch_size=None):
+    objs, options = _upsert_args(model, objs, unique_fields, update_fields)
+    if not objs:
+        return []
+    return await model.objects.abulk_create(objs, batch_size=batch_size, **options)
+
+
+class ObservationIndex:
+    """Thời điểm quan trắc (`observed_at`) mới nhất đã ghi cho mỗi City trong process này.
+
+    OpenWeather thường trả lại cùng một quan trắc (`dt`) trong nhiều phút; tra chỉ mục này
+    cho phép bỏ qua hoàn toàn lần ghi DB khi dữ liệu chưa đổi.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 6 * 3600):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize=maxsize)
+        self.skipped = 0
+        self.written = 0
+
+    def is_stored(self, city_id: int, observed_at: datetime) -> bool:
+        return self._entries.get(city_id) == observed_at
+
+    def mark(self, city_id: int, observed_at: datetime):
+        last = self._entries.get(city_id)
+        if last is MISSING or observed_at >= last:
+            self._entries.set(city_id, observed_at, self.ttl)
+
+    def new_records(self, records: Iterable) -> list:
+        """Lọc các WeatherData chưa được ghi (theo `city_id`, `observed_at`)."""
+        fresh = []
+        for record in records:
+            if self.is_stored(record.city_id, record.observed_at):
+                self.skipped += 1
+            else:
+                fresh.append(record)
+        return fresh
+
+    def mark_written(self, records: Iterable):
+        for record in records:
+            self.mark(record.city_id, record.observed_at)
+            self.written += 1
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'written': self.written, 'skipped': self.skipped}
+
+
+_observation_index: Optional[ObservationIndex] = None
+_observation_index_lock = threading.Lock()
+
+
+def get_observation_index() -> ObservationIndex:
+    """Trả về chỉ mục quan trắc đã ghi dùng chung của process."""
+    global _observation_index
+    if _observation_index is None:
+        with _observation_index_lock:
+            if _observation_index is None:
+                _observation_index = ObservationIndex(
+                    maxsize=getattr(settings, 'WEATHER_OBSERVATION_INDEX_MAXSIZE', 10000),
+                )
+    return _observation_index
+
+
+def update_latest_observations(records: Iterable, using: Optional[str] = None) -> int:
+    """Cập nhật LatestObservation từ các WeatherData vừa ghi; gọi trong transaction của lần ghi đó.
+
+    Chỉ City có quan trắc mới hơn (hoặc cùng thời điểm với) bản đang lưu được ghi đè. Các dòng hiện có
+    được khóa theo thứ tự City (SELECT ... FOR UPDATE) để hai lần ghi đồng thời không đè quan trắc
+    mới bằng quan trắc cũ. Trả về số City được cập nhật.
+    """
+    newest = {}
+    for record in records:
+        current = newest.get(record.city_id)
+        if current is None or record.observed_at >= current.observed_at:
+            newest[record.city_id] = record
+    if not newest:
+        return 0
+
+    using = using or router.db_for_write(LatestObservation)
+    stored = dict(
+        LatestObservation.objects.using(using)
+        .select_for_update()
+        .filter(city_id__in=newest)
+        .order_by('city_id')
+        .values_list('city_id', 'observed_at')
+    )
+    rows = [
+        LatestObservation(
+            city_id=city_id,
+            observed_at=record.observed_at,
+            **{name: getattr(record, name) for name in WEATHER_DATA_UPDATE_FIELDS},
+        )
+        for city_id, record in newest.items()
+        if city_id not in stored or record.observed_at >= stored[city_id]
+    ]
+    bulk_upsert(LatestObservation, rows, unique_fields=['city'], update_fields=LATEST_OBSERVATION_UPDATE_FIELDS)
+    return len(rows)
+
+
+def write_observations(records: list):
+    """Upsert các WeatherData và LatestObservation tương ứng trong một transaction."""
+    if not records:
+        return
+    using = router.db_for_write(WeatherData)
+    with transaction.atomic(using=using):
+        # `updated_at` được ghi lại cả khi ghi đè dòng đã có để job tổng hợp tính lại khung của dòng đó
+        bulk_upsert(
+            WeatherData, records, unique_fields=['city', 'observed_at'], update_fields=[*WEATHER_DATA_UPDATE_FIELDS, 'updated_at'],
+        )
+        update_latest_observations(records, using=using)
+
+
+def store_observations(records: list) -> list:
+    """Upsert idempotent các WeatherData, bỏ qua những quan trắc process này đã ghi; trả về các dòng đã ghi."""
+    index = get_observation_index()
+    fresh = index.new_records(records)
+    write_observations(fresh)
+    index.mark_written(fresh)
+    return fresh
+
+
+async def astore_observations(records: list) -> list:
+    index = get_observation_index()
+    fresh = index.new_records(records)
+    if fresh:
+        # transaction.atomic chưa hỗ trợ async: chạy cả khối ghi trong một thread
+        await sync_to_async(write_observations)(fresh)
+    index.mark_written(fresh)
+    return fresh
+
+
+_forecast_totals = IngestResult()
+_forecast_totals_lock = threading.Lock()
+
+
+def _forecast_runs(records: Iterable, steps: list, fetched_at: datetime) -> list:
+    """Một ForecastRun cho mỗi City có dòng trong lần lấy, kèm mốc 3h kế tiếp sau `fetched_at`."""
+    runs = {}
+    for obj in (*records, *steps):
+        if obj.city_id not in runs:
+            runs[obj.city_id] = ForecastRun(city_id=obj.city_id, fetched_at=fetched_at, source=obj.source)
+    for step in steps:
+        run = runs[step.city_id]
+        if step.forecast_time > fetched_at and (run.next_step_at is None or step.forecast_time < run.next_step_at):
+            run.next_step_at = step.forecast_time
+    return list(runs.values())
+
+
+def store_forecasts(
+    records: list,
+    steps: Iterable = (),
+    batch_size: Optional[int] = None,
+    fetched_at: Optional[datetime] = None,
+) -> IngestResult:
+    """Ghi dự báo của một hoặc nhiều City trong một transaction: một SELECT đếm dòng đã có + một câu upsert.
+
+    Thay cho `update_or_create` từng ngày (SELECT rồi INSERT/UPDATE cho mỗi dòng).
+    `steps` (tùy chọn): các `ForecastStep` 3h của cùng lần lấy, được upsert trong cùng transaction.
+    Mọi dòng được gắn `fetched_at` (mặc định: bây giờ) và ForecastRun của mỗi City được cập nhật theo.
+    Số dòng thêm/cập nhật trả về chỉ tính dự báo theo ngày.
+    """
+    keyed = {(record.city_id, record.forecast_time): record for record in records}
+    steps = list(steps)
+    if not keyed and not steps:
+        return IngestResult()
+    fetched_at = fetched_at or timezone.now()
+    for obj in (*keyed.values(), *steps):
+        obj.fetched_at = fetched_at
+
+    using = router.db_for_write(WeatherForecast)
+    with transaction.atomic(using=using):
+        existing = set(
+            WeatherForecast.objects.using(using)
+            .filter(city_id__in={k[0] for k in keyed}, forecast_time__in={k[1] for k in keyed})
+            .values_list('city_id', 'forecast_time')
+        )
+        bulk_upsert(
+            WeatherForecast,
+            keyed.values(),
+            unique_fields=['city', 'forecast_time'],
+            update_fields=WEATHER_FORECAST_UPDATE_FIELDS,
+            batch_size=batch_size,
+        )
+        bulk_upsert(
+            ForecastStep,
+            steps,
+            unique_fields=['city', 'forecast_time'],
+            update_fields=FORECAST_STEP_UPDATE_FIELDS,
+            batch_size=batch_size,
+        )
+        bulk_upsert(
+            ForecastRun,
+            _forecast_runs(keyed.values(), steps, fetched_at),
+            unique_fields=['city'],
+            update_fields=FORECAST_RUN_UPDATE_FIELDS,
+            batch_size=batch_size,
+        )
+
+    updated = len(existing & keyed.keys())
+    result = IngestResult(inserted=len(keyed) - updated, updated=updated)
+    global _forecast_totals
+    with _forecast_totals_lock:
+        _forecast_totals = _forecast_totals + result
+    logger.debug("Stored forecasts: %d inserted, %d updated", result.inserted, result.updated)
+    return result
+
+
+async def astore_forecasts(
+    records: list,
+    steps: Iterable = (),
+    batch_size: Optional[int] = None,
+    fetched_at: Optional[datetime] = None,
+) -> IngestResult:
+    # transaction.atomic chưa hỗ trợ async: chạy cả khối ghi trong một thread
+    return await sync_to_async(store_forecasts)(records, steps=steps, batch_size=batch_size, fetched_at=fetched_at)
+
+
+def forecast_ingest_stats() -> dict:
+    """Tổng số dòng dự báo đã thêm/cập nhật trong process này."""
+    return {'inserted': _forecast_totals.inserted, 'updated': _forecast_totals.updated}
+
+
+@receiver(setting_changed)
+def _reset_observation_index_on_setting_change(sender, setting, **kwargs):
+    global _observation_index
+    if setting.startswith('WEATHER_OBSERVATION'):
+        _observation_index = None
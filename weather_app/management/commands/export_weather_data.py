@@ -0,0 +1,55 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from weather_app.export import DATASETS, FORMATS, ExportUnavailable, stream_export
+
+
+def _datetime(value: str):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise CommandError(f"Invalid datetime: {value}")
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = "Xuất WeatherData/WeatherForecast ra CSV, NDJSON hoặc Parquet theo từng lô (bộ nhớ không tăng theo số dòng)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', '-o', help="File đích (mặc định: stdout)")
+        parser.add_argument('--city-id', type=int)
+        parser.add_argument('--start', type=_datetime, help="ISO 8601, tính từ mốc này")
+        parser.add_argument('--end', type=_datetime, help="ISO 8601, trước mốc này")
+        parser.add_argument('--chunk-size', type=int, default=settings.WEATHER_EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            chunks = stream_export(
+                options['dataset'],
+                options['format'],
+                city_id=options['city_id'],
+                start=options['start'],
+                end=options['end'],
+                chunk_size=options['chunk_size'],
+            )
+        except ExportUnavailable as exc:
+            raise CommandError(str(exc))
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from weather_app.bulk_import import import_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Nhập lịch sử quan trắc (CSV có tiêu đề hoặc JSON lines .jsonl/.ndjson) vào WeatherData theo lô, "
+        "bỏ qua dòng trùng (city, observed_at) và tiếp tục từ checkpoint nếu lần chạy trước bị dừng."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Các file cần nhập")
+        parser.add_argument('--batch-size', type=int, help="Số dòng mỗi câu INSERT (mặc định WEATHER_IMPORT_BATCH_SIZE)")
+        parser.add_argument('--workers', type=int, help="Số process nhập song song, mỗi file một process (mặc định WEATHER_IMPORT_WORKERS)")
+        parser.add_argument('--checkpoint-dir', help="Thư mục lưu tiến độ từng file để chạy lại không nhập lại từ đầu")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size'] or settings.WEATHER_IMPORT_BATCH_SIZE
+        workers = options['workers'] or settings.WEATHER_IMPORT_WORKERS
+        if batch_size < 1 or workers < 1:
+            raise CommandError("--batch-size and --workers must be positive")
+
+        def report(stats):
+            if stats.rows == 0 and stats.resumed_from:
+                self.stdout.write(f"{stats.path}: already imported")
+                return
+            resumed = f" (resumed at byte {stats.resumed_from})" if stats.resumed_from else ""
+            self.stdout.write(
+                f"{stats.path}{resumed}: {stats.rows} rows, {stats.valid} valid ({stats.written} new), "
+                f"{stats.unknown_city} unknown city, {stats.invalid} invalid "
+                f"in {stats.seconds:.1f}s ({stats.rows_per_second:.0f} rows/s)"
+            )
+
+        started = time.monotonic()
+        try:
+            results = import_files(
+                options['paths'],
+                batch_size=batch_size,
+                checkpoint_dir=options['checkpoint_dir'],
+                workers=workers,
+                on_file_done=report,
+            )
+        except OSError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.monotonic() - started
+        rows = sum(stats.rows for stats in results)
+        written = sum(stats.written for stats in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {written} new observations of {rows} rows from {len(results)} files in {elapsed:.1f}s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
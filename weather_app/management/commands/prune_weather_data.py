@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from weather_app.retention import prune_weather_data, rollup_weather_data
+
+
+class Command(BaseCommand):
+    help = "Tổng hợp WeatherData mới vào bảng theo giờ/ngày rồi xóa dữ liệu gốc quá hạn lưu giữ theo từng lô nhỏ."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raw-days', type=int, help="Giữ WeatherData gốc trong N ngày (mặc định WEATHER_RETENTION_RAW_DAYS, 0 = giữ tất cả)")
+        parser.add_argument('--hourly-days', type=int, help="Giữ bảng theo giờ trong N ngày (mặc định WEATHER_RETENTION_HOURLY_DAYS, 0 = giữ tất cả)")
+        parser.add_argument('--batch-size', type=int, help="Số dòng mỗi câu DELETE (mặc định WEATHER_RETENTION_BATCH_SIZE)")
+        parser.add_argument('--sleep', type=float, help="Số giây nghỉ giữa các lô (mặc định WEATHER_RETENTION_BATCH_SLEEP)")
+        parser.add_argument('--skip-rollup', action='store_true', help="Chỉ xóa, không tổng hợp trước")
+        parser.add_argument('--skip-prune', action='store_true', help="Chỉ tổng hợp, không xóa")
+
+    def handle(self, *args, **options):
+        if not options['skip_rollup']:
+            stats = rollup_weather_data()
+            self.stdout.write(
+                f"Rolled up {stats['cities']} cities: {stats['hourly']} hourly and {stats['daily']} daily rows"
+            )
+        if not options['skip_prune']:
+            stats = prune_weather_data(
+                raw_days=options['raw_days'],
+                hourly_days=options['hourly_days'],
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Deleted {stats['raw']} WeatherData rows and {stats['hourly']} hourly rollup rows"
+            ))
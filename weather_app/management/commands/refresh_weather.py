@@ -0,0 +1,57 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from weather_app.refresher import refresh_cycle
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Làm mới trước khi hết hạn thời tiết hiện tại và dự báo của các City được quan tâm nhiều nhất "
+        "(theo yêu thích và lượt tìm kiếm gần đây), trong một phần hạn mức gọi OpenWeather."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Chạy một vòng rồi thoát (ví dụ khi chạy bằng cron)")
+        parser.add_argument('--top', type=int, help="Số City được làm mới (mặc định WEATHER_REFRESH_TOP_N)")
+        parser.add_argument('--interval', type=float, help="Số giây giữa hai vòng (mặc định WEATHER_REFRESH_INTERVAL)")
+        parser.add_argument('--lead', type=float, help="Làm mới dữ liệu sẽ hết hạn trong N giây tới (mặc định WEATHER_REFRESH_LEAD_SECONDS)")
+        parser.add_argument('--quota-share', type=float, help="Phần hạn mức API job được dùng, 0-1 (mặc định WEATHER_REFRESH_QUOTA_SHARE)")
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.WEATHER_REFRESH_INTERVAL
+        quota_share = options['quota_share']
+        if interval <= 0 or (quota_share is not None and not 0 < quota_share <= 1):
+            raise CommandError("--interval must be positive and --quota-share within (0, 1]")
+
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+            try:
+                cycle = refresh_cycle(
+                    top_n=options['top'],
+                    interval=interval,
+                    lead=options['lead'],
+                    quota_share=quota_share,
+                )
+            except Exception:
+                # Một vòng lỗi (DB mất kết nối, payload lạ...) không được làm dừng job chạy dài hạn
+                if options['once']:
+                    raise
+                logger.exception("Refresh cycle failed")
+                close_old_connections()
+            else:
+                self.stdout.write(
+                    f"{cycle.started_at:%Y-%m-%d %H:%M:%S} ranked {cycle.ranked}, refreshed {cycle.current_refreshed} current "
+                    f"and {cycle.forecast_refreshed} forecasts with {cycle.upstream_calls} calls "
+                    f"({cycle.deferred} deferred, {cycle.failed} failed) in {cycle.total_seconds:.2f}s "
+                    f"[rank {cycle.rank_seconds:.2f}s, fetch {cycle.fetch_seconds:.2f}s, write {cycle.write_seconds:.2f}s]"
+                )
+                if options['once']:
+                    return
+            time.sleep(max(0, interval - (time.monotonic() - started)))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0003_user_email_verification_sent_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CityAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=120, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='weather_app.city')),
+            ],
+            options={
+                'verbose_name': 'City Alias',
+                'verbose_name_plural': 'City Aliases',
+                'db_table': 'CityAlias',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0004_cityalias'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('forecast_time', models.DateTimeField()),
+                ('temperature_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('humidity_pct', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('precipitation_probability_pct', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('wind_speed_ms', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('description', models.CharField(blank=True, max_length=120, null=True)),
+                ('icon_code', models.CharField(blank=True, max_length=10, null=True)),
+                ('source', models.CharField(blank=True, max_length=50, null=True)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_steps', to='weather_app.city')),
+            ],
+            options={
+                'verbose_name': 'Forecast Step',
+                'verbose_name_plural': 'Forecast Steps',
+                'db_table': 'ForecastStep',
+                'constraints': [models.UniqueConstraint(fields=('city', 'forecast_time'), name='unique_forecast_step')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0005_forecaststep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='openweather_id',
+            field=models.PositiveIntegerField(blank=True, help_text='City id của OpenWeather', null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0006_city_openweather_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'RollupCheckpoint',
+            },
+        ),
+        migrations.CreateModel(
+            name='WeatherDataDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('temp_min_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('temp_max_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('temp_avg_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('humidity_min_pct', models.PositiveSmallIntegerField()),
+                ('humidity_max_pct', models.PositiveSmallIntegerField()),
+                ('humidity_avg_pct', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('pressure_min_hpa', models.PositiveIntegerField()),
+                ('pressure_max_hpa', models.PositiveIntegerField()),
+                ('pressure_avg_hpa', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('wind_speed_min_ms', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('wind_speed_max_ms', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('wind_speed_avg_ms', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Weather Data (daily)',
+                'verbose_name_plural': 'Weather Data (daily)',
+                'db_table': 'WeatherDataDaily',
+            },
+        ),
+        migrations.CreateModel(
+            name='WeatherDataHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('temp_min_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('temp_max_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('temp_avg_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('humidity_min_pct', models.PositiveSmallIntegerField()),
+                ('humidity_max_pct', models.PositiveSmallIntegerField()),
+                ('humidity_avg_pct', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('pressure_min_hpa', models.PositiveIntegerField()),
+                ('pressure_max_hpa', models.PositiveIntegerField()),
+                ('pressure_avg_hpa', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('wind_speed_min_ms', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('wind_speed_max_ms', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('wind_speed_avg_ms', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Weather Data (hourly)',
+                'verbose_name_plural': 'Weather Data (hourly)',
+                'db_table': 'WeatherDataHourly',
+            },
+        ),
+        migrations.AddField(
+            model_name='weatherdatadaily',
+            name='city',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='weather_app.city'),
+        ),
+        migrations.AddField(
+            model_name='weatherdatahourly',
+            name='city',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='weather_app.city'),
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdatadaily',
+            constraint=models.UniqueConstraint(fields=('city', 'bucket_start'), name='unique_weather_data_daily'),
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdatahourly',
+            constraint=models.UniqueConstraint(fields=('city', 'bucket_start'), name='unique_weather_data_hourly'),
+        ),
+    ]
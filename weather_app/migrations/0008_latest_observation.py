@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+LATEST_FIELDS = [
+    'observed_at', 'temperature_c', 'humidity_pct', 'pressure_hpa', 'wind_speed_ms', 'description', 'icon_code', 'source',
+]
+
+
+def backfill_latest_observations(apps, schema_editor):
+    # Mỗi City một truy vấn theo index (city, observed_at), ghi theo lô
+    City = apps.get_model('weather_app', 'City')
+    WeatherData = apps.get_model('weather_app', 'WeatherData')
+    LatestObservation = apps.get_model('weather_app', 'LatestObservation')
+    db_alias = schema_editor.connection.alias
+    batch = []
+    for city_id in City.objects.using(db_alias).values_list('id', flat=True).iterator():
+        latest = (
+            WeatherData.objects.using(db_alias).filter(city_id=city_id).order_by('-observed_at').values(*LATEST_FIELDS).first()
+        )
+        if latest is not None:
+            batch.append(LatestObservation(city_id=city_id, **latest))
+        if len(batch) >= 1000:
+            LatestObservation.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    LatestObservation.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0007_weather_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestObservation',
+            fields=[
+                ('city', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_observation', serialize=False, to='weather_app.city')),
+                ('observed_at', models.DateTimeField()),
+                ('temperature_c', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('humidity_pct', models.PositiveSmallIntegerField()),
+                ('pressure_hpa', models.PositiveIntegerField()),
+                ('wind_speed_ms', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('description', models.CharField(blank=True, max_length=120, null=True)),
+                ('icon_code', models.CharField(blank=True, max_length=10, null=True)),
+                ('source', models.CharField(blank=True, max_length=50, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'LatestObservation',
+            },
+        ),
+        migrations.RunPython(backfill_latest_observations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0008_latest_observation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastRun',
+            fields=[
+                ('city', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='forecast_run', serialize=False, to='weather_app.city')),
+                ('fetched_at', models.DateTimeField()),
+                ('next_step_at', models.DateTimeField(blank=True, null=True)),
+                ('source', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+            options={
+                'db_table': 'ForecastRun',
+            },
+        ),
+        migrations.AddField(
+            model_name='forecaststep',
+            name='fetched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='weatherforecast',
+            name='fetched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
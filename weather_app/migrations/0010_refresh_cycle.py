@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0009_forecast_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('ranked', models.PositiveIntegerField(default=0)),
+                ('current_refreshed', models.PositiveIntegerField(default=0)),
+                ('forecast_refreshed', models.PositiveIntegerField(default=0)),
+                ('upstream_calls', models.PositiveIntegerField(default=0)),
+                ('deferred', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('rank_seconds', models.FloatField(default=0)),
+                ('fetch_seconds', models.FloatField(default=0)),
+                ('write_seconds', models.FloatField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'db_table': 'RefreshCycle',
+                'indexes': [models.Index(fields=['started_at'], name='RefreshCycl_started_d93df7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import F, Max, Min
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Theo từng khoảng khóa chính, mỗi lô một câu UPDATE ngắn được commit riêng (migration không atomic)
+    # nên không khóa cả bảng; dòng chưa tới lượt (NULL) được job tổng hợp coi như đã được tổng hợp
+    WeatherData = apps.get_model('weather_app', 'WeatherData')
+    rows = WeatherData.objects.using(schema_editor.connection.alias)
+    bounds = rows.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BACKFILL_BATCH_SIZE):
+        rows.filter(pk__gte=start, pk__lt=start + BACKFILL_BATCH_SIZE, updated_at__isnull=True).update(
+            updated_at=F('created_at'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('weather_app', '0010_refresh_cycle'),
+    ]
+
+    operations = [
+        # Cột cho phép NULL, không default: thêm cột không phải ghi lại toàn bộ bảng
+        migrations.AddField(
+            model_name='weatherdata',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['updated_at'], name='WeatherData_updated_356fb7_idx'),
+        ),
+    ]
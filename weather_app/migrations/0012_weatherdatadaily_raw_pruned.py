@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_app', '0011_weatherdata_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weatherdatadaily',
+            name='raw_pruned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
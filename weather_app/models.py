@@ -56,6 +56,7 @@ class City(models.Model):
     latitude = models.DecimalField(max_digits=8, decimal_places=5)
     longitude = models.DecimalField(max_digits=8, decimal_places=5)
     timezone_name = models.CharField(max_length=64, blank=True, null=True)
+    openweather_id = models.PositiveIntegerField(unique=True, blank=True, null=True, help_text="City id của OpenWeather")
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -79,6 +80,23 @@ class City(models.Model):
         return f"{self.name}, {self.country_code}"
 
 
+class CityAlias(models.Model):
+    """Chuỗi tìm kiếm (đã chuẩn hóa) ánh xạ tới một `City`, để bỏ qua bước geocode qua API."""
+
+    alias = models.CharField(max_length=120, unique=True)
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="aliases")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "CityAlias"
+        verbose_name = "City Alias"
+        verbose_name_plural = "City Aliases"
+
+    def __str__(self) -> str:
+        return f"{self.alias} → {self.city}"
+
+
 class WeatherData(models.Model):
     """Dữ liệu thời tiết hiện tại cho một địa điểm."""
 
@@ -94,11 +112,15 @@ class WeatherData(models.Model):
     source = models.CharField(max_length=50, blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Lần ghi gần nhất (kể cả khi upsert ghi đè), job tổng hợp theo mốc này.
+    # NULL: dòng có từ trước khi thêm cột và chưa được backfill, coi như đã được tổng hợp
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     class Meta:
         db_table = "WeatherData"
         indexes = [
             models.Index(fields=["city", "observed_at"]),
+            models.Index(fields=["updated_at"]),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -111,6 +133,104 @@ class WeatherData(models.Model):
         return f"{self.city} @ {self.observed_at:%Y-%m-%d %H:%M}"
 
 
+class LatestObservation(models.Model):
+    """Quan trắc mới nhất của mỗi City (bản sao dòng WeatherData mới nhất).
+
+    Được cập nhật trong cùng transaction với lần ghi WeatherData, nên đọc thời tiết hiện tại của
+    một hay nhiều City chỉ là tra theo khóa chính, không phụ thuộc độ lớn của lịch sử.
+    """
+
+    city = models.OneToOneField(City, on_delete=models.CASCADE, primary_key=True, related_name="latest_observation")
+    observed_at = models.DateTimeField()
+
+    temperature_c = models.DecimalField(max_digits=5, decimal_places=2)
+    humidity_pct = models.PositiveSmallIntegerField()
+    pressure_hpa = models.PositiveIntegerField()
+    wind_speed_ms = models.DecimalField(max_digits=5, decimal_places=2)
+    description = models.CharField(max_length=120, blank=True, null=True)
+    icon_code = models.CharField(max_length=10, blank=True, null=True)
+    source = models.CharField(max_length=50, blank=True, null=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "LatestObservation"
+
+    def __str__(self) -> str:
+        return f"{self.city} @ {self.observed_at:%Y-%m-%d %H:%M} (latest)"
+
+
+class WeatherRollup(models.Model):
+    """Tổng hợp WeatherData của một City trong một khung thời gian (bắt đầu tại `bucket_start`, UTC)."""
+
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="+")
+    bucket_start = models.DateTimeField()
+    sample_count = models.PositiveIntegerField()
+
+    temp_min_c = models.DecimalField(max_digits=5, decimal_places=2)
+    temp_max_c = models.DecimalField(max_digits=5, decimal_places=2)
+    temp_avg_c = models.DecimalField(max_digits=5, decimal_places=2)
+    humidity_min_pct = models.PositiveSmallIntegerField()
+    humidity_max_pct = models.PositiveSmallIntegerField()
+    humidity_avg_pct = models.DecimalField(max_digits=5, decimal_places=2)
+    pressure_min_hpa = models.PositiveIntegerField()
+    pressure_max_hpa = models.PositiveIntegerField()
+    pressure_avg_hpa = models.DecimalField(max_digits=7, decimal_places=2)
+    wind_speed_min_ms = models.DecimalField(max_digits=5, decimal_places=2)
+    wind_speed_max_ms = models.DecimalField(max_digits=5, decimal_places=2)
+    wind_speed_avg_ms = models.DecimalField(max_digits=5, decimal_places=2)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return f"{self.city} @ {self.bucket_start:%Y-%m-%d %H:%M}"
+
+
+class WeatherDataHourly(WeatherRollup):
+    """WeatherData tổng hợp theo giờ."""
+
+    class Meta:
+        db_table = "WeatherDataHourly"
+        verbose_name = "Weather Data (hourly)"
+        verbose_name_plural = "Weather Data (hourly)"
+        constraints = [
+            models.UniqueConstraint(fields=["city", "bucket_start"], name="unique_weather_data_hourly")
+        ]
+
+
+class WeatherDataDaily(WeatherRollup):
+    """WeatherData tổng hợp theo ngày (UTC), tính từ bảng theo giờ."""
+
+    # Dữ liệu gốc của ngày đã bị xóa: dòng tổng hợp không được tính lại từ các dòng gốc tới muộn
+    raw_pruned = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = "WeatherDataDaily"
+        verbose_name = "Weather Data (daily)"
+        verbose_name_plural = "Weather Data (daily)"
+        constraints = [
+            models.UniqueConstraint(fields=["city", "bucket_start"], name="unique_weather_data_daily")
+        ]
+
+
+class RollupCheckpoint(models.Model):
+    """Mốc `updated_at` của WeatherData mà job tổng hợp đã xử lý tới."""
+
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField()
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "RollupCheckpoint"
+
+    def __str__(self) -> str:
+        return f"{self.name} @ {self.position:%Y-%m-%d %H:%M:%S}"
+
+
 class WeatherForecast(models.Model):
     """Dự báo thời tiết theo mốc thời gian cho một địa điểm."""
 
@@ -123,6 +243,8 @@ class WeatherForecast(models.Model):
     description = models.CharField(max_length=120, blank=True, null=True)
     icon_code = models.CharField(max_length=10, blank=True, null=True)
     source = models.CharField(max_length=50, blank=True, null=True)
+    # Lần lấy dự báo (ForecastRun.fetched_at) đã ghi dòng này
+    fetched_at = models.DateTimeField(blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -142,6 +264,83 @@ class WeatherForecast(models.Model):
         return f"Forecast {self.city} @ {self.forecast_time:%Y-%m-%d %H:%M}"
 
 
+class ForecastStep(models.Model):
+    """Một mốc dự báo 3 giờ (chuỗi gốc của OpenWeather) cho một địa điểm."""
+
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name="forecast_steps")
+    forecast_time = models.DateTimeField()
+
+    temperature_c = models.DecimalField(max_digits=5, decimal_places=2)
+    humidity_pct = models.PositiveSmallIntegerField(blank=True, null=True)
+    precipitation_probability_pct = models.PositiveSmallIntegerField(blank=True, null=True)
+    wind_speed_ms = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    description = models.CharField(max_length=120, blank=True, null=True)
+    icon_code = models.CharField(max_length=10, blank=True, null=True)
+    source = models.CharField(max_length=50, blank=True, null=True)
+    fetched_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "ForecastStep"
+        verbose_name = "Forecast Step"
+        verbose_name_plural = "Forecast Steps"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["city", "forecast_time"],
+                name="unique_forecast_step"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"Step {self.city} @ {self.forecast_time:%Y-%m-%d %H:%M}"
+
+
+class ForecastRun(models.Model):
+    """Lần lấy dự báo gần nhất của mỗi City.
+
+    Các dòng WeatherForecast/ForecastStep của lần lấy này có cùng `fetched_at`, nên dự báo còn mới
+    được đọc thẳng từ DB (dùng chung giữa các worker/node, còn nguyên sau khi khởi động lại).
+    """
+
+    city = models.OneToOneField(City, on_delete=models.CASCADE, primary_key=True, related_name="forecast_run")
+    fetched_at = models.DateTimeField()
+    # Mốc 3h kế tiếp tại thời điểm lấy (khi đó OpenWeather dịch chuỗi dự báo đi)
+    next_step_at = models.DateTimeField(blank=True, null=True)
+    source = models.CharField(max_length=50, blank=True, null=True)
+
+    class Meta:
+        db_table = "ForecastRun"
+
+    def __str__(self) -> str:
+        return f"Forecast run {self.city} @ {self.fetched_at:%Y-%m-%d %H:%M}"
+
+
+class RefreshCycle(models.Model):
+    """Một vòng chạy của job làm mới thời tiết nền (`refresh_weather`): số City, số lời gọi và thời gian từng bước."""
+
+    started_at = models.DateTimeField()
+    ranked = models.PositiveIntegerField(default=0)
+    current_refreshed = models.PositiveIntegerField(default=0)
+    forecast_refreshed = models.PositiveIntegerField(default=0)
+    upstream_calls = models.PositiveIntegerField(default=0)
+    # City đến hạn nhưng vượt ngân sách lời gọi của vòng này / lời gọi thất bại
+    deferred = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    rank_seconds = models.FloatField(default=0)
+    fetch_seconds = models.FloatField(default=0)
+    write_seconds = models.FloatField(default=0)
+    total_seconds = models.FloatField(default=0)
+
+    class Meta:
+        db_table = "RefreshCycle"
+        indexes = [
+            models.Index(fields=["started_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"Refresh cycle @ {self.started_at:%Y-%m-%d %H:%M} ({self.total_seconds:.1f}s)"
+
+
 class SearchHistory(models.Model):
     """Lịch sử tìm kiếm của người dùng."""
 
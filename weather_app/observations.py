@@ -0,0 +1,174 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Optional
+
+from django.db.models import Q
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils.dateparse import parse_datetime
+
+from .models import WeatherData, WeatherDataDaily, WeatherDataHourly
+from .retention import (
+    ROLLUP_METRICS, floor_day, floor_hour, observation_aggregates, rollup_position, touched_days, without_pruned_days,
+)
+
+RAW = 'raw'
+HOUR = 'hour'
+DAY = 'day'
+BUCKETS = (RAW, HOUR, DAY)
+
+# bucket -> (bảng tổng hợp, hàm cắt thời gian trong SQL, hàm làm tròn trong Python, độ dài khung)
+_BUCKET_SOURCES = {
+    HOUR: (WeatherDataHourly, TruncHour, floor_hour, timedelta(hours=1)),
+    DAY: (WeatherDataDaily, TruncDay, floor_day, timedelta(days=1)),
+}
+
+_ROLLUP_FIELDS = [name for _, *names in ROLLUP_METRICS for name in names]
+
+
+def encode_cursor(*values) -> str:
+    """Cursor phân trang dạng chuỗi mờ (base64 của JSON) để client chỉ việc gửi lại."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    """Giải mã cursor; `ValueError` nếu cursor không hợp lệ."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError('cursor') from exc
+    if not isinstance(values, list) or not values:
+        raise ValueError('cursor')
+    try:
+        moment = parse_datetime(values[0]) if isinstance(values[0], str) else None
+    except ValueError:
+        moment = None
+    # Cursor do API tạo luôn có múi giờ; mốc không múi giờ không so sánh được với khoảng [start, end)
+    if moment is None or moment.tzinfo is None:
+        raise ValueError('cursor')
+    return [moment, *values[1:]]
+
+
+def _raw_page(city_id: int, start: datetime, end: datetime, limit: int, cursor: Optional[str]):
+    queryset = WeatherData.objects.filter(city_id=city_id, observed_at__gte=start, observed_at__lt=end)
+    if cursor:
+        after, *rest = decode_cursor(cursor)
+        if len(rest) != 1 or not isinstance(rest[0], int) or not 0 <= rest[0] < 2 ** 63:
+            raise ValueError('cursor')
+        # Keyset (observed_at, id): trang sâu vẫn dùng index (city, observed_at), không OFFSET
+        queryset = queryset.filter(Q(observed_at__gt=after) | Q(observed_at=after, id__gt=rest[0]))
+    rows = list(
+        queryset.order_by('observed_at', 'id').values(
+            'id', 'observed_at', 'temperature_c', 'humidity_pct', 'pressure_hpa', 'wind_speed_ms', 'description',
+        )[:limit + 1]
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['observed_at'].isoformat(), rows[-1]['id'])
+    results = [
+        {
+            'observed_at': row['observed_at'].isoformat(),
+            'temperature_c': float(row['temperature_c']),
+            'humidity_pct': row['humidity_pct'],
+            'pressure_hpa': row['pressure_hpa'],
+            'wind_speed_ms': float(row['wind_speed_ms']),
+            'description': row['description'],
+        }
+        for row in rows
+    ]
+    return results, next_cursor
+
+
+def _bucket_row(bucket_start: datetime, row: dict) -> dict:
+    payload = {'bucket_start': bucket_start.isoformat(), 'sample_count': row['sample_count']}
+    for name in _ROLLUP_FIELDS:
+        value = row[name]
+        payload[name] = round(float(value), 2) if value is not None else None
+    return payload
+
+
+def _bucket_page(city_id: int, bucket: str, start: datetime, end: datetime, limit: int, cursor: Optional[str]):
+    """Khung giờ/ngày: lấy từ bảng tổng hợp, trừ những ngày còn dòng chưa được tổng hợp thì GROUP BY trực tiếp trên WeatherData.
+
+    Ngày chưa được tổng hợp là ngày (UTC) có WeatherData ghi sau checkpoint của job tổng hợp, kể cả quan trắc
+    cũ tới muộn; khung giờ/ngày luôn nằm gọn trong một ngày nên mỗi khung chỉ lấy từ một nguồn.
+    """
+    model, trunc, floor, step = _BUCKET_SOURCES[bucket]
+    start = floor(start)
+    if cursor:
+        after, *rest = decode_cursor(cursor)
+        if rest:
+            raise ValueError('cursor')
+        try:
+            start = max(start, after + step)
+        except OverflowError as exc:
+            raise ValueError('cursor') from exc
+    if start >= end:
+        return [], None
+
+    position = rollup_position()
+    if position is None:
+        pending = [(city_id, start, end)]
+    else:
+        # Ngày đã xóa dữ liệu gốc luôn lấy từ bảng tổng hợp, dù có dòng tới muộn
+        pending = without_pruned_days(touched_days(
+            WeatherData.objects.filter(
+                city_id=city_id, observed_at__gte=floor_day(start), observed_at__lt=end, updated_at__gte=position,
+            )
+        ))
+    pending = [(max(range_start, start), min(range_end, end)) for _, range_start, range_end in pending]
+
+    stored = model.objects.filter(city_id=city_id, bucket_start__gte=start, bucket_start__lt=end)
+    for range_start, range_end in pending:
+        stored = stored.exclude(bucket_start__gte=range_start, bucket_start__lt=range_end)
+    rows = [
+        _bucket_row(row['bucket_start'], row)
+        for row in stored.order_by('bucket_start').values('bucket_start', 'sample_count', *_ROLLUP_FIELDS)[:limit + 1]
+    ]
+    if pending:
+        aggregates = observation_aggregates()
+        condition = Q()
+        for range_start, range_end in pending:
+            condition |= Q(observed_at__gte=range_start, observed_at__lt=range_end)
+        computed = (
+            WeatherData.objects.filter(condition, city_id=city_id)
+            .annotate(bucket=trunc('observed_at', tzinfo=dt_timezone.utc))
+            .values('bucket')
+            .annotate(**{f'rollup_{name}': expression for name, expression in aggregates.items()})
+            .order_by('bucket')[:limit + 1]
+        )
+        rows.extend(
+            _bucket_row(row['bucket'], {name: row[f'rollup_{name}'] for name in aggregates})
+            for row in computed
+        )
+        rows.sort(key=lambda row: row['bucket_start'])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['bucket_start'])
+    return rows, next_cursor
+
+
+def observation_history(
+    city_id: int,
+    start: datetime,
+    end: datetime,
+    bucket: str = RAW,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+) -> dict:
+    """Lịch sử WeatherData của một City trong [start, end), theo từng quan trắc (`raw`) hoặc theo giờ/ngày (UTC).
+
+    Phân trang kiểu keyset: `next_cursor` (None ở trang cuối) được gửi lại để lấy trang kế tiếp.
+    `ValueError` nếu `bucket` hoặc `cursor` không hợp lệ.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError('bucket')
+    if bucket == RAW:
+        results, next_cursor = _raw_page(city_id, start, end, limit, cursor)
+    else:
+        results, next_cursor = _bucket_page(city_id, bucket, start, end, limit, cursor)
+    return {'bucket': bucket, 'results': results, 'next_cursor': next_cursor}
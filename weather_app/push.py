@@ -0,0 +1,116 @@
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import List, Optional
+
+from django.utils import timezone
+
+from .cities import CityLookup
+from .ingest import get_observation_index, write_observations
+from .models import WeatherData
+
+logger = logging.getLogger(__name__)
+
+# Quan trắc đẩy lên được ghi với nguồn này nếu dòng không có `source`
+DEFAULT_SOURCE = 'station'
+
+# Cho phép đồng hồ của trạm chạy nhanh hơn server một chút
+_MAX_CLOCK_SKEW = timedelta(minutes=10)
+
+_SOURCE_MAX_LENGTH = WeatherData._meta.get_field('source').max_length
+_DESCRIPTION_MAX_LENGTH = WeatherData._meta.get_field('description').max_length
+_ICON_MAX_LENGTH = WeatherData._meta.get_field('icon_code').max_length
+
+
+def parse_observed_at(value) -> datetime:
+    """Thời điểm quan trắc từ Unix epoch hoặc ISO 8601 (không có múi giờ thì hiểu là UTC)."""
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.replace('.', '', 1).isdigit()):
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return moment if moment.tzinfo else moment.replace(tzinfo=dt_timezone.utc)
+
+
+class RowError(ValueError):
+    """Một dòng của lô bị từ chối (thông điệp được trả về cho client)."""
+
+
+def _number(row: dict, name: str, low: float, high: float) -> float:
+    value = row.get(name)
+    if value is None or value == '' or isinstance(value, bool):
+        raise RowError(f"missing {name}")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"invalid {name}") from None
+    if not low <= number <= high:
+        raise RowError(f"{name} out of range")
+    return number
+
+
+def _text(row: dict, name: str, max_length: int) -> Optional[str]:
+    value = row.get(name)
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str) or len(value) > max_length:
+        raise RowError(f"invalid {name}")
+    return value
+
+
+def validate_observation(row, city_id: Optional[int], now: datetime, default_source: str) -> WeatherData:
+    """WeatherData từ một dòng quan trắc (đẩy lên hoặc nhập từ file); `RowError` nếu dòng không hợp lệ.
+
+    Chỉ kiểm tra bằng Python thuần (không qua serializer/form) để chi phí mỗi dòng thấp.
+    """
+    if not isinstance(row, dict):
+        raise RowError("row must be an object")
+    if city_id is None:
+        raise RowError("unknown city")
+    if row.get('observed_at') in (None, ''):
+        raise RowError("missing observed_at")
+    try:
+        observed_at = parse_observed_at(row['observed_at'])
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise RowError("invalid observed_at") from None
+    if observed_at > now + _MAX_CLOCK_SKEW:
+        raise RowError("observed_at is in the future")
+
+    return WeatherData(
+        city_id=city_id,
+        observed_at=observed_at,
+        temperature_c=Decimal(f"{_number(row, 'temperature_c', -999.99, 999.99):.2f}"),
+        humidity_pct=round(_number(row, 'humidity_pct', 0, 100)),
+        pressure_hpa=round(_number(row, 'pressure_hpa', 0, 2000)),
+        wind_speed_ms=Decimal(f"{_number(row, 'wind_speed_ms', 0, 999.99):.2f}"),
+        description=_text(row, 'description', _DESCRIPTION_MAX_LENGTH),
+        icon_code=_text(row, 'icon_code', _ICON_MAX_LENGTH),
+        source=_text(row, 'source', _SOURCE_MAX_LENGTH) or default_source,
+    )
+
+
+def ingest_observations(rows: List, default_source: str = DEFAULT_SOURCE) -> dict:
+    """Kiểm tra và upsert một lô quan trắc đẩy lên từ trạm đo.
+
+    City của cả lô được nhận diện trong một lần tra DB (`city_id`, `openweather_id`, hoặc `city` + `country_code`),
+    các dòng hợp lệ được ghi bằng một câu upsert trên (city, observed_at) cùng LatestObservation. Trả về số dòng được nhận và
+    danh sách dòng bị từ chối kèm vị trí trong lô.
+    """
+    lookup = CityLookup.for_rows(rows)
+    now = timezone.now()
+    records = []
+    rejected = []
+    for position, row in enumerate(rows):
+        try:
+            city_id = lookup.resolve(row) if isinstance(row, dict) else None
+        except (AttributeError, TypeError, ValueError):
+            rejected.append({'index': position, 'error': "invalid city reference"})
+            continue
+        try:
+            records.append(validate_observation(row, city_id, now, default_source))
+        except RowError as exc:
+            rejected.append({'index': position, 'error': str(exc)})
+
+    if records:
+        write_observations(records)
+        get_observation_index().mark_written(records)
+    logger.debug("Ingested %d pushed observations, rejected %d", len(records), len(rejected))
+    return {'accepted': len(records), 'rejected': rejected}
@@ -0,0 +1,270 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+LANES = (INTERACTIVE, BACKGROUND)
+
+_lane: contextvars.ContextVar = contextvars.ContextVar('weather_quota_lane', default=INTERACTIVE)
+_wait_timeout: contextvars.ContextVar = contextvars.ContextVar('weather_quota_wait_timeout', default=None)
+
+
+@contextmanager
+def quota_lane(lane: str, wait_timeout: Optional[float] = None):
+    """Gắn lane cho các lời gọi upstream bên trong khối `with` (mặc định là `INTERACTIVE`).
+
+    `wait_timeout` (tùy chọn) thay thời gian chờ hạn mức mặc định của lane, ví dụ để job nền
+    chờ tới lượt thay vì bỏ lời gọi ngay.
+    Dùng contextvar nên lane đi theo task asyncio; khi đẩy việc sang thread pool cần
+    `contextvars.copy_context().run` để giữ lane.
+    """
+    token = _lane.set(lane)
+    wait_token = _wait_timeout.set(wait_timeout)
+    try:
+        yield
+    finally:
+        _wait_timeout.reset(wait_token)
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+class TokenBucket:
+    """Token bucket trong process: nạp `rate` token/giây, tối đa `capacity` token."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, reserve: float = 0) -> float:
+        """Lấy một token nếu sau khi lấy vẫn còn ít nhất `reserve`; trả 0 nếu lấy được, ngược lại số giây cần chờ."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens - 1 >= reserve:
+            self.tokens -= 1
+            return 0
+        return (reserve + 1 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def give_back(self):
+        """Trả lại token vừa lấy khi lời gọi không được thực hiện."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def available(self) -> float:
+        self._refill(time.monotonic())
+        return self.tokens
+
+
+class QuotaManager:
+    """Quản lý hạn mức gọi OpenWeather (`calls_per_minute`) cho mọi worker.
+
+    - Mỗi process có một token bucket (`burst` token, nạp đều `calls_per_minute / 60` token/giây) để dàn đều lời gọi.
+    - Nếu có `alias` (cache dùng chung), tổng số lời gọi trong mỗi phút của mọi worker được đếm bằng `cache.incr`
+      để không vượt hạn mức của gói.
+    - Lane `INTERACTIVE` (request của người dùng) được ưu tiên: lane `BACKGROUND` không được dùng phần
+      `interactive_reserve` cuối của hạn mức và nhường lượt khi có request người dùng đang chờ.
+    - Hết hạn mức mà chờ quá `wait_timeout` giây: `acquire` trả `False` để service phục vụ dữ liệu cũ thay vì gọi API.
+    """
+
+    def __init__(
+        self,
+        calls_per_minute: int = 60,
+        burst: Optional[int] = None,
+        interactive_reserve: float = 0.2,
+        wait_timeout: float = 2.0,
+        background_wait_timeout: float = 0,
+        alias: Optional[str] = None,
+    ):
+        self.calls_per_minute = calls_per_minute
+        self.interactive_reserve = interactive_reserve
+        self.wait_timeout = wait_timeout
+        self.background_wait_timeout = background_wait_timeout
+        self.alias = alias or None
+        capacity = burst or max(1, calls_per_minute // 6)
+        self.bucket = TokenBucket(rate=calls_per_minute / 60, capacity=capacity)
+        self._lock = threading.Lock()
+        self.waiting = {lane: 0 for lane in LANES}
+        self.granted = {lane: 0 for lane in LANES}
+        self.rejected = {lane: 0 for lane in LANES}
+
+    def _timeout_for(self, lane: str) -> float:
+        override = _wait_timeout.get()
+        if override is not None:
+            return override
+        return self.wait_timeout if lane == INTERACTIVE else self.background_wait_timeout
+
+    def _shared_key(self, window: int) -> str:
+        return f"weather:quota:{window}"
+
+    def _shared_limit(self, lane: str) -> int:
+        if lane == INTERACTIVE:
+            return self.calls_per_minute
+        return int(self.calls_per_minute * (1 - self.interactive_reserve))
+
+    def _try_local(self, lane: str) -> float:
+        """Thử lấy token trong process; trả 0 nếu được, ngược lại số giây nên chờ trước khi thử lại."""
+        with self._lock:
+            if lane == BACKGROUND and self.waiting[INTERACTIVE] > 0:
+                return 0.05
+            reserve = 0 if lane == INTERACTIVE else self.bucket.capacity * self.interactive_reserve
+            return self.bucket.take(reserve)
+
+    def _give_back_local(self):
+        with self._lock:
+            self.bucket.give_back()
+
+    def _shared_wait(self, count: Optional[int], lane: str) -> float:
+        if count is None or count <= self._shared_limit(lane):
+            return 0
+        # Hết hạn mức phút này: chờ sang cửa sổ kế tiếp
+        return 60 - time.time() % 60
+
+    def _take_shared(self, lane: str) -> float:
+        """Tăng bộ đếm dùng chung của phút hiện tại; trả 0 nếu còn hạn mức cho lane, ngược lại số giây cần chờ.
+
+        Lần bị từ chối không được tính: bộ đếm được giảm lại, nếu không lane BACKGROUND thử lại liên tục
+        sẽ đẩy bộ đếm lên hết phần dành cho INTERACTIVE.
+        """
+        if self.alias is None:
+            return 0
+        shared = caches[self.alias]
+        key = self._shared_key(int(time.time() // 60))
+        try:
+            shared.add(key, 0, timeout=120)
+            count = shared.incr(key)
+        except Exception:
+            logger.exception("Shared quota counter failed")
+            return 0
+        wait = self._shared_wait(count, lane)
+        if wait:
+            try:
+                shared.decr(key)
+            except Exception:
+                logger.exception("Shared quota counter failed")
+        return wait
+
+    async def _atake_shared(self, lane: str) -> float:
+        if self.alias is None:
+            return 0
+        shared = caches[self.alias]
+        key = self._shared_key(int(time.time() // 60))
+        try:
+            await shared.aadd(key, 0, timeout=120)
+            count = await shared.aincr(key)
+        except Exception:
+            logger.exception("Shared quota counter failed")
+            return 0
+        wait = self._shared_wait(count, lane)
+        if wait:
+            try:
+                await shared.adecr(key)
+            except Exception:
+                logger.exception("Shared quota counter failed")
+        return wait
+
+    def _finish(self, lane: str, granted: bool) -> bool:
+        with self._lock:
+            self.waiting[lane] -= 1
+            (self.granted if granted else self.rejected)[lane] += 1
+        return granted
+
+    def acquire(self, lane: Optional[str] = None) -> bool:
+        """Xin phép cho một lời gọi upstream; chờ tối đa theo lane, `False` nếu hết hạn mức."""
+        lane = lane or current_lane()
+        deadline = time.monotonic() + self._timeout_for(lane)
+        with self._lock:
+            self.waiting[lane] += 1
+        while True:
+            wait = self._try_local(lane)
+            if wait == 0:
+                wait = self._take_shared(lane)
+                if wait == 0:
+                    return self._finish(lane, True)
+                self._give_back_local()
+            if time.monotonic() + wait > deadline:
+                return self._finish(lane, False)
+            time.sleep(wait)
+
+    async def aacquire(self, lane: Optional[str] = None) -> bool:
+        """Phiên bản async của `acquire` (chờ bằng `asyncio.sleep`)."""
+        lane = lane or current_lane()
+        deadline = time.monotonic() + self._timeout_for(lane)
+        with self._lock:
+            self.waiting[lane] += 1
+        while True:
+            wait = self._try_local(lane)
+            if wait == 0:
+                wait = await self._atake_shared(lane)
+                if wait == 0:
+                    return self._finish(lane, True)
+                self._give_back_local()
+            if time.monotonic() + wait > deadline:
+                return self._finish(lane, False)
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            local_tokens = self.bucket.available()
+            stats = {
+                'calls_per_minute': self.calls_per_minute,
+                'local_tokens': round(local_tokens, 2),
+                'local_capacity': self.bucket.capacity,
+                'queue_depth': dict(self.waiting),
+                'granted': dict(self.granted),
+                'rejected': dict(self.rejected),
+                'shared_remaining': None,
+            }
+        if self.alias is not None:
+            try:
+                used = caches[self.alias].get(self._shared_key(int(time.time() // 60)), 0)
+                stats['shared_remaining'] = max(0, self.calls_per_minute - used)
+            except Exception:
+                logger.exception("Shared quota counter read failed")
+        return stats
+
+
+_quota_manager: Optional[QuotaManager] = None
+_quota_manager_lock = threading.Lock()
+
+
+def get_quota_manager() -> QuotaManager:
+    """Trả về bộ quản lý hạn mức dùng chung của process."""
+    global _quota_manager
+    if _quota_manager is None:
+        with _quota_manager_lock:
+            if _quota_manager is None:
+                _quota_manager = QuotaManager(
+                    calls_per_minute=getattr(settings, 'WEATHER_QUOTA_CALLS_PER_MINUTE', 60),
+                    burst=getattr(settings, 'WEATHER_QUOTA_BURST', None),
+                    interactive_reserve=getattr(settings, 'WEATHER_QUOTA_INTERACTIVE_RESERVE', 0.2),
+                    wait_timeout=getattr(settings, 'WEATHER_QUOTA_WAIT_TIMEOUT', 2.0),
+                    background_wait_timeout=getattr(settings, 'WEATHER_QUOTA_BACKGROUND_WAIT_TIMEOUT', 0),
+                    alias=getattr(settings, 'WEATHER_CACHE_ALIAS', None),
+                )
+    return _quota_manager
+
+
+@receiver(setting_changed)
+def _reset_quota_manager_on_setting_change(sender, setting, **kwargs):
+    global _quota_manager
+    if setting.startswith('WEATHER_QUOTA') or setting == 'WEATHER_CACHE_ALIAS':
+        _quota_manager = None
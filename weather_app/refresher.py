@@ -0,0 +1,161 @@
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from .cache import stored_forecast_ttl
+from .models import City, ForecastRun, LatestObservation, RefreshCycle, SearchHistory, UserFavoriteLocation
+from .quota import BACKGROUND, quota_lane
+from .services import GROUP_SIZE, WeatherService
+
+logger = logging.getLogger(__name__)
+
+
+def rank_cities(
+    limit: int,
+    search_window: timedelta,
+    favorite_weight: float = 5,
+    now: Optional[datetime] = None,
+) -> List[int]:
+    """Id các City được quan tâm nhiều nhất: số người đặt làm yêu thích (nhân `favorite_weight`)
+    cộng số lượt tìm kiếm khớp City trong `search_window` gần nhất."""
+    now = now or timezone.now()
+    scores = Counter()
+    favorites = UserFavoriteLocation.objects.values_list('city_id').annotate(count=Count('id')).order_by()
+    for city_id, count in favorites:
+        scores[city_id] += count * favorite_weight
+    searches = (
+        SearchHistory.objects.filter(searched_at__gte=now - search_window, matched_city__isnull=False)
+        .values_list('matched_city_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for city_id, count in searches:
+        scores[city_id] += count
+    return [city_id for city_id, _ in scores.most_common(limit)]
+
+
+def _current_expires_at(latest: Optional[LatestObservation]) -> Optional[datetime]:
+    if latest is None:
+        return None
+    return latest.observed_at + timedelta(seconds=getattr(settings, 'WEATHER_CACHE_CURRENT_REFRESH', 600))
+
+
+@dataclass
+class RefreshPlan:
+    """Các City cần làm mới trong một vòng, đã cắt theo ngân sách lời gọi."""
+
+    groups: List[List[City]] = field(default_factory=list)
+    current_by_coord: List[City] = field(default_factory=list)
+    forecasts: List[City] = field(default_factory=list)
+    deferred: int = 0
+
+    @property
+    def calls(self) -> int:
+        return len(self.groups) + len(self.current_by_coord) + len(self.forecasts)
+
+
+def plan_refresh(city_ids: List[int], lead: float, budget: int, now: Optional[datetime] = None) -> RefreshPlan:
+    """Chọn (theo thứ tự `city_ids`) thời tiết hiện tại/dự báo sẽ hết hạn trong `lead` giây tới, tối đa `budget` lời gọi.
+
+    Thời tiết hiện tại của City có OpenWeather id được gom `GROUP_SIZE` City vào một lời gọi `/group`.
+    """
+    now = now or timezone.now()
+    deadline = now + timedelta(seconds=lead)
+    cities = City.objects.in_bulk(city_ids)
+    latest = LatestObservation.objects.in_bulk(city_ids)
+    runs = ForecastRun.objects.in_bulk(city_ids)
+
+    plan = RefreshPlan()
+    for city_id in city_ids:
+        city_obj = cities.get(city_id)
+        if city_obj is None:
+            continue
+        expires_at = _current_expires_at(latest.get(city_id))
+        if expires_at is None or expires_at <= deadline:
+            if city_obj.openweather_id is not None and plan.groups and len(plan.groups[-1]) < GROUP_SIZE:
+                plan.groups[-1].append(city_obj)
+            elif plan.calls < budget:
+                if city_obj.openweather_id is not None:
+                    plan.groups.append([city_obj])
+                else:
+                    plan.current_by_coord.append(city_obj)
+            else:
+                plan.deferred += 1
+
+        run = runs.get(city_id)
+        ttl = stored_forecast_ttl(run.fetched_at, run.next_step_at) if run is not None else None
+        if ttl is None or ttl <= lead:
+            if plan.calls < budget:
+                plan.forecasts.append(city_obj)
+            else:
+                plan.deferred += 1
+    return plan
+
+
+def cycle_budget(interval: float, quota_share: float) -> int:
+    """Số lời gọi OpenWeather tối đa của một vòng: `quota_share` hạn mức trong `interval` giây."""
+    calls_per_minute = getattr(settings, 'WEATHER_QUOTA_CALLS_PER_MINUTE', 60)
+    return max(1, int(calls_per_minute * quota_share * interval / 60))
+
+
+def refresh_cycle(
+    top_n: Optional[int] = None,
+    interval: Optional[float] = None,
+    lead: Optional[float] = None,
+    quota_share: Optional[float] = None,
+) -> RefreshCycle:
+    """Một vòng làm mới: xếp hạng City, gọi API (lane BACKGROUND, trong ngân sách), ghi DB theo lô và lưu thời gian từng bước."""
+    top_n = top_n or settings.WEATHER_REFRESH_TOP_N
+    interval = interval or settings.WEATHER_REFRESH_INTERVAL
+    lead = settings.WEATHER_REFRESH_LEAD_SECONDS if lead is None else lead
+    quota_share = settings.WEATHER_REFRESH_QUOTA_SHARE if quota_share is None else quota_share
+    concurrency = getattr(settings, 'WEATHER_BATCH_CONCURRENCY', 8)
+
+    started = time.monotonic()
+    cycle = RefreshCycle(started_at=timezone.now())
+
+    city_ids = rank_cities(
+        top_n,
+        timedelta(hours=settings.WEATHER_REFRESH_SEARCH_WINDOW_HOURS),
+        settings.WEATHER_REFRESH_FAVORITE_WEIGHT,
+        now=cycle.started_at,
+    )
+    plan = plan_refresh(city_ids, lead, cycle_budget(interval, quota_share), now=cycle.started_at)
+    cycle.ranked = len(city_ids)
+    cycle.deferred = plan.deferred
+    cycle.upstream_calls = plan.calls
+    cycle.rank_seconds = time.monotonic() - started
+
+    # Nhường request của người dùng; chờ tới lượt trong hạn mức thay vì bỏ lời gọi
+    with quota_lane(BACKGROUND, wait_timeout=settings.WEATHER_REFRESH_QUOTA_WAIT):
+        current = WeatherService.refresh_current_weather(
+            [city_obj for group in plan.groups for city_obj in group] + plan.current_by_coord, concurrency,
+        )
+        forecasts = WeatherService.refresh_forecasts(plan.forecasts, concurrency)
+
+    cycle.fetch_seconds = current.fetch_seconds + forecasts.fetch_seconds
+    cycle.write_seconds = current.write_seconds + forecasts.write_seconds
+    cycle.current_refreshed = current.refreshed
+    cycle.forecast_refreshed = forecasts.refreshed
+    cycle.failed = current.failed + forecasts.failed
+    cycle.total_seconds = time.monotonic() - started
+    cycle.save()
+    RefreshCycle.objects.filter(
+        started_at__lt=cycle.started_at - timedelta(days=settings.WEATHER_REFRESH_KEEP_DAYS)
+    ).delete()
+    return cycle
+
+
+def last_refresh_cycle() -> Optional[dict]:
+    """Vòng làm mới gần nhất (cho endpoint thống kê), None nếu job chưa chạy."""
+    cycle = RefreshCycle.objects.order_by('-started_at').values().first()
+    if cycle is not None:
+        cycle['started_at'] = cycle['started_at'].astimezone(dt_timezone.utc).isoformat()
+    return cycle
@@ -0,0 +1,232 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, FloatField, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .ingest import bulk_upsert
+from .models import RollupCheckpoint, WeatherData, WeatherDataDaily, WeatherDataHourly
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_CHECKPOINT = 'weather_data_rollup'
+
+# (field của WeatherData, field min / max / trung bình trong bảng tổng hợp)
+ROLLUP_METRICS = [
+    ('temperature_c', 'temp_min_c', 'temp_max_c', 'temp_avg_c'),
+    ('humidity_pct', 'humidity_min_pct', 'humidity_max_pct', 'humidity_avg_pct'),
+    ('pressure_hpa', 'pressure_min_hpa', 'pressure_max_hpa', 'pressure_avg_hpa'),
+    ('wind_speed_ms', 'wind_speed_min_ms', 'wind_speed_max_ms', 'wind_speed_avg_ms'),
+]
+
+ROLLUP_UPDATE_FIELDS = ['sample_count', 'updated_at'] + [
+    name for _, *names in ROLLUP_METRICS for name in names
+]
+
+
+def observation_aggregates() -> dict:
+    """Biểu thức GROUP BY trên WeatherData cho các field của bảng tổng hợp."""
+    aggregates = {'sample_count': Count('id')}
+    for raw, min_name, max_name, avg_name in ROLLUP_METRICS:
+        aggregates[min_name] = Min(raw)
+        aggregates[max_name] = Max(raw)
+        aggregates[avg_name] = Avg(raw, output_field=FloatField())
+    return aggregates
+
+
+def _daily_aggregates() -> dict:
+    # Trung bình theo ngày = trung bình các giờ, có trọng số theo số quan trắc của mỗi giờ
+    aggregates = {'sample_count': Sum('sample_count')}
+    for _, min_name, max_name, avg_name in ROLLUP_METRICS:
+        aggregates[min_name] = Min(min_name)
+        aggregates[max_name] = Max(max_name)
+        aggregates[avg_name] = Sum(F(avg_name) * F('sample_count'), output_field=FloatField()) / Sum('sample_count')
+    return aggregates
+
+
+def _rebuild(model, queryset, time_field: str, trunc, ranges: list, aggregates: dict) -> int:
+    """Tính lại mọi khung của từng (city_id, start, end) trong `ranges` bằng GROUP BY trong DB rồi upsert vào `model`."""
+    condition = Q()
+    for city_id, start, end in ranges:
+        condition |= Q(city_id=city_id, **{f'{time_field}__gte': start, f'{time_field}__lt': end})
+    rows = (
+        queryset.filter(condition)
+        .annotate(bucket=trunc)
+        .values('city_id', 'bucket')
+        # Đặt tên khác field của model để tổng hợp theo ngày vẫn tham chiếu được cột của bảng theo giờ
+        .annotate(**{f'rollup_{name}': expression for name, expression in aggregates.items()})
+        .order_by()
+    )
+    now = timezone.now()
+    objs = []
+    for row in rows:
+        fields = {name: row[f'rollup_{name}'] for name in aggregates}
+        for _, _, _, avg_name in ROLLUP_METRICS:
+            fields[avg_name] = round(float(fields[avg_name]), 2)
+        objs.append(model(city_id=row['city_id'], bucket_start=row['bucket'], updated_at=now, **fields))
+    bulk_upsert(model, objs, ['city', 'bucket_start'], ROLLUP_UPDATE_FIELDS, batch_size=500)
+    return len(objs)
+
+
+def floor_hour(value: datetime) -> datetime:
+    """Đầu giờ (UTC) chứa `value`."""
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value: datetime) -> datetime:
+    """Đầu ngày (UTC) chứa `value`."""
+    return floor_hour(value).replace(hour=0)
+
+
+def touched_days(queryset) -> list:
+    """Các ngày (UTC) có dòng trong `queryset`, gộp ngày liền nhau của cùng City: [(city_id, đầu ngày, hết ngày)]."""
+    days = (
+        queryset.annotate(day=TruncDay('observed_at', tzinfo=dt_timezone.utc))
+        .values_list('city_id', 'day')
+        .distinct()
+        .order_by('city_id', 'day')
+    )
+    ranges = []
+    for city_id, day in days.iterator(chunk_size=5000):
+        if ranges and ranges[-1][0] == city_id and ranges[-1][2] == day:
+            ranges[-1][2] = day + timedelta(days=1)
+        else:
+            ranges.append([city_id, day, day + timedelta(days=1)])
+    return [tuple(item) for item in ranges]
+
+
+def without_pruned_days(ranges: list) -> list:
+    """Bỏ khỏi `ranges` (như `touched_days`) những ngày đã bị xóa dữ liệu gốc (`WeatherDataDaily.raw_pruned`).
+
+    Dòng gốc còn lại của những ngày này chỉ là dòng tới muộn: tính lại từ chúng sẽ thay tổng hợp của cả ngày
+    bằng tổng hợp của vài dòng, nên dòng tổng hợp đã có được giữ nguyên.
+    """
+    if not ranges:
+        return ranges
+    condition = Q()
+    for city_id, start, end in ranges:
+        condition |= Q(city_id=city_id, bucket_start__gte=start, bucket_start__lt=end)
+    pruned = set(WeatherDataDaily.objects.filter(condition, raw_pruned=True).values_list('city_id', 'bucket_start'))
+    if not pruned:
+        return ranges
+    kept = []
+    for city_id, start, end in ranges:
+        day = start
+        while day < end:
+            if (city_id, day) not in pruned:
+                if kept and kept[-1][0] == city_id and kept[-1][2] == day:
+                    kept[-1][2] = day + timedelta(days=1)
+                else:
+                    kept.append([city_id, day, day + timedelta(days=1)])
+            day += timedelta(days=1)
+    return [tuple(item) for item in kept]
+
+
+def rollup_weather_data(now: Optional[datetime] = None, chunk_size: int = 500) -> dict:
+    """Cập nhật bảng tổng hợp theo giờ/ngày từ các WeatherData được ghi (thêm hoặc ghi đè) kể từ lần chạy trước.
+
+    Chỉ những ngày (UTC) của từng City có dòng được ghi (theo `updated_at`, tới `now - WEATHER_ROLLUP_LAG_SECONDS`
+    để không bỏ sót transaction commit muộn) được tính lại từ đầu, nên chạy lại nhiều lần vẫn cho cùng kết quả.
+    Mỗi truy vấn tính lại tối đa `chunk_size` khoảng ngày.
+    """
+    now = now or timezone.now()
+    end = now - timedelta(seconds=settings.WEATHER_ROLLUP_LAG_SECONDS)
+    checkpoint = RollupCheckpoint.objects.filter(name=ROLLUP_CHECKPOINT).first()
+    if checkpoint is None:
+        # Lần chạy đầu tổng hợp mọi dòng, kể cả dòng cũ chưa có `updated_at`
+        touched = WeatherData.objects.filter(Q(updated_at__lt=end) | Q(updated_at__isnull=True))
+    else:
+        # `updated_at` NULL không thỏa điều kiện: dòng cũ chưa backfill coi như đã được tổng hợp
+        touched = WeatherData.objects.filter(updated_at__gte=checkpoint.position, updated_at__lt=end)
+    ranges = touched_days(touched)
+
+    stats = {'cities': len({city_id for city_id, _, _ in ranges}), 'hourly': 0, 'daily': 0}
+    utc = dt_timezone.utc
+    for i in range(0, len(ranges), chunk_size):
+        chunk = without_pruned_days(ranges[i:i + chunk_size])
+        if not chunk:
+            continue
+        stats['hourly'] += _rebuild(
+            WeatherDataHourly, WeatherData.objects, 'observed_at', TruncHour('observed_at', tzinfo=utc),
+            chunk, observation_aggregates(),
+        )
+        stats['daily'] += _rebuild(
+            WeatherDataDaily, WeatherDataHourly.objects, 'bucket_start', TruncDay('bucket_start', tzinfo=utc),
+            chunk, _daily_aggregates(),
+        )
+
+    RollupCheckpoint.objects.update_or_create(name=ROLLUP_CHECKPOINT, defaults={'position': end})
+    return stats
+
+
+def rollup_position() -> Optional[datetime]:
+    """Các WeatherData có `updated_at` trước mốc này đã được tổng hợp (None nếu job chưa chạy lần nào)."""
+    return RollupCheckpoint.objects.filter(name=ROLLUP_CHECKPOINT).values_list('position', flat=True).first()
+
+
+def delete_in_batches(queryset, batch_size: int = 1000, sleep: float = 0) -> int:
+    """Xóa các dòng của `queryset` theo lô `batch_size` khóa chính (cũ nhất trước).
+
+    Mỗi lô là một câu DELETE ngắn theo khóa chính nên không giữ khóa lâu trên bảng lớn;
+    `sleep` giây nghỉ giữa các lô để nhường chỗ cho luồng ghi và replication.
+    """
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += model.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted
+        if sleep:
+            time.sleep(sleep)
+
+
+def prune_weather_data(
+    raw_days: Optional[int] = None,
+    hourly_days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    sleep: Optional[float] = None,
+    now: Optional[datetime] = None,
+) -> dict:
+    """Xóa WeatherData cũ hơn `raw_days` ngày và bảng theo giờ cũ hơn `hourly_days` ngày (0 = giữ tất cả).
+
+    WeatherData chỉ bị xóa khi đã được tổng hợp (ghi trước checkpoint của `rollup_weather_data`, và ngày của nó
+    không còn dòng nào chờ tổng hợp); ngày đã xóa được đánh dấu `raw_pruned` để không bị tính lại. Mốc xóa được làm tròn xuống đầu ngày (UTC) để không còn giờ/ngày nào chỉ
+    còn một phần dữ liệu gốc: khi tính lại, khung đó hoặc còn đủ dòng hoặc không còn dòng nào (và dòng tổng hợp
+    cũ được giữ nguyên).
+    """
+    now = now or timezone.now()
+    raw_days = settings.WEATHER_RETENTION_RAW_DAYS if raw_days is None else raw_days
+    hourly_days = settings.WEATHER_RETENTION_HOURLY_DAYS if hourly_days is None else hourly_days
+    batch_size = batch_size or settings.WEATHER_RETENTION_BATCH_SIZE
+    sleep = settings.WEATHER_RETENTION_BATCH_SLEEP if sleep is None else sleep
+
+    stats = {'raw': 0, 'hourly': 0}
+    position = rollup_position()
+    if raw_days and position is not None:
+        cutoff = floor_day(now - timedelta(days=raw_days))
+        prunable = WeatherData.objects.filter(
+            Q(updated_at__lt=position) | Q(updated_at__isnull=True), observed_at__lt=cutoff,
+        )
+        pruned_days = WeatherDataDaily.objects.filter(bucket_start__lt=cutoff, raw_pruned=False)
+        # Ngày còn dòng được ghi sau checkpoint sẽ được tính lại từ đầu: giữ nguyên cả ngày tới lần tổng hợp sau
+        for city_id, start, end in touched_days(WeatherData.objects.filter(observed_at__lt=cutoff, updated_at__gte=position)):
+            prunable = prunable.exclude(city_id=city_id, observed_at__gte=start, observed_at__lt=end)
+            pruned_days = pruned_days.exclude(city_id=city_id, bucket_start__gte=start, bucket_start__lt=end)
+        # Đánh dấu trước khi xóa để lần tổng hợp chạy song song không tính lại ngày chỉ còn một phần dòng gốc
+        pruned_days.update(raw_pruned=True)
+        stats['raw'] = delete_in_batches(prunable, batch_size, sleep)
+    elif raw_days:
+        logger.warning("Skipping WeatherData pruning: rollups have never run")
+    if hourly_days:
+        stats['hourly'] = delete_in_batches(
+            WeatherDataHourly.objects.filter(bucket_start__lt=floor_day(now - timedelta(days=hourly_days))),
+            batch_size, sleep,
+        )
+    return stats
@@ -1,18 +1,54 @@
+import contextvars
 import logging
-from datetime import datetime, time as dt_time, timezone as dt_timezone
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
 from typing import Optional
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.conf import settings
-from django.urls import reverse
-import requests
+
 from django.conf import settings
+from django.db.models import F
 
-from .models import City, WeatherData, WeatherForecast, SearchHistory, UserFavoriteLocation
+from .aggregation import daily_forecast_rows, resolve_timezone
+from .aliases import get_alias_index
+from .cache import (
+    city_cache_key, current_weather_is_fresh, current_weather_ttl, forecast_ttl, get_weather_cache, stored_forecast_ttl,
+)
+from .cities import get_city_cache
+from .history import get_history_buffer
+from .ingest import store_forecasts, store_observations
+from .models import City, ForecastRun, ForecastStep, LatestObservation, WeatherData, WeatherForecast, SearchHistory, UserFavoriteLocation
+from .observations import observation_history
+from .singleflight import get_single_flight
+from .spatial import get_spatial_index
+from .upstream import UpstreamUnavailable, get_client, get_executor
+from .utils import normalize_query
 
 logger = logging.getLogger(__name__)
 
+# Số City tối đa trong một lời gọi `/group` của OpenWeather
+GROUP_SIZE = 20
+
+
+@dataclass
+class WeatherTarget:
+    """Đích tra cứu thời tiết: khóa cache, tham số gọi API và `City` nếu đã biết trước."""
+
+    key: str
+    params: dict
+    city: Optional[City] = None
+    query: Optional[str] = None
+
+
+@dataclass
+class CityRefresh:
+    """Kết quả làm mới thời tiết của một nhóm City (số City đã làm mới/lỗi và thời gian gọi API/ghi)."""
+
+    refreshed: int = 0
+    failed: int = 0
+    fetch_seconds: float = 0.0
+    write_seconds: float = 0.0
+
 
 class WeatherService:
     """Service xử lý logic nghiệp vụ thời tiết"""
@@ -24,196 +60,922 @@ class WeatherService:
         latitude: float,
         longitude: float,
         timezone_name: Optional[str] = None,
+        openweather_id: Optional[int] = None,
     ) -> City:
         """Lấy hoặc tạo `City` từ dữ liệu API.
 
-        Ưu tiên nhận diện theo bộ (name, country_code, latitude, longitude) do ràng buộc unique_together.
+        Nhận diện theo OpenWeather city id, sau đó theo bộ (name, country_code, latitude, longitude)
+        do ràng buộc unique_together; City đã gặp được lấy từ cache trong process (`cities.py`).
         """
-        city_obj, _ = City.objects.get_or_create(
-            name=name,
-            country_code=country_code,
-            latitude=latitude,
-            longitude=longitude,
-            defaults={"timezone_name": timezone_name},
-        )
-        return city_obj
+        return get_city_cache().resolve(name, country_code, latitude, longitude, timezone_name, openweather_id)
     
+    @staticmethod
+    def _coord_params(city_obj: City) -> dict:
+        return {'lat': float(city_obj.latitude), 'lon': float(city_obj.longitude)}
+
+    @staticmethod
+    def city_target(city_obj: City) -> WeatherTarget:
+        return WeatherTarget(city_cache_key(city_obj.pk), WeatherService._coord_params(city_obj), city_obj)
+
+    @staticmethod
+    def resolve_target(query: str) -> WeatherTarget:
+        """Xác định đích cho chuỗi tìm kiếm qua chỉ mục alias.
+
+        Chuỗi đã biết trỏ thẳng tới City (khóa cache theo City, gọi API theo tọa độ);
+        chuỗi mới đi qua geocode của OpenWeather (`q=`) và sẽ được ghi nhớ sau khi có kết quả.
+        """
+        city_obj = get_alias_index().resolve(query)
+        if city_obj is not None:
+            target = WeatherService.city_target(city_obj)
+            target.query = query
+            return target
+        return WeatherTarget(normalize_query(query), {'q': query}, None, query)
+
+    @staticmethod
+    def coord_target(latitude: float, longitude: float) -> WeatherTarget:
+        """Xác định đích cho tọa độ GPS.
+
+        Tọa độ được làm tròn về ô lưới `WEATHER_COORD_GRID_DEG` để mọi người dùng trong cùng ô
+        dùng chung một lời gọi API và một entry cache; nếu có City trong bán kính `WEATHER_COORD_MATCH_KM`
+        thì dùng luôn đích của City đó.
+        """
+        grid = settings.WEATHER_COORD_GRID_DEG
+        lat = round(round(latitude / grid) * grid, 4)
+        lon = round(round(longitude / grid) * grid, 4)
+        query = f"{lat:.4f},{lon:.4f}"
+        city_obj = get_spatial_index().nearest_city(lat, lon, max_km=settings.WEATHER_COORD_MATCH_KM)
+        if city_obj is not None:
+            target = WeatherService.city_target(city_obj)
+            target.query = query
+            return target
+        return WeatherTarget(f"coord:{query}", {'lat': lat, 'lon': lon}, None, None)
+
+    @staticmethod
+    def resolve_city(query: str) -> Optional[City]:
+        """`City` tương ứng chuỗi tìm kiếm (nếu đã biết), dùng cho `SearchHistory.matched_city`."""
+        return get_alias_index().resolve(query)
+
+    @staticmethod
+    def _remember_city(target: WeatherTarget, city_obj: City, kind: str, payload, ttl: int):
+        """Sau khi API xác định được City cho chuỗi mới: ghi alias và cache thêm theo khóa City."""
+        if target.city is not None:
+            return
+        try:
+            get_alias_index().learn(city_obj, target.query)
+        except Exception:
+            logger.exception("Error saving city alias")
+        get_weather_cache().set(kind, city_cache_key(city_obj.pk), payload, ttl)
+
     @staticmethod
     def get_current_weather(city):
-        """Lấy thời tiết hiện tại từ API"""
+        """Lấy thời tiết hiện tại (đọc qua cache, chỉ gọi API khi miss)."""
+        return WeatherService.get_current_weather_for(WeatherService.resolve_target(city))
+
+    @staticmethod
+    def get_current_weather_for(target: WeatherTarget):
+        cache = get_weather_cache()
+        key = target.key
+        cached = cache.get('current', key)
+        if cached is not None:
+            return cached
+
+        def refresh():
+            data, ttl = WeatherService._fetch_current_weather(target)
+            if data is not None:
+                cache.set('current', key, data, ttl)
+            return data
+
+        # Các request đồng thời cho cùng thành phố chỉ tạo một lời gọi API và một lần ghi DB
+        return get_single_flight().do(f"current:{key}", refresh, recheck=lambda: cache.peek('current', key))
+
+    @staticmethod
+    def _fetch_current_weather(target: WeatherTarget):
+        """Lấy thời tiết hiện tại từ API, trả về (payload, ttl cache).
+
+        City đã biết có quan trắc mới nhất còn mới (trong LatestObservation) thì trả luôn, không gọi API.
+        Khi OpenWeather bị ngắt mạch: trả quan trắc gần nhất đã lưu (không cache), hoặc raise `UpstreamUnavailable`.
+        """
+        stored = WeatherService._stored_current(target.city)
+        if stored is not None:
+            return stored
         try:
-            url = f"{settings.WEATHER_API_URL}/weather"
-            params = {
-                'q': city,
-                'appid': settings.WEATHER_API_KEY,
-                'units': 'metric'
-            }
-            response = requests.get(url, params=params, timeout=10)
+            data = WeatherService._request_json('weather', target.params)
             
-            if response.status_code == 200:
-                data = response.json()
-                # Tạo/tìm City
-                city_obj = WeatherService._get_or_create_city(
-                    name=data['name'],
-                    country_code=data['sys']['country'],
-                    latitude=data['coord']['lat'],
-                    longitude=data['coord']['lon'],
-                )
-
-                # Thời điểm quan trắc theo UTC từ API
-                observed_at = datetime.fromtimestamp(data.get('dt', int(datetime.now(tz=dt_timezone.utc).timestamp())), tz=dt_timezone.utc)
-
-                # Map đúng field theo model WeatherData
-                weather_record_fields = {
-                    'city': city_obj,
-                    'observed_at': observed_at,
-                    'temperature_c': data['main']['temp'],
-                    'humidity_pct': data['main']['humidity'],
-                    'pressure_hpa': data['main']['pressure'],
-                    'wind_speed_ms': data['wind'].get('speed', 0),
-                    'description': data['weather'][0]['description'],
-                    'icon_code': data['weather'][0]['icon'],
-                    'source': 'openweather',
-                }
-
-                WeatherData.objects.create(**weather_record_fields)
-
-                # Trả về gói dữ liệu thân thiện cho UI
-                return {
-                    'city': f"{city_obj.name}, {city_obj.country_code}",
-                    'observed_at': observed_at.isoformat(),
-                    'temperature_c': weather_record_fields['temperature_c'],
-                    'humidity_pct': weather_record_fields['humidity_pct'],
-                    'pressure_hpa': weather_record_fields['pressure_hpa'],
-                    'wind_speed_ms': weather_record_fields['wind_speed_ms'],
-                    'description': weather_record_fields['description'],
-                    'icon_code': weather_record_fields['icon_code'],
-                }
+            if data is not None:
+                city_obj = target.city or WeatherService._get_or_create_city(**WeatherService._current_city_fields(data))
+                payload, ttl = WeatherService._store_current_weather(data, city_obj=city_obj)
+                WeatherService._remember_city(target, city_obj, 'current', payload, ttl)
+                return payload, ttl
             else:
-                return None
-        except Exception as e:
+                return None, 0
+        except UpstreamUnavailable:
+            stale = WeatherService._last_known_current(target.city)
+            if stale is None:
+                raise
+            return stale, 0
+        except Exception:
             logger.exception("Error fetching weather data")
+            return None, 0
+
+    @staticmethod
+    def _stored_current(city_obj: Optional[City]):
+        """(payload, ttl) từ LatestObservation nếu quan trắc còn mới, nếu không thì None."""
+        if city_obj is None:
+            return None
+        latest = LatestObservation.objects.filter(city=city_obj).first()
+        if latest is None or not current_weather_is_fresh(latest.observed_at):
+            return None
+        return WeatherService._current_weather_payload(city_obj, WeatherService._record_fields(latest))
+
+    @staticmethod
+    def _stale_current_payload(city_obj: City, record: LatestObservation) -> dict:
+        payload, _ = WeatherService._current_weather_payload(city_obj, WeatherService._record_fields(record))
+        payload['stale'] = True
+        return payload
+
+    @staticmethod
+    def _last_known_current(city_obj: Optional[City]):
+        """Quan trắc gần nhất đã lưu của City (đánh dấu `stale`), dùng khi không gọi được OpenWeather."""
+        if city_obj is None:
+            return None
+        record = LatestObservation.objects.filter(city=city_obj).first()
+        if record is None:
+            return None
+        return WeatherService._stale_current_payload(city_obj, record)
+
+    @staticmethod
+    def _last_known_forecasts_queryset(city_obj: City):
+        """Dự báo từ hôm nay trở đi của lần lấy gần nhất (ForecastRun), để không lẫn dòng của các lần lấy cũ."""
+        today = datetime.combine(datetime.now(tz=dt_timezone.utc).date(), dt_time(tzinfo=dt_timezone.utc))
+        return WeatherForecast.objects.filter(
+            city=city_obj, fetched_at=F('city__forecast_run__fetched_at'), forecast_time__gte=today,
+        ).order_by('forecast_time')[:5]
+
+    @staticmethod
+    def _forecast_fields(record: WeatherForecast) -> dict:
+        return {
+            'forecast_time': record.forecast_time,
+            'temp_min_c': float(record.temp_min_c),
+            'temp_max_c': float(record.temp_max_c),
+            'precipitation_probability_pct': record.precipitation_probability_pct,
+            'description': record.description,
+            'icon_code': record.icon_code,
+        }
+
+    @staticmethod
+    def _stale_forecast_payload(city_obj: City, records) -> list:
+        rows = [WeatherService._forecast_fields(record) for record in records]
+        payload, _ = WeatherService._forecast_payload(city_obj, rows, None)
+        for item in payload:
+            item['stale'] = True
+        return payload
+
+    @staticmethod
+    def _stored_forecast(city_obj: Optional[City]):
+        """(payload, ttl) từ lần lấy dự báo gần nhất đã lưu nếu còn mới (`WEATHER_FORECAST_FRESHNESS_SECONDS`
+        và chưa qua mốc 3h kế tiếp), nếu không thì None."""
+        if city_obj is None:
             return None
+        run = ForecastRun.objects.filter(city=city_obj).first()
+        ttl = stored_forecast_ttl(run.fetched_at, run.next_step_at) if run is not None else None
+        if ttl is None:
+            return None
+        records = WeatherForecast.objects.filter(city=city_obj, fetched_at=run.fetched_at).order_by('forecast_time')
+        rows = [WeatherService._forecast_fields(record) for record in records]
+        if not rows:
+            return None
+        payload, _ = WeatherService._forecast_payload(city_obj, rows, run.next_step_at)
+        return payload, ttl
+
+    @staticmethod
+    def _last_known_forecast(city_obj: Optional[City]) -> list:
+        """Dự báo đã lưu từ hôm nay trở đi (đánh dấu `stale`), dùng khi không gọi được OpenWeather."""
+        if city_obj is None:
+            return []
+        records = WeatherService._last_known_forecasts_queryset(city_obj)
+        return WeatherService._stale_forecast_payload(city_obj, records)
+
+    @staticmethod
+    def _record_fields(record) -> dict:
+        """Field của một dòng WeatherData/LatestObservation theo cùng dạng `_parse_current_weather` trả về (Decimal -> float)."""
+        return {
+            'observed_at': record.observed_at,
+            'temperature_c': float(record.temperature_c),
+            'humidity_pct': record.humidity_pct,
+            'pressure_hpa': record.pressure_hpa,
+            'wind_speed_ms': float(record.wind_speed_ms),
+            'description': record.description,
+            'icon_code': record.icon_code,
+            'source': record.source,
+        }
+
+    @staticmethod
+    def _current_city_fields(data: dict) -> dict:
+        return {
+            'name': data['name'],
+            'country_code': data['sys']['country'],
+            'latitude': data['coord']['lat'],
+            'longitude': data['coord']['lon'],
+            'openweather_id': data.get('id') or None,
+        }
+
+    @staticmethod
+    def _forecast_city_fields(data: dict) -> dict:
+        city_payload = data['city']
+        return {
+            'name': city_payload['name'],
+            'country_code': city_payload['country'],
+            'latitude': city_payload['coord']['lat'],
+            'longitude': city_payload['coord']['lon'],
+            'openweather_id': city_payload.get('id') or None,
+        }
+
+    @staticmethod
+    def _parse_current_weather(data: dict):
+        """Tách payload `/weather` thành (thông tin City, field của WeatherData) - không chạm DB."""
+        city_fields = WeatherService._current_city_fields(data)
+
+        # Thời điểm quan trắc theo UTC từ API
+        observed_at = datetime.fromtimestamp(data.get('dt', int(datetime.now(tz=dt_timezone.utc).timestamp())), tz=dt_timezone.utc)
+
+        # Map đúng field theo model WeatherData
+        weather_record_fields = {
+            'observed_at': observed_at,
+            'temperature_c': data['main']['temp'],
+            'humidity_pct': data['main']['humidity'],
+            'pressure_hpa': data['main']['pressure'],
+            'wind_speed_ms': data['wind'].get('speed', 0),
+            'description': data['weather'][0]['description'],
+            'icon_code': data['weather'][0]['icon'],
+            'source': 'openweather',
+        }
+        return city_fields, weather_record_fields
+
+    @staticmethod
+    def _current_weather_payload(city_obj: City, weather_record_fields: dict):
+        """Gói dữ liệu thân thiện cho UI, kèm TTL cache."""
+        observed_at = weather_record_fields['observed_at']
+        payload = {
+            'city': f"{city_obj.name}, {city_obj.country_code}",
+            'observed_at': observed_at.isoformat(),
+            'temperature_c': weather_record_fields['temperature_c'],
+            'humidity_pct': weather_record_fields['humidity_pct'],
+            'pressure_hpa': weather_record_fields['pressure_hpa'],
+            'wind_speed_ms': weather_record_fields['wind_speed_ms'],
+            'description': weather_record_fields['description'],
+            'icon_code': weather_record_fields['icon_code'],
+        }
+        return payload, current_weather_ttl(observed_at)
+
+    @staticmethod
+    def _store_current_weather(data: dict, city_obj: Optional[City] = None):
+        """Lưu quan trắc từ payload `/weather`, trả về (payload, ttl cache).
+
+        `city_obj`: City đã xác định sẵn (bỏ qua bước tìm/tạo City).
+        """
+        city_fields, weather_record_fields = WeatherService._parse_current_weather(data)
+        if city_obj is None:
+            city_obj = WeatherService._get_or_create_city(**city_fields)
+        # Upsert idempotent: cùng `dt` trả về nhiều lần không lỗi, và không ghi lại nếu process đã ghi quan trắc này
+        store_observations([WeatherData(city=city_obj, **weather_record_fields)])
+        return WeatherService._current_weather_payload(city_obj, weather_record_fields)
     
     @staticmethod
     def get_weather_forecast(city: str):
-        """Lấy dự báo thời tiết (tổng hợp theo ngày từ API 3h/5 ngày)."""
+        """Lấy dự báo thời tiết theo ngày (đọc qua cache, chỉ gọi API khi miss)."""
+        return WeatherService.get_weather_forecast_for(WeatherService.resolve_target(city))
+
+    @staticmethod
+    def get_weather_forecast_for(target: WeatherTarget):
+        cache = get_weather_cache()
+        key = target.key
+        cached = cache.get('forecast', key)
+        if cached is not None:
+            return cached
+
+        def refresh():
+            items, ttl = WeatherService._fetch_weather_forecast(target)
+            if items:
+                cache.set('forecast', key, items, ttl)
+            return items
+
+        return get_single_flight().do(f"forecast:{key}", refresh, recheck=lambda: cache.peek('forecast', key))
+
+    @staticmethod
+    def _fetch_weather_forecast(target: WeatherTarget):
+        """Lấy dự báo thời tiết (tổng hợp theo ngày từ API 3h/5 ngày), trả về (payload, ttl cache).
+
+        City đã biết có lần lấy dự báo còn mới trong DB thì đọc lại các dòng đã lưu, không gọi API.
+        """
+        stored = WeatherService._stored_forecast(target.city)
+        if stored is not None:
+            return stored
         try:
-            url = f"{settings.WEATHER_API_URL}/forecast"
-            params = {
-                'q': city,
-                'appid': settings.WEATHER_API_KEY,
-                'units': 'metric'
-            }
-            response = requests.get(url, params=params, timeout=10)
+            data = WeatherService._request_json('forecast', target.params)
             
-            if response.status_code == 200:
-                data = response.json()
-                city_payload = data['city']
-                city_obj = WeatherService._get_or_create_city(
-                    name=city_payload['name'],
-                    country_code=city_payload['country'],
-                    latitude=city_payload['coord']['lat'],
-                    longitude=city_payload['coord']['lon'],
-                )
-                
-                forecast_data = []
-                daily_data = {}
-                
-                for item in data['list']:
-                    point_dt = datetime.fromtimestamp(item['dt'], tz=dt_timezone.utc)
-                    date_key = point_dt.date()
-                    temp_val = item['main']['temp']
-                    humidity_val = item['main'].get('humidity')
-                    pop_val = item.get('pop')  # 0..1
-                    description_val = item['weather'][0]['description']
-                    icon_val = item['weather'][0]['icon']
-
-                    if date_key not in daily_data:
-                        daily_data[date_key] = {
-                            'temps': [temp_val],
-                            'humidities': [h for h in [humidity_val] if h is not None],
-                            'pops': [p for p in [pop_val] if p is not None],
-                            'description_counts': {description_val: 1},
-                            'icon_counts': {icon_val: 1},
-                        }
-                    else:
-                        bucket = daily_data[date_key]
-                        bucket['temps'].append(temp_val)
-                        if humidity_val is not None:
-                            bucket['humidities'].append(humidity_val)
-                        if pop_val is not None:
-                            bucket['pops'].append(pop_val)
-                        bucket['description_counts'][description_val] = bucket['description_counts'].get(description_val, 0) + 1
-                        bucket['icon_counts'][icon_val] = bucket['icon_counts'].get(icon_val, 0) + 1
-                
-                # Tạo dữ liệu dự báo theo ngày (tối đa 5 ngày theo API này)
-                for date_key in sorted(daily_data.keys())[:5]:
-                    bucket = daily_data[date_key]
-
-                    # Chọn 12:00 UTC làm thời điểm đại diện
-                    forecast_time = datetime.combine(date_key, dt_time(hour=12, tzinfo=dt_timezone.utc))
-
-                    # Tính toán các đại lượng
-                    temp_min_c = min(bucket['temps'])
-                    temp_max_c = max(bucket['temps'])
-                    pop_pct = None
-                    if bucket['pops']:
-                        pop_pct = int(round(100 * (sum(bucket['pops']) / len(bucket['pops']))))
-
-                    # Chọn mô tả/icon phổ biến nhất
-                    description = max(bucket['description_counts'].items(), key=lambda kv: kv[1])[0]
-                    icon_code = max(bucket['icon_counts'].items(), key=lambda kv: kv[1])[0]
-
-                    defaults = {
-                        'temp_min_c': temp_min_c,
-                        'temp_max_c': temp_max_c,
-                        'precipitation_probability_pct': pop_pct,
-                        'description': description,
-                        'icon_code': icon_code,
-                        'source': 'openweather',
-                    }
-
-                    WeatherForecast.objects.update_or_create(
-                        city=city_obj,
-                        forecast_time=forecast_time,
-                        defaults=defaults,
-                    )
-
-                    forecast_data.append({
-                        'city': f"{city_obj.name}, {city_obj.country_code}",
-                        'forecast_time': forecast_time.isoformat(),
-                        'temp_min_c': temp_min_c,
-                        'temp_max_c': temp_max_c,
-                        'precipitation_probability_pct': pop_pct,
-                        'description': description,
-                        'icon_code': icon_code,
-                    })
-                
-                return forecast_data
+            if data is not None:
+                city_obj = target.city or WeatherService._get_or_create_city(**WeatherService._forecast_city_fields(data))
+                items, ttl = WeatherService._store_weather_forecast(data, city_obj=city_obj)
+                WeatherService._remember_city(target, city_obj, 'forecast', items, ttl)
+                return items, ttl
             else:
-                return []
-        except Exception as e:
+                return [], 0
+        except UpstreamUnavailable:
+            stale = WeatherService._last_known_forecast(target.city)
+            if not stale:
+                raise
+            return stale, 0
+        except Exception:
             logger.exception("Error fetching forecast data")
-            return []
+            return [], 0
+
+    @staticmethod
+    def _forecast_steps(data: dict) -> list:
+        """Chuỗi mốc 3h của `/forecast` thành danh sách field `ForecastStep` (sắp theo thời gian) - không chạm DB."""
+        steps = []
+        for item in data['list']:
+            pop_val = item.get('pop')  # 0..1
+            steps.append({
+                'forecast_time': datetime.fromtimestamp(item['dt'], tz=dt_timezone.utc),
+                'temperature_c': item['main']['temp'],
+                'humidity_pct': item['main'].get('humidity'),
+                'precipitation_probability_pct': int(round(100 * pop_val)) if pop_val is not None else None,
+                'wind_speed_ms': item.get('wind', {}).get('speed'),
+                'description': item['weather'][0]['description'],
+                'icon_code': item['weather'][0]['icon'],
+                'source': 'openweather',
+            })
+        steps.sort(key=lambda step: step['forecast_time'])
+        return steps
+
+    @staticmethod
+    def _forecast_timezone(data: dict, city_obj: Optional[City] = None):
+        """Múi giờ chia ngày cho dự báo: `City.timezone_name`, nếu không có thì độ lệch UTC trong payload."""
+        return resolve_timezone(city_obj.timezone_name if city_obj else None, data['city'].get('timezone'))
+
+    @staticmethod
+    def _daily_rollup(items: list, tz=dt_timezone.utc) -> list:
+        """Tổng hợp các mốc 3h thô theo ngày địa phương thành field WeatherForecast, tối đa 5 ngày."""
+        return daily_forecast_rows([(None, items, tz)]).get(None, [])
+
+    @staticmethod
+    def _next_step_at(steps: list) -> Optional[datetime]:
+        now = datetime.now(tz=dt_timezone.utc)
+        return next((step['forecast_time'] for step in steps if step['forecast_time'] > now), None)
+
+    @staticmethod
+    def _aggregate_forecast(data: dict, city_obj: Optional[City] = None):
+        """Tách payload `/forecast` - không chạm DB.
+
+        Trả về (thông tin City, các mốc 3h, danh sách field WeatherForecast theo ngày địa phương, mốc 3h kế tiếp).
+        """
+        city_fields = WeatherService._forecast_city_fields(data)
+        steps = WeatherService._forecast_steps(data)
+        tz = WeatherService._forecast_timezone(data, city_obj)
+        return city_fields, steps, WeatherService._daily_rollup(data['list'], tz), WeatherService._next_step_at(steps)
+
+    @staticmethod
+    def _forecast_payload(city_obj: City, forecast_rows: list, next_step_at: Optional[datetime]):
+        """Gói dự báo theo ngày cho UI, kèm TTL cache."""
+        payload = [
+            {
+                'city': f"{city_obj.name}, {city_obj.country_code}",
+                'forecast_time': row['forecast_time'].isoformat(),
+                'temp_min_c': row['temp_min_c'],
+                'temp_max_c': row['temp_max_c'],
+                'precipitation_probability_pct': row['precipitation_probability_pct'],
+                'description': row['description'],
+                'icon_code': row['icon_code'],
+            }
+            for row in forecast_rows
+        ]
+        return payload, forecast_ttl(next_step_at)
+
+    @staticmethod
+    def _hourly_payload(city_obj: City, steps: list):
+        """Gói chuỗi dự báo 3h cho UI, kèm TTL cache (tới mốc kế tiếp)."""
+        payload = [
+            {
+                'city': f"{city_obj.name}, {city_obj.country_code}",
+                'forecast_time': step['forecast_time'].isoformat(),
+                'temperature_c': step['temperature_c'],
+                'humidity_pct': step['humidity_pct'],
+                'precipitation_probability_pct': step['precipitation_probability_pct'],
+                'wind_speed_ms': step['wind_speed_ms'],
+                'description': step['description'],
+                'icon_code': step['icon_code'],
+            }
+            for step in steps
+        ]
+        return payload, forecast_ttl(WeatherService._next_step_at(steps))
+
+    @staticmethod
+    def _store_weather_forecast(data: dict, city_obj: Optional[City] = None):
+        """Lưu chuỗi 3h và dự báo theo ngày từ payload `/forecast`, trả về (payload theo ngày, ttl cache).
+
+        Chuỗi 3h được cache luôn (`hourly`) để endpoint theo giờ không phải gọi API lần nữa.
+        """
+        if city_obj is None:
+            city_obj = WeatherService._get_or_create_city(**WeatherService._forecast_city_fields(data))
+        _, steps, forecast_rows, next_step_at = WeatherService._aggregate_forecast(data, city_obj)
+        store_forecasts(
+            [WeatherForecast(city=city_obj, **row) for row in forecast_rows],
+            steps=[ForecastStep(city=city_obj, **step) for step in steps],
+        )
+        hourly, ttl = WeatherService._hourly_payload(city_obj, steps)
+        get_weather_cache().set('hourly', city_cache_key(city_obj.pk), hourly, ttl)
+        return WeatherService._forecast_payload(city_obj, forecast_rows, next_step_at)
+
+    @staticmethod
+    def _stored_steps_queryset(city_obj: City):
+        since = datetime.now(tz=dt_timezone.utc) - timedelta(hours=3)
+        return ForecastStep.objects.filter(city=city_obj, forecast_time__gt=since).order_by('forecast_time')[:40]
+
+    @staticmethod
+    def _step_fields(record: ForecastStep) -> dict:
+        return {
+            'forecast_time': record.forecast_time,
+            'temperature_c': float(record.temperature_c),
+            'humidity_pct': record.humidity_pct,
+            'precipitation_probability_pct': record.precipitation_probability_pct,
+            'wind_speed_ms': float(record.wind_speed_ms) if record.wind_speed_ms is not None else None,
+            'description': record.description,
+            'icon_code': record.icon_code,
+        }
+
+    @staticmethod
+    def get_hourly_forecast(city: str):
+        """Dự báo theo mốc 3h (5 ngày) cho chuỗi tìm kiếm."""
+        return WeatherService.get_hourly_forecast_for(WeatherService.resolve_target(city))
+
+    @staticmethod
+    def get_hourly_forecast_for(target: WeatherTarget):
+        """Dự báo theo mốc 3h: đọc cache, rồi chuỗi đã lưu trong DB; chỉ gọi API khi City chưa có chuỗi nào còn hiệu lực."""
+        cache = get_weather_cache()
+        key = target.key
+        cached = cache.get('hourly', key)
+        if cached is not None:
+            return cached
+
+        city_obj = target.city
+        if city_obj is not None:
+            steps = [WeatherService._step_fields(r) for r in WeatherService._stored_steps_queryset(city_obj)]
+            if steps:
+                hourly, ttl = WeatherService._hourly_payload(city_obj, steps)
+                cache.set('hourly', key, hourly, ttl)
+                return hourly
+
+        def refresh():
+            # Lấy dự báo qua luồng thường (lưu cả chuỗi 3h vào DB) rồi đọc lại chuỗi đã lưu
+            WeatherService.get_weather_forecast_for(target)
+            city_obj = target.city or (WeatherService.resolve_city(target.query) if target.query else None)
+            if city_obj is None:
+                return []
+            steps = [WeatherService._step_fields(r) for r in WeatherService._stored_steps_queryset(city_obj)]
+            hourly, ttl = WeatherService._hourly_payload(city_obj, steps)
+            if hourly:
+                cache.set('hourly', key, hourly, ttl)
+            return hourly
+
+        return get_single_flight().do(f"hourly:{key}", refresh, recheck=lambda: cache.peek('hourly', key))
     
+    @staticmethod
+    def get_weather_overview(city: str):
+        """Lấy thời tiết hiện tại + dự báo theo ngày của một thành phố trong một lần.
+
+        Phần chưa có trong cache được gọi API song song (thời gian ~ lời gọi chậm hơn, không phải tổng),
+        và `City` chỉ được xác định một lần cho cả hai.
+        """
+        return WeatherService.get_weather_overview_for(WeatherService.resolve_target(city))
+
+    @staticmethod
+    def get_weather_overview_for(target: WeatherTarget):
+        cache = get_weather_cache()
+        current = cache.get('current', target.key)
+        forecasts = cache.get('forecast', target.key)
+        if current is not None and forecasts is not None:
+            return {'current': current, 'forecasts': forecasts}
+
+        overview = get_single_flight().do(
+            f"overview:{target.key}",
+            lambda: WeatherService._refresh_overview(target, current, forecasts),
+        )
+        return {
+            'current': current if current is not None else overview['current'],
+            'forecasts': forecasts if forecasts is not None else overview['forecasts'],
+        }
+
+    @staticmethod
+    def _missing_key(params: dict) -> Optional[str]:
+        # Chỉ tra cứu theo tên (`q=`) mới có thể "không tìm thấy"; tọa độ luôn có kết quả
+        query = params.get('q')
+        return normalize_query(query) if query else None
+
+    @staticmethod
+    def _request_json(endpoint: str, params: dict) -> Optional[dict]:
+        """Gọi API, trả JSON khi 200, `None` nếu không có dữ liệu.
+
+        Chuỗi tìm kiếm bị OpenWeather trả 404 được ghi vào negative cache (`WEATHER_NEGATIVE_CACHE_TTL`)
+        để các lần gõ sai lặp lại không gọi API nữa.
+        """
+        cache = get_weather_cache()
+        missing_key = WeatherService._missing_key(params)
+        if missing_key and cache.peek('notfound', missing_key):
+            return None
+        response = get_client().get(endpoint, params)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404 and missing_key:
+            cache.set('notfound', missing_key, True, settings.WEATHER_NEGATIVE_CACHE_TTL)
+        return None
+
+    @staticmethod
+    def _refresh_overview(target: WeatherTarget, current, forecasts):
+        cache = get_weather_cache()
+        # Phần đã có bản còn mới trong DB thì không gọi API
+        if current is None:
+            stored = WeatherService._stored_current(target.city)
+            if stored is not None:
+                current, ttl = stored
+                cache.set('current', target.key, current, ttl)
+        if forecasts is None:
+            stored = WeatherService._stored_forecast(target.city)
+            if stored is not None:
+                forecasts, ttl = stored
+                cache.set('forecast', target.key, forecasts, ttl)
+
+        executor = get_executor()
+        futures = {}
+        if current is None:
+            futures['weather'] = executor.submit(contextvars.copy_context().run, WeatherService._request_json, 'weather', target.params)
+        if forecasts is None:
+            futures['forecast'] = executor.submit(contextvars.copy_context().run, WeatherService._request_json, 'forecast', target.params)
+
+        results = {}
+        for endpoint, future in futures.items():
+            try:
+                results[endpoint] = future.result()
+            except UpstreamUnavailable:
+                results[endpoint] = None
+            except Exception:
+                logger.exception("Error fetching %s data", endpoint)
+                results[endpoint] = None
+
+        try:
+            city_obj = target.city
+            if results.get('weather'):
+                if city_obj is None:
+                    city_obj = WeatherService._get_or_create_city(**WeatherService._current_city_fields(results['weather']))
+                current, ttl = WeatherService._store_current_weather(results['weather'], city_obj=city_obj)
+                cache.set('current', target.key, current, ttl)
+                WeatherService._remember_city(target, city_obj, 'current', current, ttl)
+            if results.get('forecast'):
+                if city_obj is None:
+                    city_obj = WeatherService._get_or_create_city(**WeatherService._forecast_city_fields(results['forecast']))
+                forecasts, ttl = WeatherService._store_weather_forecast(results['forecast'], city_obj=city_obj)
+                cache.set('forecast', target.key, forecasts, ttl)
+                WeatherService._remember_city(target, city_obj, 'forecast', forecasts, ttl)
+        except Exception:
+            logger.exception("Error storing weather overview")
+
+        if current is None:
+            current = WeatherService._last_known_current(target.city)
+        if forecasts is None:
+            forecasts = WeatherService._last_known_forecast(target.city)
+        return {'current': current, 'forecasts': forecasts or []}
+
+    @staticmethod
+    def get_weather_batch(queries, city_ids):
+        """Thời tiết hiện tại cho nhiều thành phố (theo chuỗi tìm kiếm hoặc id `City`).
+
+        Lấy từ cache trước, rồi từ LatestObservation (một truy vấn cho mọi City đã biết) nếu quan trắc còn mới;
+        phần còn thiếu gọi API song song (tối đa `WEATHER_BATCH_CONCURRENCY` request cùng lúc) rồi ghi toàn bộ
+        WeatherData bằng một câu lệnh upsert. Trả về kết quả/lỗi theo từng thành phố.
+        """
+        cache = get_weather_cache()
+        results = []
+        pending = {}  # cache key -> (WeatherTarget, các kết quả chờ)
+
+        def lookup(result, target):
+            results.append(result)
+            cached = cache.get('current', target.key)
+            if cached is not None:
+                result['data'] = cached
+            else:
+                pending.setdefault(target.key, (target, []))[1].append(result)
+
+        for query in queries:
+            lookup({'query': query}, WeatherService.resolve_target(query))
+
+        cities = City.objects.in_bulk(city_ids)
+        for city_id in city_ids:
+            city_obj = cities.get(city_id)
+            if city_obj is None:
+                results.append({'city_id': city_id, 'error': 'City not found'})
+                continue
+            lookup({'city_id': city_id}, WeatherService.city_target(city_obj))
+
+        if pending:
+            latest = LatestObservation.objects.in_bulk(
+                {target.city.pk for target, _ in pending.values() if target.city is not None}
+            )
+            for key in list(pending):
+                target, waiting = pending[key]
+                record = latest.get(target.city.pk) if target.city is not None else None
+                if record is None or not current_weather_is_fresh(record.observed_at):
+                    continue
+                payload, ttl = WeatherService._current_weather_payload(target.city, WeatherService._record_fields(record))
+                cache.set('current', key, payload, ttl)
+                for result in waiting:
+                    result['data'] = payload
+                del pending[key]
+            if pending:
+                WeatherService._refresh_batch(pending, latest)
+        return results
+
+    @staticmethod
+    def _refresh_batch(pending: dict, latest: dict):
+        """Gọi API cho các thành phố còn thiếu; `latest` (City id -> LatestObservation) dùng khi API lỗi.
+
+        City đã biết OpenWeather id được gom `GROUP_SIZE` City vào một lời gọi `/group`, phần còn lại gọi `/weather`
+        riêng; mọi lời gọi chạy song song.
+        """
+        cache = get_weather_cache()
+        keys = list(pending)
+        concurrency = getattr(settings, 'WEATHER_BATCH_CONCURRENCY', 8)
+        by_id = [key for key in keys if pending[key][0].city is not None and pending[key][0].city.openweather_id is not None]
+        single = [key for key in keys if pending[key][0].city is None or pending[key][0].city.openweather_id is None]
+        groups = [by_id[start:start + GROUP_SIZE] for start in range(0, len(by_id), GROUP_SIZE)]
+        calls = [
+            ('group', {'id': ','.join(str(pending[key][0].city.openweather_id) for key in group)}) for group in groups
+        ] + [('weather', pending[key][0].params) for key in single]
+        results = WeatherService._request_many_endpoints(calls, concurrency)
+
+        responses = dict(zip(single, results[len(groups):]))
+        for group, data in zip(groups, results):
+            items = {item.get('id'): item for item in (data or {}).get('list', [])}
+            for key in group:
+                responses[key] = items.get(pending[key][0].city.openweather_id)
+
+        records = []
+        entries = []
+        for key in keys:
+            data = responses[key]
+            target, waiting = pending[key]
+            city_obj = target.city
+            try:
+                if data is None:
+                    record = latest.get(city_obj.pk) if city_obj is not None else None
+                    if record is not None:
+                        stale = WeatherService._stale_current_payload(city_obj, record)
+                        for result in waiting:
+                            result['data'] = stale
+                        continue
+                    raise LookupError('Weather not found')
+                city_fields, weather_record_fields = WeatherService._parse_current_weather(data)
+                if city_obj is None:
+                    city_obj = WeatherService._get_or_create_city(**city_fields)
+            except LookupError as exc:
+                for result in waiting:
+                    result['error'] = str(exc)
+                continue
+            except Exception:
+                logger.exception("Error parsing batch weather data")
+                for result in waiting:
+                    result['error'] = 'Invalid upstream response'
+                continue
+
+            records.append(WeatherData(city=city_obj, **weather_record_fields))
+            payload, ttl = WeatherService._current_weather_payload(city_obj, weather_record_fields)
+            entries.append((target, city_obj, payload, ttl, waiting))
+
+        try:
+            store_observations(records)
+        except Exception:
+            logger.exception("Error storing batch weather data")
+
+        for target, city_obj, payload, ttl, waiting in entries:
+            cache.set('current', target.key, payload, ttl)
+            WeatherService._remember_city(target, city_obj, 'current', payload, ttl)
+            for result in waiting:
+                result['data'] = payload
+
+    @staticmethod
+    def get_favorites_weather(user) -> list:
+        """Thời tiết hiện tại của các địa điểm yêu thích (mới thêm trước), một truy vấn và không gọi API.
+
+        Quan trắc đã quá chu kỳ cập nhật được đánh dấu `stale`; City chưa có quan trắc nào có `weather` là None.
+        """
+        favorites = (
+            UserFavoriteLocation.objects.filter(user=user)
+            .select_related('city__latest_observation')
+            .order_by('-added_at')
+        )
+        results = []
+        for favorite in favorites:
+            city_obj = favorite.city
+            try:
+                record = city_obj.latest_observation
+            except LatestObservation.DoesNotExist:
+                record = None
+            weather = None
+            if record is not None:
+                weather, _ = WeatherService._current_weather_payload(city_obj, WeatherService._record_fields(record))
+                if not current_weather_is_fresh(record.observed_at):
+                    weather['stale'] = True
+            results.append({
+                'city_id': city_obj.pk,
+                'city': f"{city_obj.name}, {city_obj.country_code}",
+                'added_at': favorite.added_at.isoformat(),
+                'weather': weather,
+            })
+        return results
+
+    @staticmethod
+    def refresh_current_weather(cities: list, concurrency: Optional[int] = None) -> CityRefresh:
+        """Gọi API thời tiết hiện tại cho `cities`, ghi WeatherData/LatestObservation theo lô và cập nhật cache.
+
+        City có OpenWeather id được gom `GROUP_SIZE` City (theo thứ tự) vào một lời gọi `/group`; City còn lại
+        gọi theo tọa độ. Lời gọi chạy trong lane quota của context hiện tại.
+        """
+        concurrency = concurrency or getattr(settings, 'WEATHER_BATCH_CONCURRENCY', 8)
+        result = CityRefresh()
+        started = time.monotonic()
+        by_id = [city_obj for city_obj in cities if city_obj.openweather_id is not None]
+        by_coord = [city_obj for city_obj in cities if city_obj.openweather_id is None]
+        groups = [by_id[start:start + GROUP_SIZE] for start in range(0, len(by_id), GROUP_SIZE)]
+
+        fetched = []
+        responses = WeatherService._request_many(
+            'group', [{'id': ','.join(str(c.openweather_id) for c in group)} for group in groups], concurrency,
+        )
+        for group, data in zip(groups, responses):
+            items = {item.get('id'): item for item in (data or {}).get('list', [])}
+            for city_obj in group:
+                item = items.get(city_obj.openweather_id)
+                if item is None:
+                    result.failed += 1
+                else:
+                    fetched.append((city_obj, item))
+        responses = WeatherService._request_many(
+            'weather', [WeatherService._coord_params(c) for c in by_coord], concurrency,
+        )
+        for city_obj, data in zip(by_coord, responses):
+            if data is None:
+                result.failed += 1
+            else:
+                fetched.append((city_obj, data))
+        result.fetch_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        records = []
+        payloads = []
+        for city_obj, data in fetched:
+            try:
+                _, fields = WeatherService._parse_current_weather(data)
+            except (KeyError, IndexError, TypeError, ValueError):
+                logger.warning("Invalid current weather payload for city %s", city_obj.pk)
+                result.failed += 1
+                continue
+            records.append(WeatherData(city=city_obj, **fields))
+            payloads.append((city_obj, WeatherService._current_weather_payload(city_obj, fields)))
+        if records:
+            store_observations(records)
+        cache = get_weather_cache()
+        for city_obj, (payload, ttl) in payloads:
+            cache.set('current', city_cache_key(city_obj.pk), payload, ttl)
+        result.refreshed = len(payloads)
+        result.write_seconds = time.monotonic() - started
+        return result
+
+    @staticmethod
+    def refresh_forecasts(cities: list, concurrency: Optional[int] = None) -> CityRefresh:
+        """Gọi API dự báo cho `cities`, ghi WeatherForecast/ForecastStep/ForecastRun trong một transaction và cập nhật cache."""
+        concurrency = concurrency or getattr(settings, 'WEATHER_BATCH_CONCURRENCY', 8)
+        result = CityRefresh()
+        started = time.monotonic()
+        responses = WeatherService._request_many(
+            'forecast', [WeatherService._coord_params(c) for c in cities], concurrency,
+        )
+        result.fetch_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        fetched_at = datetime.now(tz=dt_timezone.utc)
+        by_city = {}
+        series = []
+        steps_by_city = {}
+        for city_obj, data in zip(cities, responses):
+            if data is None or not data.get('list'):
+                result.failed += 1
+                continue
+            try:
+                steps_by_city[city_obj.pk] = WeatherService._forecast_steps(data)
+                series.append((city_obj.pk, data['list'], WeatherService._forecast_timezone(data, city_obj)))
+            except (KeyError, IndexError, TypeError, ValueError):
+                logger.warning("Invalid forecast payload for city %s", city_obj.pk)
+                steps_by_city.pop(city_obj.pk, None)
+                result.failed += 1
+                continue
+            by_city[city_obj.pk] = city_obj
+        if steps_by_city:
+            # Tổng hợp theo ngày cho mọi City một lượt, rồi ghi tất cả trong một transaction
+            daily = daily_forecast_rows(series)
+            store_forecasts(
+                [WeatherForecast(city=by_city[city_id], **row) for city_id, rows in daily.items() for row in rows],
+                steps=[ForecastStep(city=by_city[city_id], **step) for city_id, steps in steps_by_city.items() for step in steps],
+                fetched_at=fetched_at,
+            )
+            cache = get_weather_cache()
+            for city_id, steps in steps_by_city.items():
+                city_obj = by_city[city_id]
+                payload, ttl = WeatherService._forecast_payload(city_obj, daily.get(city_id, []), WeatherService._next_step_at(steps))
+                cache.set('forecast', city_cache_key(city_id), payload, ttl)
+                hourly, hourly_ttl = WeatherService._hourly_payload(city_obj, steps)
+                cache.set('hourly', city_cache_key(city_id), hourly, hourly_ttl)
+        result.refreshed = len(steps_by_city)
+        result.write_seconds = time.monotonic() - started
+        return result
+
+    @staticmethod
+    def _request_many(endpoint: str, params_list: list, concurrency: int) -> list:
+        """Gọi API cho từng bộ tham số, tối đa `concurrency` lời gọi đồng thời; lời gọi lỗi trả về `None`."""
+        return WeatherService._request_many_endpoints([(endpoint, params) for params in params_list], concurrency)
+
+    @staticmethod
+    def _request_many_endpoints(calls: list, concurrency: int) -> list:
+        """Như `_request_many` cho danh sách (endpoint, tham số) thuộc nhiều endpoint."""
+        executor = get_executor()
+        semaphore = threading.BoundedSemaphore(max(1, concurrency))
+        futures = []
+        for endpoint, params in calls:
+            semaphore.acquire()
+            future = executor.submit(contextvars.copy_context().run, WeatherService._request_json, endpoint, params)
+            future.add_done_callback(lambda _: semaphore.release())
+            futures.append(future)
+
+        results = []
+        for (endpoint, _), future in zip(calls, futures):
+            try:
+                results.append(future.result())
+            except UpstreamUnavailable:
+                results.append(None)
+            except Exception:
+                logger.exception("Error fetching %s data", endpoint)
+                results.append(None)
+        return results
+
+    @staticmethod
+    def _attach_cached_weather(hits: list) -> list:
+        """Gắn thời tiết hiện tại đang có trong cache cho từng thành phố (không gọi API)."""
+        cache = get_weather_cache()
+        for hit in hits:
+            hit['weather'] = cache.get('current', city_cache_key(hit['city_id']))
+        return hits
+
+    @staticmethod
+    def get_nearby_weather(latitude: float, longitude: float, limit: int = 5, max_km: Optional[float] = None) -> list:
+        """Các thành phố gần tọa độ nhất kèm khoảng cách (km) và thời tiết đã cache."""
+        hits = get_spatial_index().nearest(latitude, longitude, limit=limit, max_km=max_km)
+        return WeatherService._attach_cached_weather(hits)
+
+    @staticmethod
+    def get_weather_in_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: int = 200) -> list:
+        """Các thành phố nằm trong khung bản đồ kèm thời tiết đã cache."""
+        hits = get_spatial_index().within_bbox(min_lat, min_lon, max_lat, max_lon, limit=limit)
+        return WeatherService._attach_cached_weather(hits)
+
+    @staticmethod
+    def get_weather_history(
+        city_obj: City,
+        start: datetime,
+        end: datetime,
+        bucket: str = 'raw',
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> dict:
+        """Lịch sử quan trắc đã lưu của City trong [start, end): từng quan trắc hoặc gộp theo giờ/ngày (UTC).
+
+        Gộp nhóm chạy trong DB (dùng bảng tổng hợp khi đã có), phân trang keyset qua `cursor`.
+        """
+        payload = observation_history(city_obj.pk, start, end, bucket=bucket, limit=limit, cursor=cursor)
+        payload['city'] = f"{city_obj.name}, {city_obj.country_code}"
+        return payload
+
     @staticmethod
     def save_search_history(user, query: str, matched_city: Optional[City] = None):
         """Lưu lịch sử tìm kiếm theo model hiện tại.
 
         - `query`: chuỗi người dùng nhập
         - `matched_city`: tham chiếu `City` nếu đã xác định được
+
+        Chỉ đưa vào bộ đệm write-behind (`history.py`); DB được ghi theo lô ở thread nền.
         """
-        if user and getattr(user, "is_authenticated", False):
-            SearchHistory.objects.create(
-                user=user,
-                query=query,
-                matched_city=matched_city,
-            )
+        get_history_buffer().record(user, query, matched_city)
     
     @staticmethod
     def get_user_search_history(user, limit=10):
-        """Lấy lịch sử tìm kiếm của user"""
+        """Lấy lịch sử tìm kiếm của user (kèm các lượt chưa kịp ghi xuống DB)"""
         if user.is_authenticated:
-            return SearchHistory.objects.filter(user=user)[:limit]
+            stored = SearchHistory.objects.filter(user=user).select_related('matched_city')[:limit]
+            return get_history_buffer().merge_pending(user.pk, stored, limit)
         return []
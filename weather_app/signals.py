@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .aliases import get_alias_index
+from .cities import get_city_cache
+from .models import City
+from .spatial import get_spatial_index
+
+
+@receiver(post_save, sender=City)
+def _index_city(sender, instance, **kwargs):
+    get_spatial_index().add(instance.pk, instance.latitude, instance.longitude, str(instance))
+    get_city_cache().remember(instance)
+
+
+@receiver(post_delete, sender=City)
+def _unindex_city(sender, instance, **kwargs):
+    get_spatial_index().remove(instance.pk)
+    get_city_cache().forget(instance.pk)
+    get_alias_index().forget(instance.pk)
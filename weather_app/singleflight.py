@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
+import weakref
+from typing import Any, Awaitable, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Một lời gọi đang chạy (in-flight) mà các follower chờ kết quả."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Gộp các lời gọi đồng thời có cùng khóa thành một lời gọi duy nhất.
+
+    - Trong một process: lời gọi đầu tiên (leader) chạy `fn`, các lời gọi sau (follower) chờ kết quả của leader.
+    - Giữa các worker (tùy chọn): leader giữ một khóa trong cache dùng chung (`cache.add`);
+      worker khác không lấy được khóa sẽ chờ và đọc lại kết quả qua `recheck`.
+    """
+
+    def __init__(
+        self,
+        alias: Optional[str] = None,
+        lock_timeout: float = 15,
+        wait_timeout: float = 10,
+        poll_interval: float = 0.05,
+    ):
+        self.alias = alias or None
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]] = None) -> Any:
+        """Chạy `fn` một lần cho mỗi `key` đang in-flight và trả kết quả cho mọi lời gọi.
+
+        `recheck` (tùy chọn) đọc lại kết quả đã được ghi (vd. từ cache), trả về `None` nếu chưa có.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if not call.event.wait(self.wait_timeout):
+                logger.warning("Single-flight wait timed out for %s", key)
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leader(key, fn, recheck)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _run_leader(self, key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]]) -> Any:
+        # Leader trước có thể vừa hoàn thành giữa lúc cache miss và lúc nhận vai trò leader
+        if recheck is not None:
+            value = recheck()
+            if value is not None:
+                return value
+
+        if self.alias is None:
+            return fn()
+
+        shared = caches[self.alias]
+        lock_key = f"singleflight:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = shared.add(lock_key, token, timeout=self.lock_timeout)
+        except Exception:
+            logger.exception("Single-flight lock failed for %s", key)
+            return fn()
+
+        if acquired:
+            try:
+                return fn()
+            finally:
+                try:
+                    if shared.get(lock_key) == token:
+                        shared.delete(lock_key)
+                except Exception:
+                    logger.exception("Single-flight unlock failed for %s", key)
+
+        # Worker khác đang gọi: chờ kết quả của nó thay vì gọi upstream lần nữa
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            if recheck is not None:
+                value = recheck()
+                if value is not None:
+                    return value
+            if shared.get(lock_key) is None:
+                break
+
+        if recheck is not None:
+            value = recheck()
+            if value is not None:
+                return value
+        return fn()
+
+
+class AsyncSingleFlight(SingleFlight):
+    """Phiên bản asyncio của `SingleFlight`: follower `await` future của leader trong cùng event loop."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop_calls = weakref.WeakKeyDictionary()
+
+    def in_flight(self) -> int:
+        return sum(len(calls) for calls in self._loop_calls.values())
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        recheck: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        calls = self._loop_calls.setdefault(loop, {})
+        future = calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Single-flight wait timed out for %s", key)
+                return await fn()
+
+        future = loop.create_future()
+        calls[key] = future
+        try:
+            result = await self._run_leader(key, fn, recheck)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # đánh dấu đã xử lý để không log "exception was never retrieved"
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            calls.pop(key, None)
+
+    async def _run_leader(self, key, fn, recheck):
+        if recheck is not None:
+            value = await recheck()
+            if value is not None:
+                return value
+
+        if self.alias is None:
+            return await fn()
+
+        shared = caches[self.alias]
+        lock_key = f"singleflight:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await shared.aadd(lock_key, token, timeout=self.lock_timeout)
+        except Exception:
+            logger.exception("Single-flight lock failed for %s", key)
+            return await fn()
+
+        if acquired:
+            try:
+                return await fn()
+            finally:
+                try:
+                    if await shared.aget(lock_key) == token:
+                        await shared.adelete(lock_key)
+                except Exception:
+                    logger.exception("Single-flight unlock failed for %s", key)
+
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            if recheck is not None:
+                value = await recheck()
+                if value is not None:
+                    return value
+            if await shared.aget(lock_key) is None:
+                break
+
+        if recheck is not None:
+            value = await recheck()
+            if value is not None:
+                return value
+        return await fn()
+
+
+_single_flight: Optional[SingleFlight] = None
+_async_single_flight: Optional[AsyncSingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+def _single_flight_options() -> dict:
+    return {
+        'alias': getattr(settings, 'WEATHER_CACHE_ALIAS', None),
+        'lock_timeout': getattr(settings, 'WEATHER_SINGLEFLIGHT_LOCK_TIMEOUT', 15),
+        'wait_timeout': getattr(settings, 'WEATHER_SINGLEFLIGHT_WAIT_TIMEOUT', 10),
+    }
+
+
+def get_single_flight() -> SingleFlight:
+    """Trả về bộ gộp lời gọi dùng chung của process."""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(**_single_flight_options())
+    return _single_flight
+
+
+def get_async_single_flight() -> AsyncSingleFlight:
+    """Trả về bộ gộp lời gọi async dùng chung của process."""
+    global _async_single_flight
+    if _async_single_flight is None:
+        with _single_flight_lock:
+            if _async_single_flight is None:
+                _async_single_flight = AsyncSingleFlight(**_single_flight_options())
+    return _async_single_flight
+
+
+@receiver(setting_changed)
+def _reset_single_flight_on_setting_change(sender, setting, **kwargs):
+    global _single_flight, _async_single_flight
+    if setting.startswith('WEATHER_'):
+        _single_flight = None
+        _async_single_flight = None
@@ -0,0 +1,235 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import MISSING, LRUCache
+from .models import City
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Khoảng cách mặt cầu (km) giữa hai tọa độ."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class CitySpatialIndex:
+    """Chỉ mục không gian dạng lưới (ô `cell_deg` x `cell_deg` độ) trên bảng `City`.
+
+    Trả lời "N thành phố gần nhất" và "các thành phố trong khung bản đồ" mà không quét bảng.
+    Cột ô theo kinh độ quay vòng ở kinh tuyến 180, nên điểm ở hai bên kinh tuyến là hàng xóm của nhau.
+    Được nạp lần đầu khi dùng, cập nhật qua signal khi City được lưu/xóa trong worker này,
+    và định kỳ (`refresh_interval`) nạp thêm City mới/sửa từ worker khác theo `updated_at`.
+    """
+
+    def __init__(self, cell_deg: float = 0.5, refresh_interval: float = 60, city_cache_size: int = 1024):
+        self.cell_deg = cell_deg
+        self._lon_cells = math.ceil(360 / cell_deg)
+        self.refresh_interval = refresh_interval
+        self._cities = LRUCache(maxsize=city_cache_size)
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float, str]]] = {}
+        self._points: Dict[int, Tuple[float, float, str]] = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._synced_at = None
+        self._checked_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg) % self._lon_cells)
+
+    def add(self, city_id: int, lat: float, lon: float, label: str):
+        with self._lock:
+            self._discard(city_id)
+            point = (float(lat), float(lon), label)
+            self._points[city_id] = point
+            self._cells.setdefault(self._cell(point[0], point[1]), {})[city_id] = point
+
+    def remove(self, city_id: int):
+        with self._lock:
+            self._discard(city_id)
+
+    def _discard(self, city_id: int):
+        self._cities.delete(city_id)
+        point = self._points.pop(city_id, None)
+        if point is None:
+            return
+        cell_key = self._cell(point[0], point[1])
+        cell = self._cells.get(cell_key)
+        if cell is not None:
+            cell.pop(city_id, None)
+            if not cell:
+                del self._cells[cell_key]
+
+    def _load(self, queryset):
+        for city_id, name, country_code, lat, lon in queryset.values_list(
+            'id', 'name', 'country_code', 'latitude', 'longitude'
+        ).iterator(chunk_size=2000):
+            self.add(city_id, lat, lon, f"{name}, {country_code}")
+
+    def ensure_fresh(self):
+        """Nạp toàn bộ lần đầu, sau đó chỉ nạp City được tạo/sửa kể từ lần đồng bộ trước."""
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._checked_at < self.refresh_interval:
+                return
+            started = timezone.now()
+            queryset = City.objects.all()
+            if self._loaded:
+                queryset = queryset.filter(updated_at__gte=self._synced_at)
+            self._load(queryset)
+            self._loaded = True
+            self._synced_at = started
+            self._checked_at = now
+
+    def _ring_cells(self, center: Tuple[int, int], radius: int):
+        ci, cj = center
+        if radius == 0:
+            yield center
+            return
+        wrap = self._lon_cells
+        for dj in range(-radius, radius + 1):
+            yield (ci - radius, (cj + dj) % wrap)
+            yield (ci + radius, (cj + dj) % wrap)
+        for di in range(-radius + 1, radius):
+            yield (ci + di, (cj - radius) % wrap)
+            yield (ci + di, (cj + radius) % wrap)
+
+    def nearest(self, lat: float, lon: float, limit: int = 5, max_km: Optional[float] = None) -> List[dict]:
+        """`limit` thành phố gần (lat, lon) nhất, sắp theo khoảng cách tăng dần."""
+        self.ensure_fresh()
+        with self._lock:
+            center = self._cell(lat, lon)
+            best: List[Tuple[float, int]] = []  # max-heap theo khoảng cách (lưu số âm)
+            max_rings = math.ceil(360 / self.cell_deg)
+            radius = 0
+            while radius <= max_rings:
+                # Lưới thưa: duyệt các ô có dữ liệu sẽ rẻ hơn tiếp tục mở rộng vòng.
+                # Vòng rộng hơn nửa vòng kinh độ sẽ gặp lại các cột đã duyệt, nên cũng duyệt hết.
+                if 8 * radius > len(self._cells) or 2 * radius >= self._lon_cells:
+                    best = []
+                    self._push_candidates(best, self._points.items(), lat, lon, limit)
+                    break
+                for cell_key in self._ring_cells(center, radius):
+                    cell = self._cells.get(cell_key)
+                    if cell:
+                        self._push_candidates(best, cell.items(), lat, lon, limit)
+                # Mọi điểm ngoài vòng hiện tại cách tâm ít nhất `radius` ô (theo phương có cạnh ngắn nhất)
+                shortest_edge_km = self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(min(89.0, abs(lat) + radius * self.cell_deg)))
+                bound_km = radius * shortest_edge_km
+                if len(best) >= limit and -best[0][0] <= bound_km:
+                    break
+                if max_km is not None and bound_km > max_km:
+                    break
+                radius += 1
+
+            results = sorted((-neg_dist, city_id) for neg_dist, city_id in best)
+            return [
+                {
+                    'city_id': city_id,
+                    'city': self._points[city_id][2],
+                    'latitude': self._points[city_id][0],
+                    'longitude': self._points[city_id][1],
+                    'distance_km': round(distance, 3),
+                }
+                for distance, city_id in results
+                if max_km is None or distance <= max_km
+            ]
+
+    def nearest_city(self, lat: float, lon: float, max_km: float) -> Optional[City]:
+        """`City` gần (lat, lon) nhất trong bán kính `max_km`; object City được giữ trong LRU để không truy vấn lại."""
+        hits = self.nearest(lat, lon, limit=1, max_km=max_km)
+        if not hits:
+            return None
+        city_id = hits[0]['city_id']
+        city_obj = self._cities.get(city_id)
+        if city_obj is MISSING:
+            city_obj = City.objects.filter(pk=city_id).first()
+            if city_obj is None:
+                # City đã bị xóa ở worker khác
+                self.remove(city_id)
+                return None
+            self._cities.set(city_id, city_obj, self.refresh_interval)
+        return city_obj
+
+    def _push_candidates(self, best, candidates, lat, lon, limit):
+        for city_id, (p_lat, p_lon, _) in candidates:
+            distance = haversine_km(lat, lon, p_lat, p_lon)
+            if len(best) < limit:
+                heapq.heappush(best, (-distance, city_id))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, city_id))
+
+    def within_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, limit: int = 200) -> List[dict]:
+        """Các thành phố trong khung [min_lat, max_lat] x [min_lon, max_lon]; hỗ trợ khung vắt qua kinh tuyến 180."""
+        self.ensure_fresh()
+        lon_ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+        results = []
+        with self._lock:
+            for lo, hi in lon_ranges:
+                i0, j0 = self._cell(min_lat, lo)
+                i1, _ = self._cell(max_lat, hi)
+                # Số cột tính trên kinh độ chưa quay vòng: cột của 180 trùng cột của -180
+                columns = min(math.floor(hi / self.cell_deg) - math.floor(lo / self.cell_deg), self._lon_cells - 1)
+                if (i1 - i0 + 1) * (columns + 1) > len(self._cells):
+                    cells = (
+                        cell for (i, j), cell in self._cells.items()
+                        if i0 <= i <= i1 and (j - j0) % self._lon_cells <= columns
+                    )
+                else:
+                    cells = (
+                        self._cells.get((i, (j0 + dj) % self._lon_cells))
+                        for i in range(i0, i1 + 1) for dj in range(columns + 1)
+                    )
+                for cell in cells:
+                    if not cell:
+                        continue
+                    for city_id, (p_lat, p_lon, label) in cell.items():
+                        if min_lat <= p_lat <= max_lat and lo <= p_lon <= hi:
+                            results.append({'city_id': city_id, 'city': label, 'latitude': p_lat, 'longitude': p_lon})
+                            if len(results) >= limit:
+                                return results
+        return results
+
+
+_spatial_index: Optional[CitySpatialIndex] = None
+_spatial_index_lock = threading.Lock()
+
+
+def get_spatial_index() -> CitySpatialIndex:
+    """Trả về chỉ mục không gian dùng chung của process."""
+    global _spatial_index
+    if _spatial_index is None:
+        with _spatial_index_lock:
+            if _spatial_index is None:
+                _spatial_index = CitySpatialIndex(
+                    cell_deg=getattr(settings, 'WEATHER_SPATIAL_CELL_DEG', 0.5),
+                    refresh_interval=getattr(settings, 'WEATHER_SPATIAL_REFRESH_SECONDS', 60),
+                )
+    return _spatial_index
+
+
+@receiver(setting_changed)
+def _reset_spatial_index_on_setting_change(sender, setting, **kwargs):
+    global _spatial_index
+    if setting.startswith('WEATHER_SPATIAL'):
+        _spatial_index = None
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.test import TestCase, override_settings
+
+from weather_app.models import WeatherData
+
+from .stubs import upstream
+
+# Các setting mà mỗi singleton của weather_app (cache, client, quota, chỉ mục...) lắng nghe để tự khởi tạo lại
+_RESET_SETTINGS = (
+    'WEATHER_CACHE_MAXSIZE',
+    'WEATHER_HTTP_TRANSPORT',
+    'WEATHER_QUOTA_BURST',
+    'WEATHER_ALIAS_INDEX_MAXSIZE',
+    'WEATHER_CITY_CACHE_MAXSIZE',
+    'WEATHER_SPATIAL_CELL_DEG',
+    'WEATHER_OBSERVATION_INDEX_MAXSIZE',
+    'WEATHER_HISTORY_FLUSH_SIZE',
+)
+
+
+def reset_weather_state():
+    """Bỏ mọi trạng thái trong process của weather_app, như khi một setting WEATHER_* thay đổi."""
+    for name in _RESET_SETTINGS:
+        setting_changed.send(sender=type(settings._wrapped), setting=name, value=getattr(settings, name), enter=False)
+
+
+@override_settings(
+    WEATHER_HTTP_TRANSPORT='weather_app.tests.stubs.StubAdapter',
+    WEATHER_HTTP_ASYNC_TRANSPORT='weather_app.tests.stubs.AsyncStubTransport',
+    WEATHER_HTTP_MAX_RETRIES=0,
+    WEATHER_CACHE_ALIAS='',
+    WEATHER_QUOTA_CALLS_PER_MINUTE=60000,
+    WEATHER_QUOTA_BURST=1000,
+    WEATHER_HISTORY_FLUSH_INTERVAL=3600,
+)
+class WeatherTestCase(TestCase):
+    """TestCase gọi OpenWeather giả (`stubs.upstream`) với cache, quota và chỉ mục trong process được làm mới mỗi test."""
+
+    def setUp(self):
+        super().setUp()
+        upstream.reset()
+        reset_weather_state()
+        self.addCleanup(reset_weather_state)
+
+
+def observation(city, observed_at, temperature=25) -> WeatherData:
+    """WeatherData chưa lưu của `city` tại `observed_at` (các chỉ số khác cố định)."""
+    return WeatherData(
+        city=city, observed_at=observed_at, temperature_c=temperature, humidity_pct=80, pressure_hpa=1010,
+        wind_speed_ms=2, source='test',
+    )
@@ -0,0 +1,156 @@
+"""OpenWeather giả cho test, nối vào client qua `WEATHER_HTTP_TRANSPORT` / `WEATHER_HTTP_ASYNC_TRANSPORT`.
+
+Mọi transport dùng chung `upstream`: test đọc `upstream.calls` để đếm lời gọi, `upstream.peak` để biết số lời gọi
+chạy đồng thời nhiều nhất, và chỉnh `delay` / `fail` để giả lập OpenWeather chậm hoặc mất kết nối.
+"""
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+CITIES = {
+    'hanoi': {'id': 1581130, 'name': 'Hanoi', 'country': 'VN', 'lat': 21.0245, 'lon': 105.8412, 'timezone': 25200},
+    'paris': {'id': 2988507, 'name': 'Paris', 'country': 'FR', 'lat': 48.8534, 'lon': 2.3488, 'timezone': 7200},
+}
+
+
+def current_payload(city: dict, observed_at: int) -> dict:
+    return {
+        'id': city['id'],
+        'name': city['name'],
+        'sys': {'country': city['country']},
+        'coord': {'lat': city['lat'], 'lon': city['lon']},
+        'timezone': city['timezone'],
+        'dt': observed_at,
+        'main': {'temp': 30.5, 'humidity': 70, 'pressure': 1008},
+        'wind': {'speed': 3.1},
+        'weather': [{'description': 'broken clouds', 'icon': '04d'}],
+    }
+
+
+def forecast_payload(city: dict, start: int) -> dict:
+    return {
+        'city': {
+            'id': city['id'],
+            'name': city['name'],
+            'country': city['country'],
+            'coord': {'lat': city['lat'], 'lon': city['lon']},
+            'timezone': city['timezone'],
+        },
+        'list': [
+            {
+                'dt': start + i * 10800,
+                'main': {'temp': 20 + i % 8, 'humidity': 60},
+                'pop': 0.1 * (i % 5),
+                'wind': {'speed': 2.0},
+                'weather': [{'description': 'light rain' if i % 3 else 'clear sky', 'icon': '10d'}],
+            }
+            for i in range(40)
+        ],
+    }
+
+
+class FakeOpenWeather:
+    """Trả lời `/weather`, `/forecast` và `/group` cho các City trong `CITIES`, ghi lại mọi URL được gọi."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = []
+        self.delay = 0.0
+        self.fail = False
+        self.active = 0
+        self.peak = 0
+
+    def endpoint_calls(self, endpoint: str) -> int:
+        return sum(1 for url in self.calls if urlparse(url).path.rsplit('/', 1)[-1] == endpoint)
+
+    def _find(self, query: dict):
+        if 'q' in query:
+            return CITIES.get(query['q'][0].split(',')[0].strip().lower())
+        if 'lat' in query:
+            lat, lon = float(query['lat'][0]), float(query['lon'][0])
+            return min(CITIES.values(), key=lambda c: (c['lat'] - lat) ** 2 + (c['lon'] - lon) ** 2)
+        if 'id' in query:
+            city_id = int(query['id'][0])
+            return next((c for c in CITIES.values() if c['id'] == city_id), None)
+        return None
+
+    def record(self, url: str):
+        with self._lock:
+            self.calls.append(url)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def done(self):
+        with self._lock:
+            self.active -= 1
+
+    def respond(self, url: str):
+        """(status, body JSON) cho một URL OpenWeather."""
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        endpoint = parsed.path.rsplit('/', 1)[-1]
+        now = int(time.time())
+        if endpoint == 'group':
+            ids = {int(value) for value in query['id'][0].split(',')}
+            items = [current_payload(c, now) for c in CITIES.values() if c['id'] in ids]
+            return 200, {'cnt': len(items), 'list': items}
+        city = self._find(query)
+        if city is None:
+            return 404, {'cod': '404', 'message': 'city not found'}
+        if endpoint == 'weather':
+            return 200, current_payload(city, now)
+        return 200, forecast_payload(city, (now // 10800 + 1) * 10800)
+
+
+upstream = FakeOpenWeather()
+
+
+class StubAdapter(BaseAdapter):
+    """Transport adapter của `requests` trả lời bằng `upstream`, không mở kết nối mạng."""
+
+    def send(self, request, **kwargs):
+        upstream.record(request.url)
+        try:
+            if upstream.delay:
+                time.sleep(upstream.delay)
+            if upstream.fail:
+                raise requests.ConnectionError('OpenWeather stub is down')
+            status, body = upstream.respond(request.url)
+        finally:
+            upstream.done()
+        response = Response()
+        response.url = request.url
+        response.request = request
+        response.status_code = status
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(body).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+class AsyncStubTransport(httpx.AsyncBaseTransport):
+    """Transport httpx bất đồng bộ trả lời bằng `upstream`."""
+
+    async def handle_async_request(self, request):
+        upstream.record(str(request.url))
+        try:
+            if upstream.delay:
+                await asyncio.sleep(upstream.delay)
+            if upstream.fail:
+                raise httpx.ConnectError('OpenWeather stub is down', request=request)
+            status, body = upstream.respond(str(request.url))
+        finally:
+            upstream.done()
+        return httpx.Response(status, json=body, request=request)
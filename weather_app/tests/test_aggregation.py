@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from weather_app.aggregation import daily_forecast_rows, resolve_timezone
+from weather_app.models import City, WeatherForecast
+from weather_app.services import WeatherService
+
+from .base import WeatherTestCase, reset_weather_state
+from .stubs import upstream
+
+UTC = dt_timezone.utc
+
+
+def item(moment: datetime, temp: float, pop=None, description='clear sky', icon='01d') -> dict:
+    return {'dt': int(moment.timestamp()), 'main': {'temp': temp}, 'pop': pop,
+            'weather': [{'description': description, 'icon': icon}]}
+
+
+class DailyForecastRowsTests(SimpleTestCase):
+    def test_days_split_at_local_midnight(self):
+        hanoi = dt_timezone(timedelta(hours=7))
+        # 16:00 UTC = 23:00 ngày 17 giờ Hà Nội, 17:00 UTC = 00:00 ngày 18
+        rows = daily_forecast_rows([('hanoi', [
+            item(datetime(2026, 10, 17, 13, tzinfo=UTC), 20),
+            item(datetime(2026, 10, 17, 16, tzinfo=UTC), 22),
+            item(datetime(2026, 10, 17, 17, tzinfo=UTC), 30),
+            item(datetime(2026, 10, 17, 20, tzinfo=UTC), 28),
+        ], hanoi)])['hanoi']
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['forecast_time'], datetime(2026, 10, 17, 12, tzinfo=UTC))
+        self.assertEqual((rows[0]['temp_min_c'], rows[0]['temp_max_c']), (20, 22))
+        self.assertEqual(rows[1]['forecast_time'], datetime(2026, 10, 18, 12, tzinfo=UTC))
+        self.assertEqual((rows[1]['temp_min_c'], rows[1]['temp_max_c']), (28, 30))
+
+    def test_days_follow_daylight_saving_change(self):
+        paris = ZoneInfo('Europe/Paris')
+        # Paris về UTC+1 lúc 01:00 UTC ngày 25/10/2026: nửa đêm ngày 26 là 23:00 UTC ngày 25
+        rows = daily_forecast_rows([('paris', [
+            item(datetime(2026, 10, 24, 21, tzinfo=UTC), 10),  # 23:00 ngày 24 (UTC+2)
+            item(datetime(2026, 10, 24, 22, tzinfo=UTC), 11),  # 00:00 ngày 25 (UTC+2)
+            item(datetime(2026, 10, 25, 22, tzinfo=UTC), 12),  # 23:00 ngày 25 (UTC+1)
+            item(datetime(2026, 10, 25, 23, tzinfo=UTC), 13),  # 00:00 ngày 26 (UTC+1)
+        ], paris)])['paris']
+
+        self.assertEqual([row['temp_max_c'] for row in rows], [10, 12, 13])
+        self.assertEqual(rows[1]['forecast_time'], datetime(2026, 10, 25, 12, tzinfo=UTC))
+        self.assertEqual(rows[2]['forecast_time'], datetime(2026, 10, 26, 12, tzinfo=UTC))
+
+    def test_pop_mode_and_day_limit(self):
+        start = datetime(2026, 10, 18, tzinfo=UTC)
+        items = [item(start, 20, pop=0.2, description='rain'), item(start + timedelta(hours=3), 21, pop=0.4, description='rain'),
+                 item(start + timedelta(hours=6), 22, description='sun')]
+        items += [item(start + timedelta(days=day), 20) for day in range(1, 7)]
+        rows = daily_forecast_rows([(1, items, UTC), (2, [], UTC)])
+
+        self.assertEqual(len(rows[1]), 5)
+        self.assertEqual(rows[1][0]['precipitation_probability_pct'], 30)
+        self.assertEqual(rows[1][0]['description'], 'rain')
+        self.assertIsNone(rows[1][1]['precipitation_probability_pct'])
+        self.assertNotIn(2, rows)
+
+    def test_resolve_timezone_prefers_city_zone_name(self):
+        self.assertEqual(resolve_timezone('Asia/Ho_Chi_Minh', 0), ZoneInfo('Asia/Ho_Chi_Minh'))
+        self.assertEqual(resolve_timezone('Not/AZone', 3600), dt_timezone(timedelta(hours=1)))
+        self.assertEqual(resolve_timezone(None), UTC)
+
+
+class StoredForecastTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+
+    def test_refetch_overwrites_the_same_daily_rows(self):
+        WeatherService.refresh_forecasts([self.city])
+        WeatherService.refresh_forecasts([self.city])
+
+        times = list(WeatherForecast.objects.filter(city=self.city).values_list('forecast_time', flat=True))
+        self.assertEqual(len(times), 5)
+        self.assertTrue(all((moment.hour, moment.minute) == (12, 0) for moment in times))
+
+    def test_fallback_reads_only_the_latest_forecast_run(self):
+        WeatherService.refresh_forecasts([self.city])
+        # Các ngày xa hơn chỉ còn từ một lần lấy cũ hơn
+        noon = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        for day in range(6, 9):
+            WeatherForecast.objects.create(
+                city=self.city, forecast_time=noon + timedelta(days=day), temp_min_c=0, temp_max_c=1,
+                fetched_at=timezone.now() - timedelta(days=1),
+            )
+
+        forecasts = WeatherService._last_known_forecast(self.city)
+
+        self.assertEqual(len(forecasts), 5)
+        self.assertTrue(all(item['stale'] for item in forecasts))
+        self.assertNotIn(0.0, [item['temp_min_c'] for item in forecasts])
+
+
+class HourlyEndpointTests(WeatherTestCase):
+    def test_steps_are_served_from_the_stored_series(self):
+        forecast = self.client.get('/api/weather/forecast', {'city': 'Hanoi'})
+        reset_weather_state()
+
+        response = self.client.get('/api/weather/hourly', {'city': 'hà nội'})
+
+        self.assertEqual(forecast.status_code, 200)
+        self.assertEqual(response.status_code, 200)
+        steps = response.json()['steps']
+        self.assertEqual(len(steps), 40)
+        self.assertEqual([step['forecast_time'] for step in steps], sorted(step['forecast_time'] for step in steps))
+        self.assertEqual(upstream.endpoint_calls('forecast'), 1)
+
+    def test_unknown_city_has_no_steps(self):
+        response = self.client.get('/api/weather/hourly', {'city': 'Atlantis'})
+
+        self.assertEqual(response.json(), {'steps': []})
+
+    def test_bad_input_is_rejected(self):
+        for params in [{}, {'lat': 'north', 'lon': 0}, {'lat': 10}, {'lat': 0, 'lon': 181}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/weather/hourly', params).status_code, 400)
+        self.assertEqual(upstream.calls, [])
@@ -0,0 +1,30 @@
+from weather_app.aliases import get_alias_index
+from weather_app.models import City, CityAlias
+from weather_app.services import WeatherService
+
+from .base import WeatherTestCase
+from .stubs import upstream
+
+
+class CityAliasTests(WeatherTestCase):
+    def test_spellings_of_a_city_share_one_upstream_call(self):
+        first = WeatherService.get_current_weather('Hanoi')
+
+        payloads = [WeatherService.get_current_weather(query) for query in ['Ha Noi', 'hà nội', 'Hanoi,', ' HANOI , vn']]
+
+        city = City.objects.get()
+        self.assertEqual(first['city'], 'Hanoi, VN')
+        self.assertEqual(payloads, [first] * 4)
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+        for query in ['Ha Noi', 'hà nội', 'Hanoi,']:
+            self.assertEqual(WeatherService.resolve_city(query), city)
+
+    def test_deleted_city_is_forgotten(self):
+        WeatherService.get_current_weather('Hanoi')
+        city = City.objects.get()
+        self.assertEqual(get_alias_index().resolve('Ha Noi'), city)
+
+        city.delete()
+
+        self.assertFalse(CityAlias.objects.exists())
+        self.assertIsNone(get_alias_index().resolve('Ha Noi'))
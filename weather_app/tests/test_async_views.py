@@ -0,0 +1,89 @@
+import asyncio
+import importlib
+
+from django.test import override_settings
+from django.urls import clear_url_caches, resolve
+
+from weather_app import async_views, urls
+from weather_app.models import City, User
+from weather_app.upstream import get_circuit_breaker
+
+from .base import WeatherTestCase
+from .stubs import upstream
+
+
+def _reload_urls():
+    # `urls.py` chọn view theo WEATHER_ASYNC_VIEWS lúc import
+    importlib.reload(urls)
+    clear_url_caches()
+
+
+# Resolver của `include()` trong urls gốc giữ danh sách URL cũ, nên dùng thẳng `weather_app.urls` làm gốc
+@override_settings(WEATHER_ASYNC_VIEWS=True, ROOT_URLCONF='weather_app.urls')
+class AsyncViewTests(WeatherTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        _reload_urls()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        _reload_urls()
+
+    def test_switch_routes_to_async_views(self):
+        self.assertIs(resolve('/api/weather/current').func, async_views.current_weather)
+        self.assertIs(resolve('/api/search/history').func, async_views.search_history)
+
+    async def test_current_weather_uses_async_transport(self):
+        response = await self.async_client.get('/api/weather/current', {'city': 'Hanoi'})
+        again = await self.async_client.get('/api/weather/current', {'city': 'hà nội'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['city'], 'Hanoi, VN')
+        self.assertEqual(again.json(), response.json())
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+        self.assertTrue(await City.objects.filter(name='Hanoi').aexists())
+
+    async def test_concurrent_requests_share_one_upstream_call(self):
+        upstream.delay = 0.05
+
+        responses = await asyncio.gather(*[
+            self.async_client.get('/api/weather/current', {'city': 'Paris'}) for _ in range(5)
+        ])
+
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+
+    async def test_forecast_by_coordinates(self):
+        response = await self.async_client.get('/api/weather/forecast', {'lat': 48.85, 'lon': 2.35})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['forecasts'])
+        self.assertEqual(upstream.endpoint_calls('forecast'), 1)
+
+    async def test_unknown_city_and_bad_input(self):
+        self.assertEqual((await self.async_client.get('/api/weather/current', {'city': 'Atlantis'})).status_code, 404)
+        self.assertEqual((await self.async_client.get('/api/weather/hourly')).status_code, 400)
+        self.assertEqual((await self.async_client.get('/api/weather/forecast', {'lat': 95, 'lon': 0})).status_code, 400)
+
+    @override_settings(WEATHER_BREAKER_FAILURE_THRESHOLD=1)
+    async def test_open_breaker_answers_503(self):
+        with self.assertLogs('weather_app.upstream', 'WARNING'):
+            get_circuit_breaker().record_failure()
+
+        response = await self.async_client.get('/api/weather/current', {'city': 'Hanoi'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(upstream.calls, [])
+
+    async def test_search_history_requires_login_and_lists_searches(self):
+        self.assertEqual((await self.async_client.get('/api/search/history')).status_code, 401)
+        user = await User.objects.acreate_user(username='alice', password='secret')
+        await self.async_client.aforce_login(user)
+
+        await self.async_client.get('/api/weather/current', {'city': 'Hanoi'})
+        response = await self.async_client.get('/api/search/history')
+
+        self.assertEqual(response.json()['history'][0]['query'], 'Hanoi')
+        self.assertEqual(response.json()['history'][0]['matched_city'], 'Hanoi, VN')
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from weather_app.ingest import write_observations
+from weather_app.models import City, WeatherData
+from weather_app.services import WeatherService
+from weather_app.upstream import CircuitBreaker, UpstreamUnavailable, get_circuit_breaker
+
+from .base import WeatherTestCase
+from .stubs import upstream
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures_and_probes_after_cooldown(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        with self.assertLogs('weather_app.upstream', 'WARNING'):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertLogs('weather_app.upstream', 'INFO'):
+            breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_rejects_calls_while_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+        with self.assertLogs('weather_app.upstream', 'WARNING'):
+            breaker.record(503, 0.1)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_opens_on_slow_latency_percentile(self):
+        breaker = CircuitBreaker(latency_threshold=1.0, latency_percentile=0.5, window=4, min_samples=4)
+        with self.assertLogs('weather_app.upstream', 'WARNING') as logs:
+            for latency in (0.1, 2.0, 2.0, 2.0):
+                breaker.record_success(latency)
+        self.assertIn('p50 latency', logs.output[0])
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+@override_settings(WEATHER_BREAKER_FAILURE_THRESHOLD=2, WEATHER_BREAKER_COOLDOWN=60)
+class StaleFallbackTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        write_observations([
+            WeatherData(
+                city=self.city, observed_at=timezone.now() - timedelta(hours=2), temperature_c=25,
+                humidity_pct=80, pressure_hpa=1010, wind_speed_ms=2,
+            )
+        ])
+        upstream.fail = True
+
+    def test_open_breaker_serves_last_stored_observation(self):
+        target = WeatherService.city_target(self.city)
+        with self.assertLogs('weather_app', 'WARNING'):
+            for _ in range(2):
+                self.assertIsNone(WeatherService.get_current_weather_for(target))
+        self.assertEqual(get_circuit_breaker().state, CircuitBreaker.OPEN)
+
+        data = WeatherService.get_current_weather_for(target)
+
+        self.assertTrue(data['stale'])
+        self.assertEqual(data['temperature_c'], 25)
+        self.assertEqual(len(upstream.calls), 2)
+
+    def open_breaker(self):
+        with self.assertLogs('weather_app.upstream', 'WARNING'):
+            get_circuit_breaker().record_failure()
+            get_circuit_breaker().record_failure()
+
+    def test_open_breaker_without_stored_data_raises(self):
+        self.open_breaker()
+        with self.assertRaises(UpstreamUnavailable):
+            WeatherService.get_current_weather('Paris')
+        self.assertEqual(upstream.calls, [])
+
+    def test_view_answers_503_when_nothing_is_stored(self):
+        self.open_breaker()
+        response = self.client.get('/api/weather/current', {'city': 'Paris'})
+        self.assertEqual(response.status_code, 503)
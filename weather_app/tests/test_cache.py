@@ -0,0 +1,86 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from weather_app.cache import MISSING, LRUCache, WeatherCache, current_weather_ttl, forecast_ttl, get_weather_cache
+from weather_app.services import WeatherService
+
+from .base import WeatherTestCase
+from .stubs import upstream
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_entry_expires_after_ttl(self):
+        cache = LRUCache(maxsize=10)
+        cache.set('key', 'value', ttl=0.05)
+        self.assertEqual(cache.get('key'), 'value')
+        time.sleep(0.06)
+        self.assertIs(cache.get('key'), MISSING)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1, ttl=60)
+        cache.set('b', 2, ttl=60)
+        cache.get('a')
+        cache.set('c', 3, ttl=60)
+        self.assertIs(cache.get('b'), MISSING)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_non_positive_ttl_is_not_cached(self):
+        cache = WeatherCache()
+        cache.set('current', 'city:1', {'temperature_c': 1}, ttl=0)
+        self.assertIsNone(cache.get('current', 'city:1'))
+        self.assertEqual(cache.sets, 0)
+
+    def test_shared_delete_failure_is_logged(self):
+        cache = WeatherCache(alias='default')
+        cache.set('current', 'city:1', {'temperature_c': 1}, ttl=60)
+
+        with mock.patch.object(cache.shared, 'delete', side_effect=ConnectionError), \
+                self.assertLogs('weather_app.cache', 'ERROR'):
+            cache.delete('current', 'city:1')
+
+        self.assertIs(cache.local.get(('current', 'city:1')), MISSING)
+
+
+@override_settings(WEATHER_CACHE_CURRENT_REFRESH=600, WEATHER_CACHE_MIN_TTL=60, WEATHER_CACHE_FORECAST_MAX_TTL=10800)
+class TTLTests(SimpleTestCase):
+    def test_current_ttl_runs_until_next_observation(self):
+        now = datetime.now(tz=dt_timezone.utc)
+        self.assertAlmostEqual(current_weather_ttl(now - timedelta(seconds=200)), 400, delta=2)
+        # Quan trắc sắp hết chu kỳ vẫn được cache ít nhất WEATHER_CACHE_MIN_TTL
+        self.assertEqual(current_weather_ttl(now - timedelta(seconds=590)), 60)
+
+    def test_forecast_ttl_runs_until_next_step(self):
+        now = datetime.now(tz=dt_timezone.utc)
+        self.assertAlmostEqual(forecast_ttl(now + timedelta(minutes=30)), 1800, delta=2)
+        self.assertEqual(forecast_ttl(now + timedelta(hours=12)), 10800)
+        self.assertEqual(forecast_ttl(None), 60)
+
+
+class ReadThroughCacheTests(WeatherTestCase):
+    def test_second_lookup_is_served_from_cache(self):
+        first = WeatherService.get_current_weather('Hanoi')
+        second = WeatherService.get_current_weather('Hanoi')
+
+        self.assertEqual(first, second)
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+        stats = get_weather_cache().stats()
+        self.assertEqual(stats['local_hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_forecast_is_cached_separately_from_current_weather(self):
+        WeatherService.get_current_weather('Paris')
+        WeatherService.get_weather_forecast('Paris')
+        WeatherService.get_weather_forecast('Paris')
+
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+        self.assertEqual(upstream.endpoint_calls('forecast'), 1)
+
+    def test_unknown_city_is_negatively_cached(self):
+        self.assertIsNone(WeatherService.get_current_weather('Atlantis'))
+        self.assertIsNone(WeatherService.get_current_weather('Atlantis'))
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
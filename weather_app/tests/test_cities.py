@@ -0,0 +1,56 @@
+from weather_app.cache import MISSING
+from weather_app.cities import get_city_cache
+from weather_app.models import City
+
+from .base import WeatherTestCase
+
+
+class CityIdentityCacheTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hanoi = City.objects.create(
+            name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412, openweather_id=1581130,
+        )
+
+    def test_known_city_resolves_without_queries_after_warm_up(self):
+        cache = get_city_cache()
+        cache.resolve('Paris', 'FR', 48.8534, 2.3488)
+
+        with self.assertNumQueries(0):
+            city = cache.resolve('Hanoi', 'VN', 21.0245, 105.8412, openweather_id=1581130)
+            by_float = cache.resolve('Hanoi', 'VN', 21.02449999, 105.84120001)
+
+        self.assertEqual((city, by_float), (self.hanoi, self.hanoi))
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_new_city_is_created_once(self):
+        cache = get_city_cache()
+        first = cache.resolve('Paris', 'FR', 48.8534, 2.3488, openweather_id=2988507)
+
+        with self.assertNumQueries(0):
+            second = cache.resolve('Paris', 'FR', 48.8534, 2.3488, openweather_id=2988507)
+
+        self.assertEqual(first, second)
+        self.assertEqual(City.objects.filter(name='Paris').count(), 1)
+
+    def test_saved_city_replaces_its_old_keys(self):
+        cache = get_city_cache()
+        cache.resolve('Hanoi', 'VN', 21.0245, 105.8412)
+
+        self.hanoi.name = 'Ha Noi'
+        self.hanoi.save()
+
+        self.assertIs(cache.lookup('Hanoi', 'VN', 21.0245, 105.8412), MISSING)
+        self.assertEqual(cache.lookup('Ha Noi', 'VN', 21.0245, 105.8412).name, 'Ha Noi')
+        self.assertEqual(cache.lookup('', '', 0, 0, openweather_id=1581130).name, 'Ha Noi')
+
+    def test_deleted_city_is_evicted(self):
+        cache = get_city_cache()
+        cache.resolve('Hanoi', 'VN', 21.0245, 105.8412)
+
+        self.hanoi.delete()
+
+        self.assertIs(cache.lookup('Hanoi', 'VN', 21.0245, 105.8412), MISSING)
+        self.assertIs(cache.lookup('', '', 0, 0, openweather_id=1581130), MISSING)
+        recreated = cache.resolve('Hanoi', 'VN', 21.0245, 105.8412)
+        self.assertTrue(City.objects.filter(pk=recreated.pk).exists())
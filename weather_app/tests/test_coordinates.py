@@ -0,0 +1,37 @@
+from weather_app.models import City
+from weather_app.services import WeatherService
+
+from .base import WeatherTestCase
+from .stubs import upstream
+
+
+class CoordTargetTests(WeatherTestCase):
+    def test_nearby_coordinates_share_cache_entry(self):
+        first = WeatherService.coord_target(10.012, 20.018)
+        second = WeatherService.coord_target(9.991, 19.981)
+
+        self.assertEqual(first.key, second.key)
+        self.assertEqual(first.params, {'lat': 10.0, 'lon': 20.0})
+        self.assertNotEqual(WeatherService.coord_target(10.04, 20.0).key, first.key)
+
+        for lat, lon in [(10.012, 20.018), (9.991, 19.981)]:
+            response = self.client.get('/api/weather/current', {'lat': lat, 'lon': lon})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+
+    def test_coordinates_near_a_city_use_the_city_entry(self):
+        hanoi = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        WeatherService.get_current_weather_for(WeatherService.city_target(hanoi))
+
+        target = WeatherService.coord_target(21.031, 105.852)
+
+        self.assertEqual(target.city, hanoi)
+        self.assertEqual(target.key, WeatherService.city_target(hanoi).key)
+        self.assertEqual(self.client.get('/api/weather/current', {'lat': 21.019, 'lon': 105.83}).json()['city'], 'Hanoi, VN')
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+
+    def test_invalid_coordinates_are_rejected(self):
+        for params in [{'lat': 91, 'lon': 0}, {'lat': 'north', 'lon': 0}, {'lat': 10}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/weather/current', params).status_code, 400)
+        self.assertEqual(upstream.calls, [])
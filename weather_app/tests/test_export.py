@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+import pyarrow.parquet as pq
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from weather_app.export import aiter_chunks, iter_row_chunks, stream_export
+from weather_app.models import City, User, WeatherData
+
+from .base import WeatherTestCase, observation
+
+
+class ExportTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        hanoi = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        paris = City.objects.create(name='Paris', country_code='FR', latitude=48.8534, longitude=2.3488)
+        start = timezone.now().replace(microsecond=0) - timedelta(hours=4)
+        # Hai City cùng các mốc observed_at: ranh giới lô (chunk_size=3) rơi vào giữa các dòng cùng thời điểm
+        WeatherData.objects.bulk_create([
+            observation(city, start + timedelta(hours=hour), temperature=20 + hour)
+            for hour in range(4)
+            for city in (hanoi, paris)
+        ])
+        self.hanoi = hanoi
+        self.ids = list(WeatherData.objects.order_by('pk').values_list('pk', flat=True))
+
+    def test_keyset_chunks_cover_every_row_once(self):
+        chunks = list(iter_row_chunks(WeatherData.objects.all(), ['id', 'observed_at'], chunk_size=3))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 2])
+        self.assertEqual([row[0] for chunk in chunks for row in chunk], self.ids)
+
+    def test_csv_stream_matches_database(self):
+        chunks = list(stream_export('observations', 'csv', chunk_size=3))
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([int(row['id']) for row in rows], self.ids)
+        first = WeatherData.objects.select_related('city').get(pk=self.ids[0])
+        self.assertEqual(rows[0]['city_name'], first.city.name)
+        self.assertEqual(rows[0]['observed_at'], first.observed_at.isoformat())
+        self.assertEqual(float(rows[0]['temperature_c']), float(first.temperature_c))
+
+    def test_ndjson_stream_is_filtered_by_city_and_time(self):
+        start = WeatherData.objects.order_by('observed_at').values_list('observed_at', flat=True)[2]
+
+        lines = b''.join(stream_export('observations', 'ndjson', city_id=self.hanoi.pk, start=start)).splitlines()
+
+        records = [json.loads(line) for line in lines]
+        expected = WeatherData.objects.filter(city=self.hanoi, observed_at__gte=start).order_by('pk')
+        self.assertEqual([record['id'] for record in records], list(expected.values_list('pk', flat=True)))
+        self.assertEqual({record['city_country_code'] for record in records}, {'VN'})
+
+    def test_parquet_has_one_row_group_per_chunk(self):
+        data = b''.join(stream_export('observations', 'parquet', chunk_size=3))
+
+        parquet = pq.ParquetFile(io.BytesIO(data))
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        table = parquet.read()
+        self.assertEqual(table.column('id').to_pylist(), self.ids)
+        self.assertEqual(table.column('temperature_c').to_pylist()[:2], [20.0, 20.0])
+
+    def test_invalid_dataset_or_format_is_rejected(self):
+        with self.assertRaises(ValueError):
+            stream_export('users', 'csv')
+        with self.assertRaises(ValueError):
+            stream_export('observations', 'xlsx')
+
+    async def test_aiter_chunks_yields_the_same_stream(self):
+        expected = await sync_to_async(lambda: b''.join(stream_export('observations', 'ndjson', chunk_size=3)))()
+
+        chunks = [chunk async for chunk in aiter_chunks(stream_export('observations', 'ndjson', chunk_size=3))]
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(b''.join(chunks), expected)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'observations.ndjson')
+            out = io.StringIO()
+
+            call_command('export_weather_data', 'observations', '--format', 'ndjson', '-o', path, '--chunk-size', '3', stdout=out)
+
+            with open(path, 'rb') as handle:
+                data = handle.read()
+        self.assertEqual([json.loads(line)['id'] for line in data.splitlines()], self.ids)
+        self.assertIn(f'Wrote {len(data)} bytes', out.getvalue())
+
+    @override_settings(WEATHER_EXPORT_CHUNK_SIZE=3)
+    def test_view_streams_for_staff_only(self):
+        user = User.objects.create_user(username='alice', password='secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/api/weather/export').status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get('/api/weather/export', {'format': 'csv'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([int(row['id']) for row in rows], self.ids)
+        self.assertEqual(self.client.get('/api/weather/export', {'format': 'xlsx'}).status_code, 400)
+
@@ -0,0 +1,93 @@
+from datetime import timedelta
+from unittest import mock
+
+from weather_app.history import SearchHistoryBuffer, get_history_buffer
+from weather_app.models import City, SearchHistory, User
+
+from .base import WeatherTestCase
+
+
+class SearchHistoryBufferTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.buffer = SearchHistoryBuffer(flush_size=1000, flush_interval=3600, max_per_user=3)
+
+    def test_repeated_query_is_coalesced(self):
+        self.buffer.record(self.user, 'Hanoi')
+        self.buffer.record(self.user, '  hanoi ')
+        self.buffer.record(self.user, 'Paris')
+
+        self.assertEqual([event.query for event in self.buffer.pending_for(self.user.pk)], ['Paris', 'Hanoi'])
+        self.assertEqual(self.buffer.stats()['coalesced'], 1)
+        self.assertEqual(SearchHistory.objects.count(), 0)
+
+    def test_flush_keeps_newest_rows_per_user(self):
+        for query in ['Hanoi', 'Paris', 'Tokyo', 'London', 'Berlin']:
+            self.buffer.record(self.user, query)
+
+        self.assertEqual(self.buffer.flush(), 5)
+
+        stored = SearchHistory.objects.filter(user=self.user).order_by('-searched_at', '-id')
+        self.assertEqual([row.query for row in stored], ['Berlin', 'London', 'Tokyo'])
+        self.assertEqual(self.buffer.stats()['trimmed'], 2)
+        self.assertEqual(self.buffer.pending_for(self.user.pk), [])
+
+    def test_merge_pending_puts_unwritten_events_first(self):
+        self.buffer.record(self.user, 'Hanoi')
+        self.buffer.flush()
+        self.buffer.record(self.user, 'Paris')
+        stored = list(SearchHistory.objects.filter(user=self.user))
+        stored[0].searched_at -= timedelta(minutes=1)
+
+        merged = self.buffer.merge_pending(self.user.pk, stored, limit=1)
+
+        self.assertEqual([event.query for event in merged], ['Paris'])
+
+    def test_batch_being_written_stays_visible(self):
+        self.buffer.record(self.user, 'Hanoi')
+        bulk_create = SearchHistory.objects.bulk_create
+        seen = {}
+
+        def slow_bulk_create(batch, **kwargs):
+            seen['before'] = self.buffer.merge_pending(self.user.pk, [], limit=10)
+            rows = bulk_create(batch, **kwargs)
+            stored = list(SearchHistory.objects.filter(user=self.user))
+            seen['after'] = self.buffer.merge_pending(self.user.pk, stored, limit=10)
+            return rows
+
+        with mock.patch.object(SearchHistory.objects, 'bulk_create', side_effect=slow_bulk_create):
+            self.buffer.flush()
+
+        self.assertEqual([event.query for event in seen['before']], ['Hanoi'])
+        self.assertEqual([event.query for event in seen['after']], ['Hanoi'])
+        self.assertEqual(self.buffer.pending_for(self.user.pk), [])
+        self.assertEqual(self.buffer.stats()['in_flight'], 0)
+
+    def test_anonymous_searches_are_ignored(self):
+        self.buffer.record(None, 'Hanoi')
+        self.assertEqual(self.buffer.stats()['recorded'], 0)
+
+
+class SearchHistoryViewTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='bob', password='secret')
+        self.client.force_login(self.user)
+
+    def test_failed_lookup_is_not_recorded(self):
+        response = self.client.get('/api/weather/current', {'city': 'Atlantis'})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(get_history_buffer().pending_for(self.user.pk), [])
+
+    def test_successful_lookup_is_recorded_with_matched_city(self):
+        response = self.client.get('/api/weather/current', {'city': 'Hanoi'})
+
+        self.assertEqual(response.status_code, 200)
+        pending = get_history_buffer().pending_for(self.user.pk)
+        self.assertEqual([event.query for event in pending], ['Hanoi'])
+        self.assertEqual(pending[0].matched_city, City.objects.get(name='Hanoi'))
+
+        history = self.client.get('/api/search/history').json()['history']
+        self.assertEqual(history[0]['matched_city'], 'Hanoi, VN')
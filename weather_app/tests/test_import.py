@@ -0,0 +1,82 @@
+import csv
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from weather_app.bulk_import import import_file
+from weather_app.models import City, LatestObservation, WeatherData
+
+from .base import WeatherTestCase, observation
+
+COLUMNS = ['city', 'country_code', 'observed_at', 'temperature_c', 'humidity_pct', 'pressure_hpa', 'wind_speed_ms']
+
+
+class ImportFileTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.checkpoints = os.path.join(self.directory.name, 'checkpoints')
+        self.observed_at = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+
+    def write_csv(self, name: str, rows: list) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+        return path
+
+    def rows(self, temperature: float) -> list:
+        return [
+            ['Hanoi', 'VN', self.observed_at.isoformat(), temperature, 70, 1008, 3],
+            ['Hanoi', 'VN', (self.observed_at - timedelta(hours=1)).isoformat(), temperature, 70, 1008, 3],
+            ['Hanoi', 'VN', self.observed_at.isoformat(), 'hot', 70, 1008, 3],
+            ['Hanoi', 'VN', (self.observed_at - timedelta(hours=2)).isoformat(), temperature, 180, 1008, 3],
+            ['Atlantis', 'XX', self.observed_at.isoformat(), temperature, 70, 1008, 3],
+        ]
+
+    def test_invalid_rows_are_counted_and_skipped(self):
+        stats = import_file(self.write_csv('first.csv', self.rows(25)), checkpoint_dir=self.checkpoints)
+
+        self.assertEqual((stats.rows, stats.valid, stats.written), (5, 2, 2))
+        self.assertEqual((stats.invalid, stats.unknown_city), (2, 1))
+        self.assertEqual(WeatherData.objects.filter(city=self.city, source='import').count(), 2)
+        self.assertEqual(LatestObservation.objects.get(city=self.city).observed_at, self.observed_at)
+
+    def test_finished_file_is_not_read_again(self):
+        path = self.write_csv('first.csv', self.rows(25))
+        import_file(path, checkpoint_dir=self.checkpoints)
+
+        stats = import_file(path, checkpoint_dir=self.checkpoints)
+
+        self.assertEqual(stats.rows, 0)
+        self.assertEqual(stats.resumed_from, os.path.getsize(path))
+
+    def test_reimport_keeps_existing_rows_and_latest_observation(self):
+        import_file(self.write_csv('first.csv', self.rows(25)), checkpoint_dir=self.checkpoints)
+
+        stats = import_file(self.write_csv('second.csv', self.rows(31)), checkpoint_dir=self.checkpoints)
+
+        self.assertEqual((stats.valid, stats.written), (2, 0))
+        self.assertEqual(set(WeatherData.objects.values_list('temperature_c', flat=True)), {Decimal('25.00')})
+        self.assertEqual(LatestObservation.objects.get(city=self.city).temperature_c, Decimal('25.00'))
+
+    def test_existing_keys_are_looked_up_exactly(self):
+        between = observation(self.city, self.observed_at - timedelta(minutes=30), temperature=19)
+        between.save()
+        rows = self.rows(25)[:2]
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = import_file(self.write_csv('first.csv', rows), checkpoint_dir=self.checkpoints)
+
+        self.assertEqual(stats.written, 2)
+        lookup = next(query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "WeatherData"' in query['sql'])
+        self.assertNotIn('BETWEEN', lookup)
+        self.assertEqual(WeatherData.objects.get(pk=between.pk).temperature_c, Decimal('19.00'))
@@ -0,0 +1,101 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from weather_app.ingest import (
+    forecast_ingest_stats, get_observation_index, store_forecasts, store_observations, write_observations,
+)
+from weather_app.models import City, ForecastRun, LatestObservation, WeatherData, WeatherForecast
+
+from .base import WeatherTestCase, observation
+
+
+class ObservationIngestTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.observed_at = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+
+    def test_reingesting_the_same_observation_is_skipped(self):
+        store_observations([observation(self.city, self.observed_at)])
+        with self.assertNumQueries(0):
+            written = store_observations([observation(self.city, self.observed_at)])
+
+        self.assertEqual(written, [])
+        self.assertEqual(WeatherData.objects.count(), 1)
+        self.assertEqual(get_observation_index().stats()['skipped'], 1)
+
+    def test_upsert_overwrites_values_and_bumps_updated_at(self):
+        write_observations([observation(self.city, self.observed_at, temperature=25)])
+        first = WeatherData.objects.get()
+        write_observations([observation(self.city, self.observed_at, temperature=27)])
+
+        row = WeatherData.objects.get()
+        self.assertEqual(row.pk, first.pk)
+        self.assertEqual(row.temperature_c, Decimal('27.00'))
+        self.assertGreater(row.updated_at, first.updated_at)
+        self.assertEqual(LatestObservation.objects.get(city=self.city).temperature_c, Decimal('27.00'))
+
+    def test_duplicates_within_one_batch_are_written_once(self):
+        write_observations([
+            observation(self.city, self.observed_at, temperature=25),
+            observation(self.city, self.observed_at, temperature=26),
+        ])
+        self.assertEqual(WeatherData.objects.count(), 1)
+
+    def test_older_observation_does_not_replace_latest(self):
+        write_observations([observation(self.city, self.observed_at, temperature=25)])
+        write_observations([observation(self.city, self.observed_at - timedelta(hours=1), temperature=10)])
+
+        latest = LatestObservation.objects.get(city=self.city)
+        self.assertEqual(latest.observed_at, self.observed_at)
+        self.assertEqual(latest.temperature_c, Decimal('25.00'))
+        self.assertEqual(WeatherData.objects.count(), 2)
+
+
+class ForecastIngestTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hanoi = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.paris = City.objects.create(name='Paris', country_code='FR', latitude=48.8534, longitude=2.3488)
+        self.noon = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def forecast(self, city, day: int, temp_max=30) -> WeatherForecast:
+        return WeatherForecast(city=city, forecast_time=self.noon + timedelta(days=day), temp_min_c=20, temp_max_c=temp_max)
+
+    def test_counts_inserted_and_updated_rows(self):
+        first = store_forecasts([self.forecast(self.hanoi, day) for day in range(3)])
+        before = forecast_ingest_stats()
+
+        second = store_forecasts([
+            self.forecast(self.hanoi, 1, temp_max=31),
+            self.forecast(self.hanoi, 2, temp_max=32),
+            self.forecast(self.hanoi, 2, temp_max=33),
+            self.forecast(self.hanoi, 3),
+            self.forecast(self.paris, 0),
+        ])
+
+        self.assertEqual((first.inserted, first.updated), (3, 0))
+        self.assertEqual((second.inserted, second.updated), (2, 2))
+        after = forecast_ingest_stats()
+        self.assertEqual((after['inserted'] - before['inserted'], after['updated'] - before['updated']), (2, 2))
+        self.assertEqual(WeatherForecast.objects.count(), 5)
+        stored = WeatherForecast.objects.get(city=self.hanoi, forecast_time=self.noon + timedelta(days=2))
+        self.assertEqual(stored.temp_max_c, Decimal('33.00'))
+
+    def test_existing_rows_of_other_cities_are_not_counted_as_updates(self):
+        store_forecasts([self.forecast(self.hanoi, 0), self.forecast(self.paris, 1)])
+
+        result = store_forecasts([self.forecast(self.hanoi, 1), self.forecast(self.paris, 0)])
+
+        self.assertEqual((result.inserted, result.updated), (2, 0))
+
+    def test_rows_and_run_share_fetched_at(self):
+        fetched_at = timezone.now() - timedelta(minutes=1)
+        store_forecasts([self.forecast(self.hanoi, 0)])
+
+        store_forecasts([self.forecast(self.hanoi, 0, temp_max=35)], fetched_at=fetched_at)
+
+        self.assertEqual(WeatherForecast.objects.get(city=self.hanoi).fetched_at, fetched_at)
+        self.assertEqual(ForecastRun.objects.get(city=self.hanoi).fetched_at, fetched_at)
@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from weather_app.ingest import write_observations
+from weather_app.models import City, WeatherDataDaily
+from weather_app.observations import DAY, HOUR, decode_cursor, encode_cursor, observation_history
+from weather_app.retention import floor_day, rollup_weather_data
+
+from .base import WeatherTestCase, observation
+
+
+class CursorTests(SimpleTestCase):
+    def test_cursor_round_trip(self):
+        moment = timezone.now().replace(microsecond=0)
+        cursor = encode_cursor(moment.isoformat(), 42)
+
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), [moment, 42])
+
+    def test_invalid_cursor_raises_value_error(self):
+        invalid = [
+            'not base64!', encode_cursor(), encode_cursor('yesterday'), encode_cursor(123),
+            encode_cursor('2026-01-01T00:00:00'), encode_cursor('2026-13-01T00:00:00Z'),
+        ]
+        for cursor in invalid:
+            with self.subTest(cursor=cursor), self.assertRaisesMessage(ValueError, 'cursor'):
+                decode_cursor(cursor)
+
+
+@override_settings(WEATHER_ROLLUP_LAG_SECONDS=0)
+class ObservationHistoryTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.day = floor_day(timezone.now() - timedelta(days=2))
+        self.end = self.day + timedelta(days=1)
+        write_observations([
+            observation(self.city, self.day + timedelta(hours=hour, minutes=minute), temperature=20 + hour)
+            for hour in range(3) for minute in (0, 30)
+        ])
+
+    def pages(self, **kwargs) -> list:
+        pages, cursor = [], None
+        while True:
+            page = observation_history(self.city.pk, self.day, self.end, limit=4, cursor=cursor, **kwargs)
+            pages.append(page['results'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_raw_pages_follow_cursor(self):
+        pages = self.pages()
+
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        moments = [row['observed_at'] for page in pages for row in page]
+        self.assertEqual(moments, sorted(moments))
+        self.assertEqual(len(set(moments)), 6)
+
+    def test_hour_buckets_from_raw_rows_before_first_rollup(self):
+        [rows] = self.pages(bucket=HOUR)
+
+        self.assertEqual([row['sample_count'] for row in rows], [2, 2, 2])
+        self.assertEqual([row['temp_avg_c'] for row in rows], [20.0, 21.0, 22.0])
+
+    def test_late_rows_are_included_after_rollup(self):
+        rollup_weather_data()
+        # Quan trắc cũ tới muộn: bảng tổng hợp chưa có, phải tính từ dữ liệu gốc
+        write_observations([observation(self.city, self.day + timedelta(hours=1, minutes=45), temperature=24)])
+
+        [rows] = self.pages(bucket=HOUR)
+        self.assertEqual([row['sample_count'] for row in rows], [2, 3, 2])
+        self.assertEqual(rows[1]['temp_max_c'], 24.0)
+
+        [days] = self.pages(bucket=DAY)
+        self.assertEqual([row['sample_count'] for row in days], [7])
+
+    def test_pruned_days_are_served_from_rollups(self):
+        rollup_weather_data()
+        WeatherDataDaily.objects.filter(city=self.city).update(raw_pruned=True)
+        write_observations([observation(self.city, self.day + timedelta(hours=1, minutes=45), temperature=24)])
+
+        [rows] = self.pages(bucket=HOUR)
+        self.assertEqual([row['sample_count'] for row in rows], [2, 2, 2])
+
+    def test_bucket_pages_follow_cursor(self):
+        rollup_weather_data()
+
+        page = observation_history(self.city.pk, self.day, self.end, bucket=HOUR, limit=2)
+        rest = observation_history(self.city.pk, self.day, self.end, bucket=HOUR, limit=2, cursor=page['next_cursor'])
+
+        self.assertEqual(len(page['results']), 2)
+        self.assertEqual([row['bucket_start'] for row in rest['results']], [(self.day + timedelta(hours=2)).isoformat()])
+        self.assertIsNone(rest['next_cursor'])
+
+    def test_view_rejects_bad_cursor(self):
+        response = self.client.get('/api/weather/history', {'city_id': self.city.pk, 'cursor': 'garbage'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class HistoryEndpointTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+
+    def get(self, **params):
+        return self.client.get('/api/weather/history', {'city_id': self.city.pk, **params})
+
+    def test_pages_follow_cursor(self):
+        start = floor_day(timezone.now() - timedelta(days=1))
+        write_observations([observation(self.city, start + timedelta(hours=hour)) for hour in range(3)])
+
+        first = self.get(start=start.isoformat(), limit=2).json()
+        second = self.get(start=start.isoformat(), limit=2, cursor=first['next_cursor']).json()
+
+        self.assertEqual((len(first['results']), len(second['results'])), (2, 1))
+        self.assertIsNone(second['next_cursor'])
+
+    def test_bad_bucket_or_cursor_is_rejected(self):
+        cursors = [
+            'not base64!', encode_cursor('2026-01-01T00:00:00'), encode_cursor('2026-13-01T00:00:00Z'),
+            encode_cursor('9999-12-31T23:59:59Z'), encode_cursor('2026-01-01T00:00:00Z', 10 ** 30),
+            encode_cursor('2026-01-01T00:00:00Z', 'x'),
+        ]
+        for bucket in ['raw', HOUR, DAY]:
+            for cursor in cursors:
+                with self.subTest(bucket=bucket, cursor=cursor):
+                    response = self.get(bucket=bucket, cursor=cursor)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+        self.assertEqual(self.get(bucket='week').json(), {'error': 'Invalid bucket'})
+        self.assertEqual(self.get(start='yesterday').status_code, 400)
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import Permission
+from django.test import override_settings
+from django.utils import timezone
+
+from weather_app.aliases import get_alias_index
+from weather_app.models import City, LatestObservation, User, WeatherData
+
+from .base import WeatherTestCase
+
+URL = '/api/weather/ingest'
+
+
+class WeatherIngestViewTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.station = User.objects.create_user(username='station', password='secret')
+        self.station.user_permissions.add(Permission.objects.get(codename='add_weatherdata'))
+        self.observed_at = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+
+    def row(self, **overrides) -> dict:
+        row = {
+            'city_id': self.city.pk, 'observed_at': self.observed_at.isoformat(), 'temperature_c': 28.4,
+            'humidity_pct': 75, 'pressure_hpa': 1009, 'wind_speed_ms': 2.5,
+        }
+        row.update(overrides)
+        return row
+
+    def post(self, body, user=None):
+        self.client.force_login(user or self.station)
+        return self.client.post(URL, body, content_type='application/json')
+
+    def test_batch_is_accepted_and_reingest_is_idempotent(self):
+        body = {'observations': [self.row(), self.row(humidity_pct=120), self.row(city_id=999999)]}
+
+        response = self.post(body)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'accepted': 1, 'rejected': [
+            {'index': 1, 'error': 'humidity_pct out of range'},
+            {'index': 2, 'error': 'unknown city'},
+        ]})
+        latest = LatestObservation.objects.get(city=self.city)
+        self.assertEqual((latest.observed_at, latest.source), (self.observed_at, 'station'))
+
+        self.assertEqual(self.post([self.row(temperature_c=29)]).json()['accepted'], 1)
+        stored = WeatherData.objects.get(city=self.city)
+        self.assertEqual(float(stored.temperature_c), 29.0)
+
+    def test_city_name_matches_without_diacritics(self):
+        get_alias_index().learn(self.city, 'Hà Nội')
+        rows = [
+            self.row(city_id=None, city=name, country_code=country, observed_at=(self.observed_at - timedelta(minutes=i)).isoformat())
+            for i, (name, country) in enumerate([('Hà Nội', 'vn'), ('HA NOI', 'VN')])
+        ]
+
+        response = self.post(rows)
+
+        self.assertEqual(response.json(), {'accepted': 2, 'rejected': []})
+        self.assertEqual(WeatherData.objects.filter(city=self.city).count(), 2)
+
+    def test_future_observation_is_rejected(self):
+        response = self.post([self.row(observed_at=(timezone.now() + timedelta(hours=1)).isoformat())])
+
+        self.assertEqual(response.json()['rejected'], [{'index': 0, 'error': 'observed_at is in the future'}])
+        self.assertFalse(WeatherData.objects.exists())
+
+    def test_empty_or_non_list_body_is_rejected(self):
+        for body in [[], {'observations': []}, {'observations': self.row()}, 'hello']:
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+
+    def test_user_without_permission_is_forbidden(self):
+        visitor = User.objects.create_user(username='visitor', password='secret')
+
+        self.assertEqual(self.post([self.row()], user=visitor).status_code, 403)
+        self.assertFalse(WeatherData.objects.exists())
+
+    @override_settings(WEATHER_INGEST_MAX_ROWS=2)
+    def test_oversized_batch_is_rejected(self):
+        rows = [self.row(observed_at=(self.observed_at - timedelta(minutes=i)).isoformat()) for i in range(3)]
+
+        self.assertEqual(self.post(rows).status_code, 413)
+        self.assertEqual(self.post(rows[:2]).json()['accepted'], 2)
@@ -0,0 +1,81 @@
+import httpx
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+from weather_app.quota import BACKGROUND, INTERACTIVE, QuotaManager, current_lane, quota_lane
+from weather_app.upstream import QuotaRetry, get_async_client
+
+from .base import WeatherTestCase
+from .stubs import upstream
+
+
+class QuotaManagerTests(SimpleTestCase):
+    def test_background_lane_leaves_the_interactive_reserve(self):
+        quota = QuotaManager(calls_per_minute=60, burst=10, interactive_reserve=0.2, wait_timeout=0)
+
+        background = [quota.acquire(BACKGROUND) for _ in range(10)]
+        interactive = [quota.acquire(INTERACTIVE) for _ in range(3)]
+
+        self.assertEqual(background.count(True), 8)
+        self.assertEqual(interactive, [True, True, False])
+        self.assertEqual(quota.granted, {INTERACTIVE: 2, BACKGROUND: 8})
+        self.assertEqual(quota.rejected, {INTERACTIVE: 1, BACKGROUND: 2})
+
+    def test_lane_follows_the_context(self):
+        quota = QuotaManager(calls_per_minute=60, burst=10, wait_timeout=0)
+        with quota_lane(BACKGROUND):
+            self.assertEqual(current_lane(), BACKGROUND)
+            quota.acquire()
+        self.assertEqual(current_lane(), INTERACTIVE)
+        self.assertEqual(quota.granted[BACKGROUND], 1)
+
+    def test_lane_wait_timeout_override(self):
+        # 10 token/giây, bucket 1 token: lời gọi thứ hai phải chờ ~0.1s
+        quota = QuotaManager(calls_per_minute=600, burst=1, interactive_reserve=0, background_wait_timeout=0)
+        self.assertTrue(quota.acquire(BACKGROUND))
+        self.assertFalse(quota.acquire(BACKGROUND))
+        with quota_lane(BACKGROUND, wait_timeout=1):
+            self.assertTrue(quota.acquire())
+
+    def test_rejected_background_calls_leave_shared_headroom(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        quota = QuotaManager(calls_per_minute=10, burst=100, interactive_reserve=0.2, wait_timeout=0, alias='default')
+
+        background = [quota.acquire(BACKGROUND) for _ in range(20)]
+        interactive = [quota.acquire(INTERACTIVE) for _ in range(3)]
+
+        self.assertEqual(background.count(True), 8)
+        self.assertEqual(interactive, [True, True, False])
+        # Lần bị bộ đếm chung từ chối không tiêu token trong process
+        self.assertAlmostEqual(quota.bucket.available(), 90, delta=0.5)
+
+
+@override_settings(WEATHER_QUOTA_CALLS_PER_MINUTE=60, WEATHER_QUOTA_BURST=2, WEATHER_QUOTA_WAIT_TIMEOUT=0)
+class RetryQuotaTests(WeatherTestCase):
+    def test_each_retry_takes_quota(self):
+        retry = QuotaRetry(total=3, connect=3)
+        retry = retry.increment('GET', '/weather', error=ConnectTimeoutError())
+        retry = retry.increment('GET', '/weather', error=ConnectTimeoutError())
+
+        with self.assertRaises(MaxRetryError):
+            retry.increment('GET', '/weather', error=ConnectTimeoutError())
+
+    @override_settings(WEATHER_HTTP_MAX_RETRIES=3, WEATHER_HTTP_BACKOFF_FACTOR=0)
+    async def test_async_retries_stop_when_quota_is_exhausted(self):
+        upstream.fail = True
+
+        with self.assertRaises(httpx.ConnectError):
+            await get_async_client().get('weather', {'q': 'Hanoi'})
+        self.assertEqual(upstream.endpoint_calls('weather'), 2)
+
+
+@override_settings(WEATHER_QUOTA_CALLS_PER_MINUTE=60, WEATHER_QUOTA_BURST=1, WEATHER_QUOTA_WAIT_TIMEOUT=0)
+class QuotaExhaustedTests(WeatherTestCase):
+    def test_exhausted_quota_answers_503_without_calling_upstream(self):
+        self.assertEqual(self.client.get('/api/weather/current', {'city': 'Hanoi'}).status_code, 200)
+        response = self.client.get('/api/weather/current', {'city': 'Paris'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
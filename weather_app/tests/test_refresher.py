@@ -0,0 +1,80 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from weather_app.cache import city_cache_key, get_weather_cache
+from weather_app.models import City, LatestObservation, RefreshCycle, User, UserFavoriteLocation
+from weather_app.refresher import refresh_cycle
+
+from .base import WeatherTestCase
+from .stubs import CITIES, upstream
+
+
+class StopLoop(Exception):
+    pass
+
+
+class RefreshCycleTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user(username='alice', password='secret')
+        self.cities = []
+        for key in ('hanoi', 'paris'):
+            data = CITIES[key]
+            city = City.objects.create(
+                name=data['name'], country_code=data['country'], latitude=data['lat'], longitude=data['lon'],
+                openweather_id=data['id'],
+            )
+            UserFavoriteLocation.objects.create(user=user, city=city)
+            self.cities.append(city)
+
+    def test_cycle_groups_current_weather_and_fetches_forecasts(self):
+        cycle = refresh_cycle(top_n=10, interval=300, lead=300, quota_share=1)
+
+        self.assertEqual(upstream.endpoint_calls('group'), 1)
+        self.assertEqual(upstream.endpoint_calls('forecast'), 2)
+        self.assertEqual((cycle.ranked, cycle.upstream_calls, cycle.failed), (2, 3, 0))
+        self.assertEqual((cycle.current_refreshed, cycle.forecast_refreshed), (2, 2))
+        self.assertEqual(LatestObservation.objects.count(), 2)
+        self.assertIsNotNone(get_weather_cache().get('current', city_cache_key(self.cities[0].pk)))
+
+    def test_fresh_data_is_not_fetched_again(self):
+        refresh_cycle(top_n=10, interval=300, lead=300, quota_share=1)
+        upstream.reset()
+
+        # lead=0: mốc dự báo kế tiếp của stub có thể chỉ còn vài phút nữa, khi đó dự báo được lấy trước hạn
+        cycle = refresh_cycle(top_n=10, interval=300, lead=0, quota_share=1)
+
+        self.assertEqual((cycle.upstream_calls, len(upstream.calls)), (0, 0))
+        self.assertEqual(RefreshCycle.objects.count(), 2)
+
+    def test_upstream_failure_is_counted(self):
+        upstream.fail = True
+        with self.assertLogs('weather_app', 'WARNING'):
+            cycle = refresh_cycle(top_n=10, interval=300, lead=300, quota_share=1)
+
+        self.assertEqual((cycle.current_refreshed, cycle.failed), (0, 4))
+
+
+class RefreshCommandTests(WeatherTestCase):
+    def test_failed_cycle_does_not_stop_the_loop(self):
+        cycle = RefreshCycle(
+            started_at=timezone.now(), ranked=0, upstream_calls=0, deferred=0, current_refreshed=0,
+            forecast_refreshed=0, failed=0, rank_seconds=0, fetch_seconds=0, write_seconds=0, total_seconds=0,
+        )
+        side_effects = [RuntimeError('database is gone'), cycle]
+        out = StringIO()
+        with mock.patch('weather_app.management.commands.refresh_weather.refresh_cycle', side_effect=side_effects), \
+                mock.patch('weather_app.management.commands.refresh_weather.time.sleep', side_effect=[None, StopLoop]), \
+                self.assertLogs('weather_app.management.commands.refresh_weather', 'ERROR'):
+            with self.assertRaises(StopLoop):
+                call_command('refresh_weather', interval=1, stdout=out)
+
+        self.assertIn('ranked 0', out.getvalue())
+
+    def test_failed_cycle_is_raised_with_once(self):
+        with mock.patch('weather_app.management.commands.refresh_weather.refresh_cycle', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command('refresh_weather', once=True, stdout=StringIO())
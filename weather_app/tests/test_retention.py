@@ -0,0 +1,119 @@
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import F
+from django.test import override_settings
+from django.utils import timezone
+
+from weather_app.ingest import write_observations
+from weather_app.models import City, WeatherData, WeatherDataDaily, WeatherDataHourly
+from weather_app.retention import floor_day, prune_weather_data, rollup_weather_data
+
+from .base import WeatherTestCase, observation
+
+
+@override_settings(WEATHER_ROLLUP_LAG_SECONDS=0)
+class RollupPruneTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.day = floor_day(timezone.now() - timedelta(days=40))
+        write_observations([
+            observation(self.city, self.day + timedelta(hours=1), temperature=20),
+            observation(self.city, self.day + timedelta(hours=1, minutes=30), temperature=22),
+            observation(self.city, self.day + timedelta(hours=5), temperature=30),
+        ])
+
+    def daily(self) -> WeatherDataDaily:
+        return WeatherDataDaily.objects.get(city=self.city, bucket_start=self.day)
+
+    def test_rollup_builds_hourly_and_daily_buckets(self):
+        stats = rollup_weather_data()
+
+        self.assertEqual(stats, {'cities': 1, 'hourly': 2, 'daily': 1})
+        hour = WeatherDataHourly.objects.get(city=self.city, bucket_start=self.day + timedelta(hours=1))
+        self.assertEqual((hour.sample_count, hour.temp_avg_c), (2, Decimal('21.00')))
+        self.assertEqual((self.daily().sample_count, self.daily().temp_avg_c), (3, Decimal('24.00')))
+
+    def test_rollup_is_idempotent(self):
+        rollup_weather_data()
+        self.assertEqual(rollup_weather_data(), {'cities': 0, 'hourly': 0, 'daily': 0})
+        self.assertEqual(self.daily().sample_count, 3)
+
+    def test_overwritten_day_is_kept_until_rolled_up_again(self):
+        rollup_weather_data()
+        # Trạm gửi lại quan trắc lúc 05:00 với giá trị đã hiệu chỉnh sau khi ngày đã được tổng hợp
+        write_observations([observation(self.city, self.day + timedelta(hours=5), temperature=24)])
+
+        self.assertEqual(prune_weather_data(raw_days=30, hourly_days=0)['raw'], 0)
+        self.assertEqual(WeatherData.objects.filter(city=self.city).count(), 3)
+
+        rollup_weather_data()
+        self.assertEqual(self.daily().temp_avg_c, Decimal('22.00'))
+        self.assertEqual(self.daily().temp_max_c, Decimal('24.00'))
+
+        self.assertEqual(prune_weather_data(raw_days=30, hourly_days=0)['raw'], 3)
+        self.assertFalse(WeatherData.objects.filter(city=self.city).exists())
+        self.assertEqual(self.daily().sample_count, 3)
+
+    def test_late_row_for_pruned_day_keeps_rollup(self):
+        rollup_weather_data()
+        prune_weather_data(raw_days=30, hourly_days=0)
+        self.assertTrue(self.daily().raw_pruned)
+
+        write_observations([observation(self.city, self.day + timedelta(hours=1, minutes=10), temperature=40)])
+        rollup_weather_data()
+
+        self.assertEqual((self.daily().sample_count, self.daily().temp_avg_c), (3, Decimal('24.00')))
+        hour = WeatherDataHourly.objects.get(city=self.city, bucket_start=self.day + timedelta(hours=1))
+        self.assertEqual((hour.sample_count, hour.temp_max_c), (2, Decimal('22.00')))
+
+    def test_prune_waits_for_first_rollup(self):
+        with self.assertLogs('weather_app.retention', 'WARNING'):
+            self.assertEqual(prune_weather_data(raw_days=30, hourly_days=0)['raw'], 0)
+        self.assertEqual(WeatherData.objects.count(), 3)
+
+    def test_recent_rows_are_not_pruned(self):
+        write_observations([observation(self.city, timezone.now() - timedelta(hours=1))])
+        rollup_weather_data()
+
+        self.assertEqual(prune_weather_data(raw_days=30, hourly_days=0)['raw'], 3)
+        self.assertEqual(WeatherData.objects.count(), 1)
+
+
+@override_settings(WEATHER_ROLLUP_LAG_SECONDS=0)
+class UnversionedRowsTests(WeatherTestCase):
+    """Dòng có từ trước cột `updated_at` (NULL tới khi migration backfill xong)."""
+
+    def setUp(self):
+        super().setUp()
+        self.city = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.day = floor_day(timezone.now() - timedelta(days=40))
+        write_observations([observation(self.city, self.day + timedelta(hours=hour)) for hour in range(3)])
+        WeatherData.objects.update(updated_at=None)
+
+    def test_first_rollup_includes_rows_without_updated_at(self):
+        self.assertEqual(rollup_weather_data()['hourly'], 3)
+        self.assertEqual(prune_weather_data(raw_days=30, hourly_days=0)['raw'], 3)
+
+    def test_rows_without_updated_at_count_as_rolled_up_after_checkpoint(self):
+        write_observations([observation(self.city, timezone.now() - timedelta(hours=1))])
+        WeatherData.objects.filter(updated_at__isnull=False).update(updated_at=None)
+        rollup_weather_data()
+        WeatherDataHourly.objects.all().delete()
+
+        self.assertEqual(rollup_weather_data()['hourly'], 0)
+
+    def test_migration_backfills_in_primary_key_batches(self):
+        migration = import_module('weather_app.migrations.0011_weatherdata_updated_at')
+        with mock.patch.object(migration, 'BACKFILL_BATCH_SIZE', 2), \
+                self.assertNumQueries(3):
+            migration.backfill_updated_at(apps, SimpleNamespace(connection=connection))
+
+        self.assertFalse(WeatherData.objects.filter(updated_at__isnull=True).exists())
+        self.assertEqual(WeatherData.objects.filter(updated_at=F('created_at')).count(), 3)
@@ -0,0 +1,202 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+
+from weather_app.ingest import store_observations
+from weather_app.models import City, ForecastRun, LatestObservation, User, UserFavoriteLocation, WeatherForecast
+from weather_app.services import WeatherService
+from weather_app.upstream import get_circuit_breaker
+
+from .base import WeatherTestCase, observation, reset_weather_state
+from .stubs import CITIES, upstream
+
+
+def known_city(key: str) -> City:
+    data = CITIES[key]
+    return City.objects.create(
+        name=data['name'], country_code=data['country'], latitude=data['lat'], longitude=data['lon'],
+        openweather_id=data['id'],
+    )
+
+
+class OverviewTests(WeatherTestCase):
+    def test_cold_overview_fetches_both_parts_in_parallel(self):
+        upstream.delay = 0.1
+
+        response = self.client.get('/api/weather/overview', {'city': 'Hanoi'})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['current']['city'], 'Hanoi, VN')
+        self.assertTrue(data['forecasts'])
+        self.assertEqual((upstream.endpoint_calls('weather'), upstream.endpoint_calls('forecast')), (1, 1))
+        self.assertEqual(upstream.peak, 2)
+
+        self.assertEqual(self.client.get('/api/weather/overview', {'city': 'hà nội'}).json(), data)
+        self.assertEqual(len(upstream.calls), 2)
+
+    def test_only_the_missing_part_is_fetched(self):
+        current = WeatherService.get_current_weather('Paris')
+
+        overview = WeatherService.get_weather_overview('Paris')
+
+        self.assertEqual(overview['current'], current)
+        self.assertTrue(overview['forecasts'])
+        self.assertEqual((upstream.endpoint_calls('weather'), upstream.endpoint_calls('forecast')), (1, 1))
+
+    def test_unknown_city(self):
+        self.assertEqual(self.client.get('/api/weather/overview', {'city': 'Atlantis'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/weather/overview').status_code, 400)
+
+
+class BatchTests(WeatherTestCase):
+    def test_known_cities_share_one_group_call(self):
+        hanoi, paris = known_city('hanoi'), known_city('paris')
+
+        response = self.client.get('/api/weather/batch', {'id': [hanoi.pk, paris.pk, 999999]})
+
+        results = response.json()['results']
+        self.assertEqual(
+            [(result['city_id'], result.get('data', {}).get('city'), result.get('error')) for result in results],
+            [(hanoi.pk, 'Hanoi, VN', None), (paris.pk, 'Paris, FR', None), (999999, None, 'City not found')],
+        )
+        self.assertEqual((upstream.endpoint_calls('group'), upstream.endpoint_calls('weather')), (1, 0))
+        self.assertEqual(LatestObservation.objects.count(), 2)
+
+    def test_unknown_queries_are_fetched_in_parallel(self):
+        upstream.delay = 0.1
+
+        results = WeatherService.get_weather_batch(['Hanoi', 'Paris', 'paris', 'Atlantis'], [])
+
+        self.assertEqual([result.get('data', {}).get('city') for result in results], ['Hanoi, VN', 'Paris, FR', 'Paris, FR', None])
+        self.assertEqual(results[3]['error'], 'Weather not found')
+        self.assertEqual(upstream.endpoint_calls('weather'), 3)
+        self.assertEqual(upstream.peak, 3)
+
+    def test_fresh_latest_observation_is_used_without_upstream_call(self):
+        hanoi, paris = known_city('hanoi'), known_city('paris')
+        store_observations([observation(hanoi, timezone.now() - timedelta(minutes=1), temperature=19)])
+
+        results = WeatherService.get_weather_batch([], [hanoi.pk, paris.pk])
+
+        self.assertEqual(results[0]['data']['temperature_c'], 19)
+        self.assertEqual(results[1]['data']['city'], 'Paris, FR')
+        self.assertEqual(upstream.calls, [upstream.calls[0]])
+        self.assertIn(f"id={CITIES['paris']['id']}", upstream.calls[0])
+
+    def test_upstream_failure_falls_back_to_stored_observation(self):
+        hanoi = known_city('hanoi')
+        store_observations([observation(hanoi, timezone.now() - timedelta(hours=3), temperature=19)])
+        upstream.fail = True
+
+        with self.assertLogs('weather_app', 'ERROR'):
+            results = WeatherService.get_weather_batch([], [hanoi.pk])
+
+        self.assertEqual((results[0]['data']['temperature_c'], results[0]['data']['stale']), (19, True))
+
+    @override_settings(WEATHER_BATCH_MAX_CITIES=2)
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get('/api/weather/batch').status_code, 400)
+        self.assertEqual(self.client.get('/api/weather/batch', {'id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/weather/batch', {'city': ['a', 'b', 'c']}).status_code, 400)
+
+
+class LatestObservationTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hanoi = known_city('hanoi')
+
+    def test_fresh_latest_observation_is_served_without_upstream_call(self):
+        store_observations([observation(self.hanoi, timezone.now() - timedelta(minutes=2), temperature=19)])
+
+        data = WeatherService.get_current_weather_for(WeatherService.city_target(self.hanoi))
+
+        self.assertEqual(data['temperature_c'], 19)
+        self.assertEqual(upstream.calls, [])
+
+    def test_old_latest_observation_is_refreshed(self):
+        store_observations([observation(self.hanoi, timezone.now() - timedelta(hours=2), temperature=19)])
+
+        data = WeatherService.get_current_weather_for(WeatherService.city_target(self.hanoi))
+
+        self.assertEqual(data['temperature_c'], 30.5)
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+        self.assertEqual(float(LatestObservation.objects.get(city=self.hanoi).temperature_c), 30.5)
+
+    def test_favorites_are_read_in_one_query_without_upstream_calls(self):
+        paris = known_city('paris')
+        tokyo = City.objects.create(name='Tokyo', country_code='JP', latitude=35.6895, longitude=139.6917)
+        store_observations([
+            observation(self.hanoi, timezone.now() - timedelta(minutes=2), temperature=19),
+            observation(paris, timezone.now() - timedelta(hours=2), temperature=11),
+        ])
+        user = User.objects.create_user(username='alice', password='secret')
+        for city in (self.hanoi, paris, tokyo):
+            UserFavoriteLocation.objects.create(user=user, city=city)
+
+        with self.assertNumQueries(1):
+            favorites = WeatherService.get_favorites_weather(user)
+
+        by_city = {favorite['city']: favorite['weather'] for favorite in favorites}
+        self.assertEqual(by_city['Hanoi, VN']['temperature_c'], 19)
+        self.assertNotIn('stale', by_city['Hanoi, VN'])
+        self.assertEqual((by_city['Paris, FR']['temperature_c'], by_city['Paris, FR']['stale']), (11, True))
+        self.assertIsNone(by_city['Tokyo, JP'])
+        self.assertEqual(upstream.calls, [])
+
+    def test_favorites_endpoint_requires_login(self):
+        self.assertEqual(self.client.get('/api/weather/favorites').status_code, 401)
+        user = User.objects.create_user(username='alice', password='secret')
+        UserFavoriteLocation.objects.create(user=user, city=self.hanoi)
+        self.client.force_login(user)
+
+        response = self.client.get('/api/weather/favorites')
+
+        self.assertEqual(response.json()['favorites'][0]['city_id'], self.hanoi.pk)
+
+
+@override_settings(WEATHER_FORECAST_FRESHNESS_SECONDS=1800)
+class StoredForecastReadTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hanoi = known_city('hanoi')
+        self.target = WeatherService.city_target(self.hanoi)
+        self.forecasts = WeatherService.get_weather_forecast_for(self.target)
+        # Cache trong process trống, như ở một worker khác
+        reset_weather_state()
+        upstream.reset()
+
+    def test_fresh_forecast_run_is_read_from_the_database(self):
+        self.assertEqual(WeatherService.get_weather_forecast_for(self.target), self.forecasts)
+        self.assertEqual(upstream.calls, [])
+
+    def test_forecast_older_than_the_freshness_window_is_refetched(self):
+        fetched_at = timezone.now() - timedelta(hours=1)
+        ForecastRun.objects.filter(city=self.hanoi).update(fetched_at=fetched_at)
+        WeatherForecast.objects.filter(city=self.hanoi).update(fetched_at=fetched_at)
+
+        WeatherService.get_weather_forecast_for(self.target)
+
+        self.assertEqual(upstream.endpoint_calls('forecast'), 1)
+        self.assertGreater(ForecastRun.objects.get(city=self.hanoi).fetched_at, fetched_at)
+
+    def test_overview_of_a_known_city_is_served_from_the_database(self):
+        store_observations([observation(self.hanoi, timezone.now() - timedelta(minutes=2), temperature=19)])
+
+        overview = WeatherService.get_weather_overview_for(self.target)
+
+        self.assertEqual(overview['current']['temperature_c'], 19)
+        self.assertEqual(overview['forecasts'], self.forecasts)
+        self.assertEqual(upstream.calls, [])
+
+    @override_settings(WEATHER_FORECAST_FRESHNESS_SECONDS=0, WEATHER_BREAKER_FAILURE_THRESHOLD=1)
+    def test_open_breaker_serves_the_stored_forecast_as_stale(self):
+        with self.assertLogs('weather_app.upstream', 'WARNING'):
+            get_circuit_breaker().record_failure()
+
+        forecasts = WeatherService.get_weather_forecast_for(self.target)
+
+        self.assertEqual([item['forecast_time'] for item in forecasts], [item['forecast_time'] for item in self.forecasts])
+        self.assertTrue(all(item['stale'] for item in forecasts))
+        self.assertEqual(upstream.calls, [])
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from weather_app.async_services import AsyncWeatherService
+from weather_app.singleflight import AsyncSingleFlight, SingleFlight
+
+from .base import WeatherTestCase
+from .stubs import upstream
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return 'result'
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            leader = pool.submit(flight.do, 'current:hanoi', slow)
+            started.wait(1)
+            followers = [pool.submit(flight.do, 'current:hanoi', slow) for _ in range(7)]
+            results = [leader.result()] + [future.result() for future in followers]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 8)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_followers_receive_the_leader_error(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError('upstream down')
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, 'key', failing)
+            started.wait(1)
+            follower = pool.submit(flight.do, 'key', lambda: 'unused')
+            for future in (leader, follower):
+                with self.assertRaises(RuntimeError):
+                    future.result()
+
+    def test_different_keys_do_not_coalesce(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+        self.assertEqual(flight.do('b', lambda: 2), 2)
+
+    async def test_async_calls_share_one_execution(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        results = await asyncio.gather(*(flight.do('key', slow) for _ in range(10)))
+        self.assertEqual(results, ['result'] * 10)
+        self.assertEqual(len(calls), 1)
+
+
+class CoalescedLookupTests(WeatherTestCase):
+    async def test_concurrent_lookups_make_one_upstream_call(self):
+        upstream.delay = 0.05
+        results = await asyncio.gather(*(AsyncWeatherService.get_current_weather('Hanoi') for _ in range(10)))
+
+        self.assertEqual(upstream.endpoint_calls('weather'), 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(results[0]['city'], 'Hanoi, VN')
@@ -0,0 +1,75 @@
+from weather_app.models import City
+from weather_app.spatial import CitySpatialIndex, get_spatial_index, haversine_km
+
+from .base import WeatherTestCase
+
+
+class CitySpatialIndexTests(WeatherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hanoi = City.objects.create(name='Hanoi', country_code='VN', latitude=21.0245, longitude=105.8412)
+        self.haiphong = City.objects.create(name='Hai Phong', country_code='VN', latitude=20.8449, longitude=106.6881)
+        self.paris = City.objects.create(name='Paris', country_code='FR', latitude=48.8534, longitude=2.3488)
+        self.suva = City.objects.create(name='Suva', country_code='FJ', latitude=-18.1416, longitude=178.4419)
+        self.apia = City.objects.create(name='Apia', country_code='WS', latitude=-13.8333, longitude=-171.7667)
+
+    def test_nearest_is_sorted_by_distance(self):
+        results = get_spatial_index().nearest(21.0, 105.8, limit=2)
+
+        self.assertEqual([hit['city_id'] for hit in results], [self.hanoi.pk, self.haiphong.pk])
+        self.assertAlmostEqual(results[0]['distance_km'], haversine_km(21.0, 105.8, 21.0245, 105.8412), places=3)
+
+    def test_nearest_respects_max_km(self):
+        results = get_spatial_index().nearest(21.0, 105.8, limit=5, max_km=200)
+
+        self.assertEqual([hit['city_id'] for hit in results], [self.hanoi.pk, self.haiphong.pk])
+
+    def test_nearest_city_returns_cached_model(self):
+        index = get_spatial_index()
+        self.assertEqual(index.nearest_city(21.03, 105.85, max_km=5), self.hanoi)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(index.nearest_city(21.02, 105.84, max_km=5), self.hanoi)
+        self.assertIsNone(index.nearest_city(0, 0, max_km=50))
+
+    def test_deleted_city_leaves_the_index(self):
+        self.hanoi.delete()
+
+        results = get_spatial_index().nearest(21.0, 105.8, limit=1)
+
+        self.assertEqual(results[0]['city_id'], self.haiphong.pk)
+
+    def test_bbox(self):
+        results = get_spatial_index().within_bbox(20, 105, 22, 107)
+
+        self.assertEqual({hit['city_id'] for hit in results}, {self.hanoi.pk, self.haiphong.pk})
+        self.assertEqual(len(get_spatial_index().within_bbox(-90, -180, 90, 180)), 5)
+
+    def test_bbox_across_antimeridian(self):
+        results = get_spatial_index().within_bbox(-20, 170, -10, -170)
+
+        self.assertEqual({hit['city_id'] for hit in results}, {self.suva.pk, self.apia.pk})
+
+    def test_bbox_endpoint(self):
+        response = self.client.get('/api/weather/bbox', {'min_lat': 20, 'min_lon': 105, 'max_lat': 22, 'max_lon': 107})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(self.client.get('/api/weather/bbox', {'min_lat': 22, 'min_lon': 105, 'max_lat': 20, 'max_lon': 107}).status_code, 400)
+
+
+class AntimeridianTests(WeatherTestCase):
+    def test_neighbour_across_antimeridian_is_found(self):
+        index = CitySpatialIndex(cell_deg=0.5)
+        index.ensure_fresh()
+        # Đủ nhiều ô có dữ liệu để việc tìm kiếm đi theo từng vòng ô thay vì quét hết các điểm
+        for i in range(10):
+            index.add(i + 1, 10 + i, 100 + i, f'City {i}')
+        index.add(100, 0.0, -179.9, 'East')
+
+        results = index.nearest(0.0, 179.9, limit=1, max_km=50)
+
+        self.assertEqual([hit['city_id'] for hit in results], [100])
+        self.assertLess(results[0]['distance_km'], 25)
+        self.assertEqual([hit['city_id'] for hit in index.within_bbox(-1, 179, 1, 180)], [])
+        self.assertEqual([hit['city_id'] for hit in index.within_bbox(-1, 179, 1, -179)], [100])
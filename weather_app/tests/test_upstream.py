@@ -0,0 +1,36 @@
+from weather_app.services import WeatherService
+from weather_app.upstream import get_async_client, get_client
+
+from .base import WeatherTestCase
+from .stubs import StubAdapter, upstream
+
+
+class OpenWeatherClientTests(WeatherTestCase):
+    def test_client_and_session_are_reused(self):
+        client = get_client()
+        session = client.session
+        client.get('weather', {'q': 'Hanoi'})
+        client.get('weather', {'q': 'Paris'})
+
+        self.assertIs(get_client(), client)
+        self.assertIs(get_client().session, session)
+        self.assertIsInstance(session.get_adapter(client._url('weather')), StubAdapter)
+        self.assertEqual(upstream.endpoint_calls('weather'), 2)
+
+    def test_requests_carry_api_key_and_units(self):
+        response = get_client().get('weather', {'q': 'Hanoi'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('appid=', upstream.calls[0])
+        self.assertIn('units=metric', upstream.calls[0])
+
+    def test_request_json_returns_none_for_unknown_city(self):
+        self.assertIsNone(WeatherService._request_json('weather', {'q': 'Atlantis'}))
+        self.assertEqual(len(upstream.calls), 1)
+
+    async def test_async_client_uses_configured_transport(self):
+        response = await get_async_client().get('forecast', {'q': 'Paris'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['list']), 40)
+        self.assertEqual(upstream.endpoint_calls('forecast'), 1)
@@ -0,0 +1,438 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from .quota import get_quota_manager
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class UpstreamUnavailable(Exception):
+    """OpenWeather đang bị ngắt mạch: lời gọi bị từ chối ngay thay vì chờ timeout."""
+
+
+class QuotaExhausted(UpstreamUnavailable):
+    """Đã dùng hết hạn mức gọi OpenWeather (xem `quota.QuotaManager`)."""
+
+
+class QuotaRetry(Retry):
+    """`Retry` của urllib3 tính mỗi lần gửi lại vào hạn mức như một lời gọi mới.
+
+    Hết hạn mức thì dừng như khi đã hết lượt retry: lỗi kết nối được ném ra, response 5xx được trả về.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if not get_quota_manager().acquire():
+            raise MaxRetryError(_pool, url, error or ResponseError("OpenWeather quota exhausted, not retrying"))
+        return retry
+
+
+class CircuitBreaker:
+    """Bộ ngắt mạch cho OpenWeather, dùng chung giữa client sync và async của một process.
+
+    - closed: gọi bình thường; mở mạch khi có `failure_threshold` lỗi liên tiếp (lỗi mạng, 5xx, 429)
+      hoặc khi phân vị `latency_percentile` của `window` lời gọi gần nhất vượt `latency_threshold` giây.
+    - open: từ chối mọi lời gọi (`UpstreamUnavailable`) trong `cooldown` giây.
+    - half_open: cho đúng một lời gọi thăm dò; thành công thì đóng mạch, lỗi thì mở lại.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown: float = 30,
+        latency_threshold: float = 5.0,
+        latency_percentile: float = 0.95,
+        window: int = 50,
+        min_samples: int = 20,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency_threshold = latency_threshold
+        self.latency_percentile = latency_percentile
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.open_reason: Optional[str] = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_started: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Có được phép gọi upstream lúc này không (chuyển open -> half_open khi hết cooldown)."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and now - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._probe_started = now
+                return True
+            # Lời gọi thăm dò bị treo quá lâu: cho một lời gọi khác thử lại
+            if self.state == self.HALF_OPEN and now - self._probe_started >= self.cooldown:
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, status_code: int, latency: float):
+        if status_code in RETRY_STATUS_CODES or status_code == 429:
+            self.record_failure(f"HTTP {status_code}")
+        else:
+            self.record_success(latency)
+
+    def record_success(self, latency: float):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._close()
+            self.consecutive_failures = 0
+            self._latencies.append(latency)
+            slow = self._slow_percentile()
+            if slow is not None:
+                self._open(f"p{round(self.latency_percentile * 100)} latency {slow:.2f}s")
+
+    def record_failure(self, reason: str = 'error'):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._open(reason)
+
+    def _slow_percentile(self) -> Optional[float]:
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.latency_percentile))]
+        return value if value > self.latency_threshold else None
+
+    def _open(self, reason: str):
+        if self.state != self.OPEN:
+            logger.warning("OpenWeather circuit opened: %s", reason)
+            self.times_opened += 1
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.open_reason = reason
+        self._latencies.clear()
+
+    def _close(self):
+        logger.info("OpenWeather circuit closed")
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.open_reason = None
+        self._latencies.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            ordered = sorted(self._latencies)
+            percentile = ordered[min(len(ordered) - 1, int(len(ordered) * self.latency_percentile))] if ordered else None
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'open_reason': self.open_reason,
+                'open_for_seconds': round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'latency_samples': len(ordered),
+                'latency_percentile_seconds': round(percentile, 3) if percentile is not None else None,
+            }
+
+
+class BaseOpenWeatherClient:
+    """Cấu hình chung (URL, key, pool, timeout, retry) cho client sync và async."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        transport=None,
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_factor: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.breaker = breaker or get_circuit_breaker()
+        self.base_url = (base_url or settings.WEATHER_API_URL).rstrip('/')
+        self.api_key = api_key or settings.WEATHER_API_KEY
+        self.transport = transport
+        self.pool_connections = pool_connections or getattr(settings, 'WEATHER_HTTP_POOL_CONNECTIONS', 4)
+        self.pool_maxsize = pool_maxsize or getattr(settings, 'WEATHER_HTTP_POOL_MAXSIZE', 20)
+        self.connect_timeout = connect_timeout or getattr(settings, 'WEATHER_HTTP_CONNECT_TIMEOUT', 3.05)
+        self.read_timeout = read_timeout or getattr(settings, 'WEATHER_HTTP_READ_TIMEOUT', 7.0)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'WEATHER_HTTP_MAX_RETRIES', 2)
+        self.backoff_factor = (
+            backoff_factor if backoff_factor is not None else getattr(settings, 'WEATHER_HTTP_BACKOFF_FACTOR', 0.3)
+        )
+
+    def _url(self, endpoint: str) -> str:
+        return f"{self.base_url}/{endpoint}"
+
+    def _query(self, params: dict) -> dict:
+        return {'appid': self.api_key, 'units': 'metric', **params}
+
+    def _check_breaker(self, endpoint: str):
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(f"OpenWeather circuit is open, skipping {endpoint}")
+
+    def _check_quota(self, endpoint: str):
+        if not get_quota_manager().acquire():
+            raise QuotaExhausted(f"OpenWeather quota exhausted, skipping {endpoint}")
+
+    async def _acheck_quota(self, endpoint: str):
+        if not await get_quota_manager().aacquire():
+            raise QuotaExhausted(f"OpenWeather quota exhausted, skipping {endpoint}")
+
+
+class OpenWeatherClient(BaseOpenWeatherClient):
+    """Client HTTP dùng chung cho các lời gọi OpenWeather.
+
+    Mỗi worker (process) giữ một `requests.Session` riêng với connection pool keep-alive,
+    nên các request liên tiếp tái sử dụng kết nối TCP/TLS thay vì bắt tay lại từ đầu.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session: Optional[requests.Session] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def _build_retry(self) -> Retry:
+        """Retry có giới hạn + backoff cho lỗi kết nối và 5xx (chỉ áp dụng với GET), mỗi lần retry lấy thêm hạn mức."""
+        return QuotaRetry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset({'GET'}),
+            raise_on_status=False,
+        )
+
+    def _build_adapter(self) -> BaseAdapter:
+        if self.transport is not None:
+            return self.transport
+        return HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=self._build_retry(),
+        )
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = self._build_adapter()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """Session của worker hiện tại; tạo lại sau fork để không chia sẻ socket giữa các process."""
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def get(self, endpoint: str, params: dict) -> requests.Response:
+        """Gọi `GET {base_url}/{endpoint}` với appid/units mặc định (qua bộ ngắt mạch)."""
+        self._check_breaker(endpoint)
+        self._check_quota(endpoint)
+        started = time.monotonic()
+        try:
+            response = self.session.get(self._url(endpoint), params=self._query(params), timeout=self.timeout)
+        except Exception as exc:
+            self.breaker.record_failure(type(exc).__name__)
+            raise
+        self.breaker.record(response.status_code, time.monotonic() - started)
+        return response
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+
+class AsyncOpenWeatherClient(BaseOpenWeatherClient):
+    """Client OpenWeather không chặn (httpx.AsyncClient) dùng cho view async dưới ASGI.
+
+    Mỗi event loop có một `httpx.AsyncClient` riêng với pool đủ lớn để một worker giữ
+    hàng trăm request upstream đang chờ cùng lúc.
+    """
+
+    def __init__(self, *args, max_connections: Optional[int] = None, max_keepalive: Optional[int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_connections = max_connections or getattr(settings, 'WEATHER_HTTP_ASYNC_MAX_CONNECTIONS', 200)
+        self.max_keepalive = max_keepalive or getattr(settings, 'WEATHER_HTTP_ASYNC_MAX_KEEPALIVE', 50)
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive)
+        transport = self.transport or httpx.AsyncHTTPTransport(limits=limits)
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            transport=transport,
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._build_client()
+            self._clients[loop] = client
+        return client
+
+    async def get(self, endpoint: str, params: dict) -> httpx.Response:
+        """Như `OpenWeatherClient.get`, retry có backoff cho lỗi kết nối/timeout và 5xx."""
+        self._check_breaker(endpoint)
+        await self._acheck_quota(endpoint)
+        started = time.monotonic()
+        try:
+            response = await self._get_with_retry(endpoint, params)
+        except Exception as exc:
+            self.breaker.record_failure(type(exc).__name__)
+            raise
+        self.breaker.record(response.status_code, time.monotonic() - started)
+        return response
+
+    async def _get_with_retry(self, endpoint: str, params: dict) -> httpx.Response:
+        client = self.client
+        url = self._url(endpoint)
+        query = self._query(params)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.get(url, params=query)
+            except httpx.TransportError:
+                # Hết lượt, hoặc hết hạn mức cho lần gửi lại (mỗi lần retry tính như một lời gọi)
+                if attempt >= self.max_retries or not await get_quota_manager().aacquire():
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                if not await get_quota_manager().aacquire():
+                    return response
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def aclose(self):
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_breaker: Optional[CircuitBreaker] = None
+_client: Optional[OpenWeatherClient] = None
+_async_client: Optional[AsyncOpenWeatherClient] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_client_lock = threading.RLock()
+
+
+def _load_transport(setting: str = 'WEATHER_HTTP_TRANSPORT'):
+    """Transport tùy chỉnh qua setting (dotted path tới adapter/transport), ví dụ để trỏ vào stub local."""
+    path = getattr(settings, setting, None)
+    if not path:
+        return None
+    return import_string(path)()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Bộ ngắt mạch dùng chung của process (chung cho client sync và async)."""
+    global _breaker
+    if _breaker is None:
+        with _client_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=getattr(settings, 'WEATHER_BREAKER_FAILURE_THRESHOLD', 5),
+                    cooldown=getattr(settings, 'WEATHER_BREAKER_COOLDOWN', 30),
+                    latency_threshold=getattr(settings, 'WEATHER_BREAKER_LATENCY_THRESHOLD', 5.0),
+                    latency_percentile=getattr(settings, 'WEATHER_BREAKER_LATENCY_PERCENTILE', 0.95),
+                    window=getattr(settings, 'WEATHER_BREAKER_WINDOW', 50),
+                    min_samples=getattr(settings, 'WEATHER_BREAKER_MIN_SAMPLES', 20),
+                )
+    return _breaker
+
+
+def get_client() -> OpenWeatherClient:
+    """Trả về client dùng chung của process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenWeatherClient(transport=_load_transport())
+    return _client
+
+
+def get_async_client() -> AsyncOpenWeatherClient:
+    """Trả về client async dùng chung của process."""
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncOpenWeatherClient(transport=_load_transport('WEATHER_HTTP_ASYNC_TRANSPORT'))
+    return _async_client
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Thread pool dùng chung để chạy song song các lời gọi upstream (chỉ HTTP, không chạm ORM)."""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _client_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'WEATHER_FETCH_WORKERS', 16),
+                    thread_name_prefix='weather-upstream',
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def reset_client():
+    global _breaker, _client, _async_client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _breaker = None
+        _client = None
+        _async_client = None
+
+
+@receiver(setting_changed)
+def _reset_client_on_setting_change(sender, setting, **kwargs):
+    if setting.startswith('WEATHER_'):
+        reset_client()
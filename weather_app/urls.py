@@ -1,8 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# WEATHER_ASYNC_VIEWS: dùng view async (ASGI) thay cho view sync
+weather_views = async_views if settings.WEATHER_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('api/weather/current', views.current_weather, name='current_weather'),
-    path('api/weather/forecast', views.weather_forecast, name='weather_forecast'),
-    path('api/search/history', views.search_history, name='search_history'),
+    path('api/weather/current', weather_views.current_weather, name='current_weather'),
+    path('api/weather/forecast', weather_views.weather_forecast, name='weather_forecast'),
+    path('api/weather/hourly', weather_views.weather_hourly, name='weather_hourly'),
+    path('api/weather/overview', weather_views.weather_overview, name='weather_overview'),
+    path('api/weather/batch', views.weather_batch, name='weather_batch'),
+    path('api/weather/nearest', views.weather_nearest, name='weather_nearest'),
+    path('api/weather/bbox', views.weather_bbox, name='weather_bbox'),
+    path('api/weather/history', views.weather_history, name='weather_history'),
+    path('api/weather/export', views.weather_export, name='weather_export'),
+    path('api/weather/ingest', views.weather_ingest, name='weather_ingest'),
+    path('api/weather/favorites', views.favorite_weather, name='favorite_weather'),
+    path('api/search/history', weather_views.search_history, name='search_history'),
+    path('api/weather/stats', views.weather_stats, name='weather_stats'),
 ]
\ No newline at end of file
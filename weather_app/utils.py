@@ -0,0 +1,15 @@
+import re
+import unicodedata
+
+# Giữ lại chữ/số và dấu phẩy (vd. "hanoi,vn"); bỏ khoảng trắng và ký tự khác
+_IGNORED_RE = re.compile(r'[^\w,]+')
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa chuỗi tìm kiếm thành phố: bỏ dấu tiếng Việt, không phân biệt hoa thường và khoảng trắng.
+
+    "Ha Noi", "hà nội", "Hanoi" và "Hanoi," đều thành "hanoi".
+    """
+    text = (query or '').replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+    return _IGNORED_RE.sub('', text.casefold()).strip(',')
@@ -1,35 +1,286 @@
-from django.shortcuts import render
-from django.http import JsonResponse
+from datetime import datetime, time as dt_time, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_GET
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+from .cache import get_weather_cache
+from .cities import get_city_cache
+from .export import CONTENT_TYPES, CSV, ExportUnavailable, aiter_chunks, stream_export
+from .history import get_history_buffer
+from .push import ingest_observations
+from .refresher import last_refresh_cycle
 from .services import WeatherService
+from .ingest import forecast_ingest_stats, get_observation_index
+from .models import City
+from .quota import get_quota_manager
+from .upstream import UpstreamUnavailable, get_circuit_breaker
 
 # Create your views here.
 
+def _unavailable():
+    return JsonResponse({'error': 'Weather service temporarily unavailable'}, status=503)
+
 @require_GET
 def current_weather(request):
+    try:
+        coords = _parse_coordinates(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+    if coords is not None:
+        target = WeatherService.coord_target(*coords)
+        try:
+            data = WeatherService.get_current_weather_for(target)
+        except UpstreamUnavailable:
+            return _unavailable()
+        if data is None:
+            return JsonResponse({'error': 'Weather not found'}, status=404)
+        if request.user.is_authenticated:
+            WeatherService.save_search_history(request.user, query='%s,%s' % coords, matched_city=target.city)
+        return JsonResponse(data)
+
     city = request.GET.get('city', '').strip()
     if not city:
         return JsonResponse({'error': 'Missing city'}, status=400)
 
-    data = WeatherService.get_current_weather(city)
-    if request.user.is_authenticated:
-        WeatherService.save_search_history(request.user, query=city, matched_city=None)
-
+    try:
+        data = WeatherService.get_current_weather(city)
+    except UpstreamUnavailable:
+        return _unavailable()
     if data is None:
         return JsonResponse({'error': 'Weather not found'}, status=404)
+    if request.user.is_authenticated:
+        WeatherService.save_search_history(request.user, query=city, matched_city=WeatherService.resolve_city(city))
     return JsonResponse(data)
 
 @require_GET
 def weather_forecast(request):
+    try:
+        coords = _parse_coordinates(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+    if coords is not None:
+        target = WeatherService.coord_target(*coords)
+        try:
+            items = WeatherService.get_weather_forecast_for(target)
+        except UpstreamUnavailable:
+            return _unavailable()
+        if items and request.user.is_authenticated:
+            WeatherService.save_search_history(request.user, query='%s,%s' % coords, matched_city=target.city)
+        return JsonResponse({'forecasts': items})
+
     city = request.GET.get('city', '').strip()
     if not city:
         return JsonResponse({'error': 'Missing city'}, status=400)
 
-    items = WeatherService.get_weather_forecast(city)
+    try:
+        items = WeatherService.get_weather_forecast(city)
+    except UpstreamUnavailable:
+        return _unavailable()
+    if items and request.user.is_authenticated:
+        WeatherService.save_search_history(request.user, query=city, matched_city=WeatherService.resolve_city(city))
+    return JsonResponse({'forecasts': items})
+
+@require_GET
+def weather_hourly(request):
+    try:
+        coords = _parse_coordinates(request)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+    city = request.GET.get('city', '').strip()
+    if coords is None and not city:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+
+    target = WeatherService.coord_target(*coords) if coords is not None else WeatherService.resolve_target(city)
+    try:
+        steps = WeatherService.get_hourly_forecast_for(target)
+    except UpstreamUnavailable:
+        return _unavailable()
+    return JsonResponse({'steps': steps})
+
+@require_GET
+def weather_overview(request):
+    city = request.GET.get('city', '').strip()
+    if not city:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+
+    data = WeatherService.get_weather_overview(city)
+    if data['current'] is None and not data['forecasts']:
+        return JsonResponse({'error': 'Weather not found'}, status=404)
     if request.user.is_authenticated:
-        WeatherService.save_search_history(request.user, query=city, matched_city=None)
+        WeatherService.save_search_history(request.user, query=city, matched_city=WeatherService.resolve_city(city))
+    return JsonResponse(data)
 
-    return JsonResponse({'forecasts': items})
+@require_GET
+def weather_batch(request):
+    queries = [q.strip() for q in request.GET.getlist('city') if q.strip()]
+    try:
+        city_ids = [int(v) for v in request.GET.getlist('id')]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid city id'}, status=400)
+    if not queries and not city_ids:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+    if len(queries) + len(city_ids) > settings.WEATHER_BATCH_MAX_CITIES:
+        return JsonResponse({'error': 'Too many cities'}, status=400)
+
+    results = WeatherService.get_weather_batch(queries, city_ids)
+    return JsonResponse({'results': results})
+
+def _parse_coordinate(request, name: str, bound: float):
+    value = float(request.GET[name])
+    if not -bound <= value <= bound:
+        raise ValueError(name)
+    return value
+
+def _parse_coordinates(request):
+    """(lat, lon) nếu request truyền tọa độ, `None` nếu tra cứu theo tên thành phố."""
+    if 'lat' not in request.GET and 'lon' not in request.GET:
+        return None
+    return _parse_coordinate(request, 'lat', 90), _parse_coordinate(request, 'lon', 180)
+
+def _parse_limit(request, default: int, maximum: Optional[int] = None):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum or settings.WEATHER_SPATIAL_MAX_RESULTS))
+
+def _parse_datetime(request, name: str, default: Optional[datetime]) -> Optional[datetime]:
+    """Tham số thời gian ISO 8601; không có múi giờ thì hiểu theo TIME_ZONE."""
+    raw = request.GET.get(name)
+    if not raw:
+        return default
+    value = parse_datetime(raw)
+    if value is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValueError(name)
+        value = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+@require_GET
+def weather_nearest(request):
+    try:
+        lat = _parse_coordinate(request, 'lat', 90)
+        lon = _parse_coordinate(request, 'lon', 180)
+        max_km = float(request.GET['max_km']) if request.GET.get('max_km') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid coordinates'}, status=400)
+
+    results = WeatherService.get_nearby_weather(lat, lon, limit=_parse_limit(request, 5), max_km=max_km)
+    return JsonResponse({'results': results})
+
+@require_GET
+def weather_bbox(request):
+    try:
+        min_lat = _parse_coordinate(request, 'min_lat', 90)
+        min_lon = _parse_coordinate(request, 'min_lon', 180)
+        max_lat = _parse_coordinate(request, 'max_lat', 90)
+        max_lon = _parse_coordinate(request, 'max_lon', 180)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid bounding box'}, status=400)
+    if min_lat > max_lat:
+        return JsonResponse({'error': 'Invalid bounding box'}, status=400)
+
+    results = WeatherService.get_weather_in_bbox(
+        min_lat, min_lon, max_lat, max_lon, limit=_parse_limit(request, settings.WEATHER_SPATIAL_MAX_RESULTS)
+    )
+    return JsonResponse({'results': results})
+
+@require_GET
+def weather_history(request):
+    city_id = request.GET.get('city_id', '').strip()
+    city = request.GET.get('city', '').strip()
+    if city_id:
+        city_obj = City.objects.filter(pk=city_id).first() if city_id.isdigit() else None
+    elif city:
+        city_obj = WeatherService.resolve_city(city)
+    else:
+        return JsonResponse({'error': 'Missing city'}, status=400)
+    if city_obj is None:
+        return JsonResponse({'error': 'City not found'}, status=404)
+
+    try:
+        end = _parse_datetime(request, 'end', timezone.now())
+        start = _parse_datetime(request, 'start', end - timedelta(days=7))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid time range'}, status=400)
+    if start >= end:
+        return JsonResponse({'error': 'Invalid time range'}, status=400)
+
+    try:
+        payload = WeatherService.get_weather_history(
+            city_obj,
+            start,
+            end,
+            bucket=request.GET.get('bucket', 'raw'),
+            limit=_parse_limit(request, 100, settings.WEATHER_OBSERVATION_HISTORY_MAX_PAGE),
+            cursor=request.GET.get('cursor') or None,
+        )
+    except ValueError as exc:
+        return JsonResponse({'error': f'Invalid {exc}'}, status=400)
+    return JsonResponse(payload)
+
+@require_GET
+def weather_export(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    dataset = request.GET.get('dataset', 'observations')
+    fmt = request.GET.get('format', CSV)
+    city_id = request.GET.get('city_id', '').strip()
+    try:
+        start = _parse_datetime(request, 'start', None)
+        end = _parse_datetime(request, 'end', None)
+        chunks = stream_export(
+            dataset,
+            fmt,
+            city_id=int(city_id) if city_id else None,
+            start=start,
+            end=end,
+            chunk_size=settings.WEATHER_EXPORT_CHUNK_SIZE,
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid export parameters'}, status=400)
+    except ExportUnavailable as exc:
+        return JsonResponse({'error': str(exc)}, status=501)
+
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+class CanIngestObservations(BasePermission):
+    """Tài khoản của trạm đo (hoặc nhân viên) được cấp quyền `weather_app.add_weatherdata`."""
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.has_perm('weather_app.add_weatherdata'))
+
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication, SessionAuthentication])
+@permission_classes([CanIngestObservations])
+def weather_ingest(request):
+    """Nhận một lô quan trắc từ trạm đo: `{"observations": [...]}` hoặc một mảng JSON."""
+    rows = request.data.get('observations') if isinstance(request.data, dict) else request.data
+    if not isinstance(rows, list) or not rows:
+        return Response({'error': 'Expected a non-empty list of observations'}, status=400)
+    if len(rows) > settings.WEATHER_INGEST_MAX_ROWS:
+        return Response({'error': f'At most {settings.WEATHER_INGEST_MAX_ROWS} observations per request'}, status=413)
+
+    return Response(ingest_observations(rows))
 
 @require_GET
 def search_history(request):
@@ -53,3 +304,27 @@ def search_history(request):
         })
     return JsonResponse({'history': payload})
 
+@require_GET
+def favorite_weather(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    return JsonResponse({'favorites': WeatherService.get_favorites_weather(request.user)})
+
+@require_GET
+def weather_stats(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    return JsonResponse({
+        'cache': get_weather_cache().stats(),
+        'upstream': get_circuit_breaker().stats(),
+        'quota': get_quota_manager().stats(),
+        'observations': get_observation_index().stats(),
+        'forecast_rows': forecast_ingest_stats(),
+        'search_history': get_history_buffer().stats(),
+        'cities': get_city_cache().stats(),
+        'refresher': last_refresh_cycle(),
+    })
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django_extensions',
     'rest_framework',
+    'rest_framework.authtoken',
     'weather_app',
 ]
 
@@ -139,7 +140,116 @@ AUTH_USER_MODEL = 'weather_app.User'
 
 # Weather API settings
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', '47762a0be9d52d54056a853df18b773b')
-WEATHER_API_URL = 'http://api.openweathermap.org/data/2.5'
+WEATHER_API_URL = config('WEATHER_API_URL', default='http://api.openweathermap.org/data/2.5')
+
+# Upstream HTTP client: connection pool per worker, timeouts (seconds), bounded retries
+WEATHER_HTTP_POOL_CONNECTIONS = config('WEATHER_HTTP_POOL_CONNECTIONS', default=4, cast=int)
+WEATHER_HTTP_POOL_MAXSIZE = config('WEATHER_HTTP_POOL_MAXSIZE', default=20, cast=int)
+WEATHER_HTTP_CONNECT_TIMEOUT = config('WEATHER_HTTP_CONNECT_TIMEOUT', default=3.05, cast=float)
+WEATHER_HTTP_READ_TIMEOUT = config('WEATHER_HTTP_READ_TIMEOUT', default=7.0, cast=float)
+WEATHER_HTTP_MAX_RETRIES = config('WEATHER_HTTP_MAX_RETRIES', default=2, cast=int)
+WEATHER_HTTP_BACKOFF_FACTOR = config('WEATHER_HTTP_BACKOFF_FACTOR', default=0.3, cast=float)
+# Dotted path to a requests transport adapter (e.g. a local stub); empty = real HTTP
+WEATHER_HTTP_TRANSPORT = config('WEATHER_HTTP_TRANSPORT', default='')
+# Threads per worker used to run independent upstream calls in parallel
+WEATHER_FETCH_WORKERS = config('WEATHER_FETCH_WORKERS', default=16, cast=int)
+# Multi-city batch endpoint: max cities per request, max concurrent upstream calls per request
+WEATHER_BATCH_MAX_CITIES = config('WEATHER_BATCH_MAX_CITIES', default=50, cast=int)
+WEATHER_BATCH_CONCURRENCY = config('WEATHER_BATCH_CONCURRENCY', default=8, cast=int)
+
+# Async views + non-blocking upstream client (run under ASGI, e.g. `uvicorn weather_project_v2.asgi:application`)
+WEATHER_ASYNC_VIEWS = config('WEATHER_ASYNC_VIEWS', default=False, cast=bool)
+WEATHER_HTTP_ASYNC_MAX_CONNECTIONS = config('WEATHER_HTTP_ASYNC_MAX_CONNECTIONS', default=200, cast=int)
+WEATHER_HTTP_ASYNC_MAX_KEEPALIVE = config('WEATHER_HTTP_ASYNC_MAX_KEEPALIVE', default=50, cast=int)
+# Dotted path to an httpx.AsyncBaseTransport (e.g. a local stub); empty = real HTTP
+WEATHER_HTTP_ASYNC_TRANSPORT = config('WEATHER_HTTP_ASYNC_TRANSPORT', default='')
+
+# Weather payload cache: in-process LRU + optional shared tier (alias in CACHES, e.g. a Redis cache)
+WEATHER_CACHE_MAXSIZE = config('WEATHER_CACHE_MAXSIZE', default=1024, cast=int)
+WEATHER_CACHE_ALIAS = config('WEATHER_CACHE_ALIAS', default='')
+WEATHER_CACHE_MIN_TTL = config('WEATHER_CACHE_MIN_TTL', default=60, cast=int)
+WEATHER_CACHE_CURRENT_REFRESH = config('WEATHER_CACHE_CURRENT_REFRESH', default=600, cast=int)
+WEATHER_CACHE_FORECAST_MAX_TTL = config('WEATHER_CACHE_FORECAST_MAX_TTL', default=3 * 3600, cast=int)
+
+# Query -> City alias index (in-memory LRU per worker, backed by the CityAlias table)
+WEATHER_ALIAS_INDEX_MAXSIZE = config('WEATHER_ALIAS_INDEX_MAXSIZE', default=10000, cast=int)
+WEATHER_ALIAS_INDEX_TTL = config('WEATHER_ALIAS_INDEX_TTL', default=3600, cast=int)
+
+# Nearest-city / bounding-box lookups (in-memory grid index over City per worker)
+WEATHER_SPATIAL_CELL_DEG = config('WEATHER_SPATIAL_CELL_DEG', default=0.5, cast=float)
+WEATHER_SPATIAL_REFRESH_SECONDS = config('WEATHER_SPATIAL_REFRESH_SECONDS', default=60, cast=int)
+WEATHER_SPATIAL_MAX_RESULTS = config('WEATHER_SPATIAL_MAX_RESULTS', default=200, cast=int)
+
+# Lat/lon lookups: coordinates are snapped to this grid and mapped to a City within WEATHER_COORD_MATCH_KM
+WEATHER_COORD_GRID_DEG = config('WEATHER_COORD_GRID_DEG', default=0.05, cast=float)
+WEATHER_COORD_MATCH_KM = config('WEATHER_COORD_MATCH_KM', default=5.0, cast=float)
+
+# Negative cache for city queries OpenWeather answers with 404
+WEATHER_NEGATIVE_CACHE_TTL = config('WEATHER_NEGATIVE_CACHE_TTL', default=300, cast=int)
+
+# Circuit breaker around OpenWeather (opens on consecutive failures or slow p-latency, probes after cooldown)
+WEATHER_BREAKER_FAILURE_THRESHOLD = config('WEATHER_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+WEATHER_BREAKER_COOLDOWN = config('WEATHER_BREAKER_COOLDOWN', default=30, cast=float)
+WEATHER_BREAKER_LATENCY_THRESHOLD = config('WEATHER_BREAKER_LATENCY_THRESHOLD', default=5.0, cast=float)
+WEATHER_BREAKER_LATENCY_PERCENTILE = config('WEATHER_BREAKER_LATENCY_PERCENTILE', default=0.95, cast=float)
+WEATHER_BREAKER_WINDOW = config('WEATHER_BREAKER_WINDOW', default=50, cast=int)
+WEATHER_BREAKER_MIN_SAMPLES = config('WEATHER_BREAKER_MIN_SAMPLES', default=20, cast=int)
+
+# OpenWeather call quota shared by all workers (counted in WEATHER_CACHE_ALIAS when set)
+WEATHER_QUOTA_CALLS_PER_MINUTE = config('WEATHER_QUOTA_CALLS_PER_MINUTE', default=60, cast=int)
+WEATHER_QUOTA_BURST = config('WEATHER_QUOTA_BURST', default=10, cast=int)
+WEATHER_QUOTA_INTERACTIVE_RESERVE = config('WEATHER_QUOTA_INTERACTIVE_RESERVE', default=0.2, cast=float)
+WEATHER_QUOTA_WAIT_TIMEOUT = config('WEATHER_QUOTA_WAIT_TIMEOUT', default=2.0, cast=float)
+WEATHER_QUOTA_BACKGROUND_WAIT_TIMEOUT = config('WEATHER_QUOTA_BACKGROUND_WAIT_TIMEOUT', default=0, cast=float)
+
+# Per-worker index of the last stored observation per city (skips rewriting unchanged WeatherData)
+WEATHER_OBSERVATION_INDEX_MAXSIZE = config('WEATHER_OBSERVATION_INDEX_MAXSIZE', default=10000, cast=int)
+
+# In-process City identity cache (unique tuple / OpenWeather id -> City)
+WEATHER_CITY_CACHE_MAXSIZE = config('WEATHER_CITY_CACHE_MAXSIZE', default=10000, cast=int)
+WEATHER_CITY_CACHE_TTL = config('WEATHER_CITY_CACHE_TTL', default=3600, cast=int)
+
+# Search history write-behind buffer: flushed in batches by a background thread, capped per user
+WEATHER_HISTORY_FLUSH_SIZE = config('WEATHER_HISTORY_FLUSH_SIZE', default=100, cast=int)
+WEATHER_HISTORY_FLUSH_INTERVAL = config('WEATHER_HISTORY_FLUSH_INTERVAL', default=5, cast=float)
+WEATHER_HISTORY_COALESCE_SECONDS = config('WEATHER_HISTORY_COALESCE_SECONDS', default=300, cast=int)
+WEATHER_HISTORY_MAX_PER_USER = config('WEATHER_HISTORY_MAX_PER_USER', default=200, cast=int)
+WEATHER_HISTORY_MAX_PENDING = config('WEATHER_HISTORY_MAX_PENDING', default=10000, cast=int)
+
+# WeatherData retention: hourly/daily rollups, then raw rows older than RAW_DAYS are pruned in small batches (0 = keep)
+WEATHER_ROLLUP_LAG_SECONDS = config('WEATHER_ROLLUP_LAG_SECONDS', default=300, cast=int)
+WEATHER_RETENTION_RAW_DAYS = config('WEATHER_RETENTION_RAW_DAYS', default=30, cast=int)
+WEATHER_RETENTION_HOURLY_DAYS = config('WEATHER_RETENTION_HOURLY_DAYS', default=365, cast=int)
+WEATHER_RETENTION_BATCH_SIZE = config('WEATHER_RETENTION_BATCH_SIZE', default=1000, cast=int)
+WEATHER_RETENTION_BATCH_SLEEP = config('WEATHER_RETENTION_BATCH_SLEEP', default=0.1, cast=float)
+WEATHER_OBSERVATION_HISTORY_MAX_PAGE = config('WEATHER_OBSERVATION_HISTORY_MAX_PAGE', default=500, cast=int)
+
+# Streaming exports (/api/weather/export, export_weather_data): rows fetched per query / per Parquet row group
+WEATHER_EXPORT_CHUNK_SIZE = config('WEATHER_EXPORT_CHUNK_SIZE', default=5000, cast=int)
+
+# Bulk observation import (import_weather_data): rows per INSERT batch, default worker processes
+WEATHER_IMPORT_BATCH_SIZE = config('WEATHER_IMPORT_BATCH_SIZE', default=2000, cast=int)
+WEATHER_IMPORT_WORKERS = config('WEATHER_IMPORT_WORKERS', default=1, cast=int)
+
+# Push ingestion from our own stations (/api/weather/ingest, DRF token auth + weather_app.add_weatherdata)
+WEATHER_INGEST_MAX_ROWS = config('WEATHER_INGEST_MAX_ROWS', default=5000, cast=int)
+
+# Stored forecasts (ForecastRun) younger than this are served from the DB instead of calling OpenWeather
+WEATHER_FORECAST_FRESHNESS_SECONDS = config('WEATHER_FORECAST_FRESHNESS_SECONDS', default=1800, cast=int)
+
+# Background refresher (refresh_weather): top-N cities by favorites and recent searches, refreshed ahead of expiry
+WEATHER_REFRESH_TOP_N = config('WEATHER_REFRESH_TOP_N', default=200, cast=int)
+WEATHER_REFRESH_INTERVAL = config('WEATHER_REFRESH_INTERVAL', default=300, cast=int)
+WEATHER_REFRESH_LEAD_SECONDS = config('WEATHER_REFRESH_LEAD_SECONDS', default=300, cast=int)
+WEATHER_REFRESH_QUOTA_SHARE = config('WEATHER_REFRESH_QUOTA_SHARE', default=0.5, cast=float)
+WEATHER_REFRESH_QUOTA_WAIT = config('WEATHER_REFRESH_QUOTA_WAIT', default=30, cast=float)
+WEATHER_REFRESH_SEARCH_WINDOW_HOURS = config('WEATHER_REFRESH_SEARCH_WINDOW_HOURS', default=24, cast=int)
+WEATHER_REFRESH_FAVORITE_WEIGHT = config('WEATHER_REFRESH_FAVORITE_WEIGHT', default=5, cast=float)
+WEATHER_REFRESH_KEEP_DAYS = config('WEATHER_REFRESH_KEEP_DAYS', default=7, cast=int)
+
+# Single-flight coalescing of identical upstream lookups (cross-worker lock lives in WEATHER_CACHE_ALIAS)
+WEATHER_SINGLEFLIGHT_LOCK_TIMEOUT = config('WEATHER_SINGLEFLIGHT_LOCK_TIMEOUT', default=15, cast=int)
+WEATHER_SINGLEFLIGHT_WAIT_TIMEOUT = config('WEATHER_SINGLEFLIGHT_WAIT_TIMEOUT', default=10, cast=int)
 
 
 # Email settings for development (console backend)